@@ -0,0 +1,6 @@
+"""
+    An offline end-to-end benchmark of the bot, run using: python -m benchmark
+
+    The producer, consumer and sign-in engines are run for real against a fake Google Calendar
+    service (fake_calendar) and a local mock of the register attendance page (attendance_page)
+"""
@@ -0,0 +1,232 @@
+import argparse
+import contextlib
+import datetime
+import math
+import operator
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tabulate import tabulate
+from utils.config import CONFIG
+from utils.metrics import METRICS
+from benchmark.attendance_page import HAPPENED_30_MIN_AGO, HAPPENING_NOW, AttendancePage, Lecture
+from benchmark.fake_calendar import FakeCalendarService, make_event
+
+"""
+    Runs the producer, consumer and sign-in engine against a fake calendar and a mock attendance page,
+    then reports how long each sign-in took, how many calendar API calls were made and peak memory usage.
+
+    Usage: python -m benchmark [--engine http|selenium] [--calendars N] [--events N] ...
+"""
+
+PASSWORD = 'password'
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='Offline end-to-end benchmark of signing into lectures')
+    parser.add_argument('--engine', choices=['http', 'selenium'], default='http', help='the sign-in engine to benchmark (default: http)')
+    parser.add_argument('--browser', choices=['firefox', 'chromium'], default='firefox', help='the browser driven by the selenium engine (default: firefox)')
+    parser.add_argument('--profile', choices=['default', 'lean'], default='default', help='the profile the browser is started with (default: default)')
+    parser.add_argument('--calendars', type=int, default=3, help='the number of calendars (each with its own account) to watch (default: 3)')
+    parser.add_argument('--events', type=int, default=5, help='the number of lectures in each calendar (default: 5)')
+    parser.add_argument('--length', type=int, default=8, help='the seconds each lecture lasts (default: 8)')
+    parser.add_argument('--gap', type=int, default=2, help='the seconds between lectures (default: 2)')
+    parser.add_argument('--lead', type=int, default=5, help='the seconds before the first lecture starts (default: 5)')
+    parser.add_argument('--stagger', type=int, default=1, help='the seconds between the lectures of each calendar starting (default: 1)')
+    parser.add_argument('--button-delay', type=float, default=0, help='the seconds after a lecture starts that its button appears (default: 0)')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='the seconds each calendar API request takes (default: 0.05)')
+    parser.add_argument('--push', action='store_true', help='watch the calendars for changes with a local webhook receiver')
+    parser.add_argument('--headful', action='store_true', help='show the selenium browsers')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the bot')
+    return parser.parse_args(argv)
+
+def make_timetable(args: argparse.Namespace, t0: float) -> tuple:
+    """
+        Makes the lectures of every calendar. Lectures alternate between being shown in the happening now
+        and happened 30 mins ago blocks, and between showing one and two buttons
+
+        Args:
+            args: the benchmark's arguments
+            t0: the (epoch) time the benchmark started, in whole seconds like the API's times
+
+        Returns:
+            The calendars (for FakeCalendarService), the calendar infos and the lectures
+    """
+    calendars = {}
+    info = []
+    lectures = []
+    for c in range(args.calendars):
+        calendarId = f'calendar{c}@benchmark'
+        username = f'student{c}@benchmark'
+        events = []
+        for i in range(args.events):
+            start = t0 + args.lead + c * args.stagger + i * (args.length + args.gap)
+            title = f'BM{c}{i:03d} Lecture'
+            lectures.append(Lecture(username, title, start, start + args.length, HAPPENING_NOW if i % 2 == 0 else HAPPENED_30_MIN_AGO, bool(i // 2 % 2), args.button_delay))
+            events.append(make_event(f'{c}-{i}', title, datetime.datetime.fromtimestamp(start, datetime.timezone.utc), datetime.datetime.fromtimestamp(start + args.length, datetime.timezone.utc)))
+        calendars[calendarId] = (f'Benchmark {c}', events)
+        info.append({'calendarSummary': f'Benchmark {c}', 'calendarId': calendarId, 'search_params': ['bm'], 'username': username, 'password': PASSWORD})
+    return calendars, info, lectures
+
+def configure(args: argparse.Namespace, page: AttendancePage, cache_path: str):
+    """
+        Points the bot at the mock attendance page. Has to be called before the bot's modules are imported
+        as they read the config when they are imported
+
+        Args:
+            args: the benchmark's arguments
+            page: the mock attendance page
+            cache_path: the directory used as the cache so that the real cache is left alone
+    """
+    CONFIG.REGISTER_ATTENDANCE_URL = page.url
+    CONFIG.HTTP_STATE_URL = 'api/state'
+    CONFIG.HTTP_REGISTER_URL = 'api/register'
+    CONFIG.SIGN_IN_ENGINE = args.engine
+    CONFIG.HEADLESS = not args.headful
+    CONFIG.BROWSER = args.browser
+    CONFIG.BROWSER_PROFILE = args.profile
+    CONFIG.CACHE_PATH = cache_path
+    # Sign in as soon as lectures start so that latency is measured from the start
+    CONFIG.SCHEDULE_START_PERCENT = 0
+    CONFIG.SCHEDULE_END_PERCENT = 0
+    CONFIG.MIN_CLICK_TIMEOUT = 1
+    CONFIG.LOOP_TIMEOUT = 1
+
+def run(args: argparse.Namespace, page: AttendancePage, service: FakeCalendarService, info: list, deadline: float):
+    """
+        Runs the bot (the same way as main.py) until every lecture has been signed into or the deadline passes
+
+        Args:
+            args: the benchmark's arguments
+            page: the mock attendance page
+            service: the fake calendar service
+            info: the calendar infos
+            deadline: the (epoch) time of the bot's clock to stop at
+    """
+    from google_calendar import CalendarAPI
+    from registration import BrowserPool
+    from utils.clock import get_clock
+    from utils.log import setup_logging
+    from utils.pipeline import Pipeline
+    from utils.scheduler import Scheduler
+    from utils.webhook import WebhookReceiver
+    from workers import button_consumer, calendar_event_producer
+
+    # Set up here so that the bot's output goes wherever stdout currently goes
+    log_listener = setup_logging()
+    calendar_api = CalendarAPI(service)
+    pipeline = Pipeline(info, priority_key=operator.attrgetter('start') if CONFIG.PRIORITY_PIPELINE else None)
+    sign_in_executor = ThreadPoolExecutor(max_workers=CONFIG.MAX_CONCURRENT_SIGN_INS)
+    scheduler = Scheduler(sign_in_executor)
+    pool = BrowserPool(headless=CONFIG.HEADLESS)
+    event = threading.Event()
+    # The fake calendar service POSTs its notifications straight to the local receiver
+    receiver = WebhookReceiver() if args.push else None
+    if receiver is not None:
+        receiver.serve(0)
+
+    try:
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [
+                executor.submit(calendar_event_producer, info, calendar_api, pipeline, event, receiver),
+                executor.submit(button_consumer, info, pipeline, scheduler, event, pool),
+                executor.submit(scheduler.run, event),
+            ]
+            page.wait_until_registered(max(deadline - get_clock().time(), 0))
+            event.set()
+            pipeline.close()
+            scheduler.stop()
+            for future in futures:
+                future.result()
+    finally:
+        sign_in_executor.shutdown()
+        pool.close()
+        if receiver is not None:
+            receiver.close()
+        log_listener.stop()
+        if calendar_api.event_store is not None:
+            calendar_api.event_store.close()
+
+def percentile(values: list, percent: float) -> float:
+    """Gets a percentile (nearest rank) of a list of values"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+def peak_rss() -> tuple:
+    """
+        Gets the peak resident set size of this process and of its (waited for) children, such as browsers
+
+        Returns:
+            The peak RSS of this process and its children in MiB, or None if it can't be measured on this OS
+    """
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return tuple(resource.getrusage(who).ru_maxrss / scale for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN))
+
+def report(args: argparse.Namespace, page: AttendancePage, service: FakeCalendarService, lectures: list, wall: float, cpu: float):
+    """Prints the results of the benchmark"""
+    latencies = [lecture.registered - lecture.start for lecture in lectures if lecture.registered is not None]
+    missed = len(lectures) - len(latencies)
+    self_rss, children_rss = peak_rss()
+
+    rows = [
+        ('Engine', args.engine if args.engine == 'http' else f'{args.engine} ({args.browser}, {args.profile} profile)'),
+        ('Lectures', len(lectures)),
+        ('Signed in', f'{len(latencies)} ({missed} missed)'),
+    ]
+    if len(latencies):
+        rows += [(f'Sign-in latency p{p} (s)', f'{percentile(latencies, p):.3f}') for p in (50, 90, 99)]
+        rows.append(('Sign-in latency max (s)', f'{max(latencies):.3f}'))
+    rows += [
+        ('Calendar API calls', ', '.join(f'{method}: {count}' for method, count in sorted(service.calls.items()))),
+        ('Calendar API calls per lecture', f'{service.total_calls / len(lectures):.2f}'),
+        ('Logins (form submitted)', page.logins),
+        ('Attendance page loads', page.page_loads),
+        ('Wall time (s)', f'{wall:.1f}'),
+        ('CPU time (s)', f'{cpu:.2f}'),
+        ('Peak RSS (MiB)', 'n/a' if self_rss is None else f'{self_rss:.1f}'),
+        ('Peak RSS of children (MiB)', 'n/a' if children_rss is None else f'{children_rss:.1f}'),
+    ]
+    print(tabulate(rows, headers=['Metric', 'Value']))
+
+    # Where the seconds went, summed over every calendar
+    stages = {}
+    for name, labels, count, total, longest in METRICS.timers():
+        key = (name, labels.get('stage', ''))
+        previous = stages.get(key, (0, 0.0, 0.0))
+        stages[key] = (previous[0] + count, previous[1] + total, max(previous[2], longest))
+    if len(stages):
+        print()
+        print(tabulate([(name, stage, count, f'{total / count:.3f}', f'{longest:.3f}') for (name, stage), (count, total, longest) in sorted(stages.items())],
+                       headers=['Timer', 'Stage', 'Count', 'Mean (s)', 'Max (s)']))
+
+def main(argv: list = None):
+    args = parse_args(argv)
+    t0 = math.ceil(time.time())
+    calendars, info, lectures = make_timetable(args, t0)
+    service = FakeCalendarService(calendars, args.api_latency)
+    page = AttendancePage({calendar['username']: PASSWORD for calendar in info}, lectures)
+    page.start()
+
+    with tempfile.TemporaryDirectory() as cache_path:
+        configure(args, page, cache_path)
+        print(f'Benchmarking {len(lectures)} lectures over {len(info)} calendars with the {args.engine} engine, this will take about {int(max(lecture.end for lecture in lectures) - t0)} seconds...')
+        cpu = time.process_time()
+        output = sys.stdout if args.verbose else open(os.devnull, 'w')
+        try:
+            with contextlib.redirect_stdout(output):
+                run(args, page, service, info, max(lecture.end for lecture in lectures) + 1)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            page.close()
+        report(args, page, service, lectures, time.time() - t0, time.process_time() - cpu)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import html
+import json
+import secrets
+import threading
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from utils.clock import get_clock
+from utils.config import CONFIG
+
+"""
+    A local mock of the campus connect login and the register attendance page
+"""
+
+HAPPENING_NOW = 'pbid-blockFoundHappeningNow'
+HAPPENED_30_MIN_AGO = 'pbid-blockHappened30MinAgo'
+
+LOGIN_PAGE = """<!DOCTYPE html>
+<html><body>
+<form id="loginForm" method="post" action="/login">
+    <input id="userNameInput" name="UserName" type="email" value="">
+    <input id="passwordInput" name="Password" type="password" value="">
+    <input name="AuthMethod" type="hidden" value="FormsAuthentication">
+    <span id="submitButton" onclick="document.getElementById('loginForm').submit()">Sign in</span>
+</form>
+</body></html>"""
+
+ATTENDANCE_PAGE = """<!DOCTYPE html>
+<html><head><style>.ng-hide {{ display: none; }}</style></head><body>
+{prompt}
+<div class="pb-block mainBlock">
+    <div id="pbid-blockFoundHappeningNow" class="pb-block{now_hidden}">
+        <span id="pbid-literalHappeningNowTitle">{title}</span>
+        <div id="pbid-blockFoundHappeningNowButtonsOne" class="{one_hidden}">{button_one}</div>
+        <div id="pbid-blockFoundHappeningNowButtonsTwo" class="{two_hidden}">{button_two}</div>
+    </div>
+    <div id="pbid-blockHappened30MinAgo" class="pb-block{ago_hidden}">
+        <div id="pbid-blockHappened30MinAgoButtonsOne" class="{one_hidden}">{button_30_one}</div>
+        <div id="pbid-blockHappened30MinAgoButtonsTwo" class="{two_hidden}">{button_30_two}</div>
+    </div>
+    <div id="pbid-blockNothingHappeningNow" class="pb-block{nothing_hidden}">Nothing happening now</div>
+</div>
+</body></html>"""
+
+BUTTON = '<form method="post" action="/register"><input type="hidden" name="title" value="{title}"><button id="{id}" type="submit">Register</button></form>'
+COOKIES_PROMPT = '<div id="cookiesPrompt"><button id="noThanksBtn" onclick="document.getElementById(\'cookiesPrompt\').remove()">No thanks</button></div>'
+
+class Lecture:
+    """
+        A lecture shown on the attendance page whilst it is happening
+
+        Attributes:
+            username: the account the lecture is shown to
+            title: the course title, the first word of which is the course ID
+            start: the (epoch) time the lecture starts
+            end: the (epoch) time the lecture ends
+            block: the block that the button is shown in, HAPPENING_NOW or HAPPENED_30_MIN_AGO
+            two_buttons: whether two buttons (online/in person) are shown instead of one
+            delay: the seconds after the start that the button appears
+            registered: the (epoch) time attendance was first registered, None if it wasn't
+            engine: the engine which registered attendance
+    """
+
+    def __init__(self, username: str, title: str, start: float, end: float, block: str = HAPPENING_NOW, two_buttons: bool = False, delay: float = 0):
+        self.username = username
+        self.title = title
+        self.start = start
+        self.end = end
+        self.block = block
+        self.two_buttons = two_buttons
+        self.delay = delay
+        self.registered = None
+        self.engine = None
+
+    def is_open(self, now: float) -> bool:
+        return self.start + self.delay <= now < self.end
+
+class AttendancePage:
+    """
+        Serves the mock pages on a local port, recording every login and registered attendance.
+
+        Accounts have their own timetable of lectures and the page shows the open lecture of the
+        logged in account (if any) in the block of that lecture. Attendance can be registered by
+        clicking the button (selenium) or using the JSON endpoints (the http engine)
+
+        Attributes:
+            accounts: the passwords of every account
+            lectures: the lectures of every account
+            logins: the number of times the login form was submitted
+            page_loads: the number of times the attendance page was loaded
+            url: the URL of the attendance page
+    """
+
+    def __init__(self, accounts: dict, lectures: list, host: str = '127.0.0.1', port: int = 0):
+        self.accounts = accounts
+        self.lectures = {username: [] for username in accounts}
+        for lecture in lectures:
+            self.lectures[lecture.username].append(lecture)
+        self.logins = 0
+        self.page_loads = 0
+        self._sessions = {}
+        self._registered = threading.Condition()
+
+        page = self
+
+        class Handler(MockPageHandler):
+            attendance_page = page
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.url = f'http://{host}:{self._server.server_address[1]}/attendance'
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def start(self):
+        """Starts serving the pages on a background thread"""
+        self._thread.start()
+
+    def close(self):
+        """Stops serving the pages"""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def login(self, username: str, password: str) -> str:
+        """
+            Checks a login and starts a session
+
+            Returns:
+                The session token, or None if the login was incorrect
+        """
+        with self._registered:
+            self.logins += 1
+            if self.accounts.get(username) != password:
+                return None
+            token = secrets.token_hex(16)
+            self._sessions[token] = username
+            return token
+
+    def session_user(self, token: str) -> str:
+        return self._sessions.get(token)
+
+    def open_lecture(self, username: str) -> Lecture:
+        """Gets the lecture which is currently shown to the account, if any"""
+        now = get_clock().time()
+        return next((lecture for lecture in self.lectures[username] if lecture.is_open(now)), None)
+
+    def register(self, username: str, title: str, engine: str) -> bool:
+        """
+            Registers attendance for the open lecture with the given title
+
+            Returns:
+                True if there was an open lecture with the title, otherwise False
+        """
+        lecture = self.open_lecture(username)
+        if lecture is None or lecture.title != title:
+            return False
+        with self._registered:
+            if lecture.registered is None:
+                lecture.registered = get_clock().time()
+                lecture.engine = engine
+            self._registered.notify_all()
+        return True
+
+    def wait_until_registered(self, timeout: float) -> bool:
+        """
+            Blocks until attendance has been registered for every lecture
+
+            Args:
+                timeout: the maximum seconds (of the bot's clock) to wait
+
+            Returns:
+                True if every lecture was registered, otherwise False
+        """
+        clock = get_clock()
+        deadline = clock.monotonic() + timeout
+        with self._registered:
+            while not all(lecture.registered is not None for lectures in self.lectures.values() for lecture in lectures):
+                remaining = deadline - clock.monotonic()
+                if remaining <= 0:
+                    return False
+                clock.wait(self._registered, remaining)
+            return True
+
+    def render(self, username: str, prompt: bool) -> str:
+        """Renders the attendance page as it is currently shown to the account"""
+        with self._registered:
+            self.page_loads += 1
+        lecture = self.open_lecture(username)
+        now = lecture is not None and lecture.block == HAPPENING_NOW
+        ago = lecture is not None and lecture.block == HAPPENED_30_MIN_AGO
+        two = lecture is not None and lecture.two_buttons
+        title = html.escape(lecture.title) if lecture is not None else ''
+
+        def button(button_id: str) -> str:
+            return BUTTON.format(title=title, id=button_id)
+
+        return ATTENDANCE_PAGE.format(
+            prompt=COOKIES_PROMPT if prompt else '',
+            title=title,
+            now_hidden='' if now else ' ng-hide',
+            ago_hidden='' if ago else ' ng-hide',
+            nothing_hidden=' ng-hide' if now or ago else '',
+            one_hidden='ng-hide' if two else '',
+            two_hidden='' if two else 'ng-hide',
+            button_one=button(CONFIG.BUTTON_ONE_ID),
+            button_two=button(CONFIG.BUTTON_TWO_ID),
+            button_30_one=button(CONFIG.BUTTON_30_ONE_ID),
+            button_30_two=button(CONFIG.BUTTON_30_TWO_ID),
+        )
+
+    def records(self, username: str) -> list:
+        """Gets the records shown to the account, as returned by the state endpoint of the http engine"""
+        lecture = self.open_lecture(username)
+        return [] if lecture is None else [{'title': lecture.title, 'block': lecture.block}]
+
+class MockPageHandler(BaseHTTPRequestHandler):
+    """Handles the requests made to an AttendancePage"""
+
+    attendance_page: AttendancePage = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/favicon.ico':
+            self._respond(204)
+        elif path == '/attendance':
+            username = self._username()
+            if username is None:
+                self._respond(200, LOGIN_PAGE)
+            else:
+                # The cookies prompt is shown straight after logging in
+                prompt = 'prompt=1' in urlparse(self.path).query
+                self._respond(200, self.attendance_page.render(username, prompt))
+        elif path == '/api/state':
+            username = self._username()
+            if username is None:
+                self._respond(401)
+            else:
+                self._respond(200, json.dumps(self.attendance_page.records(username)), 'application/json')
+        else:
+            self._respond(404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+        if path == '/login':
+            form = {key: values[0] for key, values in parse_qs(body).items()}
+            token = self.attendance_page.login(form.get('UserName', ''), form.get('Password', ''))
+            if token is None:
+                self._respond(200, LOGIN_PAGE)
+            else:
+                self._respond(303, headers={'Location': '/attendance?prompt=1', 'Set-Cookie': f'session={token}; Path=/'})
+            return
+
+        username = self._username()
+        if username is None:
+            self._respond(401)
+        elif path == '/register':
+            # The button clicked in the browser
+            title = parse_qs(body).get('title', [''])[0]
+            self.attendance_page.register(username, title, 'selenium')
+            self._respond(303, headers={'Location': '/attendance'})
+        elif path == '/api/register':
+            registered = self.attendance_page.register(username, json.loads(body or '{}').get('title'), 'http')
+            self._respond(200 if registered else 409, json.dumps({'registered': registered}), 'application/json')
+        else:
+            self._respond(404)
+
+    def _username(self) -> str:
+        cookies = SimpleCookie(self.headers.get('Cookie', ''))
+        return self.attendance_page.session_user(cookies['session'].value) if 'session' in cookies else None
+
+    def _respond(self, status: int, body: str = '', content_type: str = 'text/html', headers: dict = None):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
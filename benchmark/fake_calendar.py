@@ -0,0 +1,229 @@
+import datetime
+import threading
+import time
+import urllib.request
+from collections import Counter
+
+"""
+    A fake of the parts of the Google Calendar API service used by CalendarAPI, which counts every
+    request made to it
+"""
+
+class FakeRequest:
+    """
+        A request which is only handled (and counted) once it is executed, like the API's HttpRequest
+
+        Attributes:
+            method: the name of the API method, such as events.list
+            kwargs: the arguments the method was called with
+    """
+
+    def __init__(self, service: 'FakeCalendarService', method: str, handler, kwargs: dict):
+        self.service = service
+        self.method = method
+        self.handler = handler
+        self.kwargs = kwargs
+
+    def execute(self, **kwargs) -> dict:
+        with self.service.lock:
+            self.service.calls[self.method] += 1
+        if self.service.latency:
+            # Round trip time to Google
+            time.sleep(self.service.latency)
+        return self.handler(self.kwargs)
+
+class FakeBatch:
+    """A batch of requests which are handled in one round trip (and counted once), like the API's BatchHttpRequest"""
+
+    def __init__(self, service: 'FakeCalendarService'):
+        self.service = service
+        self.requests = []
+
+    def add(self, request: FakeRequest, callback=None, request_id: str = None):
+        self.requests.append((request, callback, request_id if request_id is not None else str(len(self.requests))))
+
+    def execute(self, **kwargs):
+        with self.service.lock:
+            self.service.calls['batch'] += 1
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        for request, callback, request_id in self.requests:
+            try:
+                response, exception = request.handler(request.kwargs), None
+            except Exception as e:
+                response, exception = None, e
+            if callback is not None:
+                callback(request_id, response, exception)
+
+class FakeResource:
+    """A collection of API methods, such as events()"""
+
+    def __init__(self, service: 'FakeCalendarService', name: str, **handlers):
+        self.service = service
+        self.name = name
+        self.handlers = handlers
+
+    def __getattr__(self, method: str):
+        if method not in self.handlers:
+            raise AttributeError(method)
+        return lambda **kwargs: FakeRequest(self.service, f'{self.name}.{method}', self.handlers[method], kwargs)
+
+class FakeCalendarService:
+    """
+        Serves calendarList().list() and events().list() from events held in memory. timeMin, timeMax,
+        q, maxResults, pageToken and syncToken are supported, as are batches of requests.
+
+        Events can be changed with change_event, which (like Google) POSTs a notification to the address
+        of every channel opened with events().watch() for the calendar
+
+        Attributes:
+            calendars: the calendars as a dict of calendarId: (summary, events)
+            latency: the seconds every request takes
+            calls: the number of requests made to each method
+            lock: held whilst the calls are counted and whilst events are changed
+            changes: every change made to the events as (calendarId, event), sync tokens are indexes into it
+                (prefixed with the generation they were given out in)
+            watches: the open watch channels by their IDs
+            generation: sync tokens given out before the current generation have expired, and are answered with
+                410 GONE like Google does
+    """
+
+    def __init__(self, calendars: dict, latency: float = 0):
+        self.calendars = calendars
+        self.latency = latency
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.changes = []
+        self.watches = {}
+        self.generation = 0
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def calendarList(self) -> FakeResource:
+        return FakeResource(self, 'calendarList', list=self._list_calendars)
+
+    def events(self) -> FakeResource:
+        return FakeResource(self, 'events', list=self._list_events, watch=self._watch)
+
+    def channels(self) -> FakeResource:
+        return FakeResource(self, 'channels', stop=self._stop)
+
+    def new_batch_http_request(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def _list_calendars(self, kwargs: dict) -> dict:
+        return {'items': [{'id': calendarId, 'summary': summary} for calendarId, (summary, _) in self.calendars.items()]}
+
+    def change_event(self, calendarId: str, event: dict):
+        """
+            Adds, edits or (if its status is cancelled) removes an event, then notifies the calendar's watch channels
+
+            Args:
+                calendarId: the ID of the calendar of the event
+                event: the event, which replaces any event with the same ID
+        """
+        with self.lock:
+            summary, events = self.calendars[calendarId]
+            events = [other for other in events if other['id'] != event['id']]
+            if event.get('status') != 'cancelled':
+                events = sorted(events + [event], key=lambda other: _parse(other['start']['dateTime']))
+            self.calendars[calendarId] = (summary, events)
+            self.changes.append((calendarId, event))
+            channels = [channel for channel in self.watches.values() if channel['calendarId'] == calendarId]
+        for channel in channels:
+            self._notify(channel, 'exists')
+
+    def expire_sync_tokens(self):
+        """Expires every sync token given out so far, so that the next sync with one of them needs a full sync"""
+        with self.lock:
+            self.generation += 1
+
+    def _notify(self, channel: dict, state: str):
+        """POSTs a notification to a watch channel's address, like Google does"""
+        channel['messages'] += 1
+        request = urllib.request.Request(channel['address'], data=b'', method='POST', headers={
+            'X-Goog-Channel-ID': channel['id'],
+            'X-Goog-Channel-Token': channel['token'],
+            'X-Goog-Message-Number': str(channel['messages']),
+            'X-Goog-Resource-ID': channel['resourceId'],
+            'X-Goog-Resource-State': state,
+        })
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except OSError:
+            # Google gives up on notifications that aren't received as well
+            pass
+
+    def _watch(self, kwargs: dict) -> dict:
+        body = kwargs['body']
+        channel = dict(id=body['id'], token=body.get('token', ''), address=body['address'], calendarId=kwargs['calendarId'],
+                       resourceId=f'resource-{kwargs["calendarId"]}', messages=0,
+                       expiration=str(int((time.time() + int(body.get('params', {}).get('ttl', 604800))) * 1000)))
+        with self.lock:
+            self.watches[channel['id']] = channel
+        self._notify(channel, 'sync')
+        return {'kind': 'api#channel', 'id': channel['id'], 'resourceId': channel['resourceId'], 'expiration': channel['expiration']}
+
+    def _stop(self, kwargs: dict) -> dict:
+        with self.lock:
+            self.watches.pop(kwargs['body']['id'], None)
+        return {}
+
+    def _list_events(self, kwargs: dict) -> dict:
+        with self.lock:
+            events = self.calendars[kwargs['calendarId']][1]
+            sync_token = f'{self.generation}:{len(self.changes)}'
+            if 'syncToken' in kwargs:
+                generation, index = map(int, kwargs['syncToken'].split(':'))
+                if generation < self.generation:
+                    # Imported here so that the fake can be used without the API client installed
+                    import httplib2
+                    from googleapiclient.errors import HttpError
+                    raise HttpError(httplib2.Response({'status': 410}), b'Sync token is no longer valid, a full sync is required.')
+                events = [event for calendarId, event in self.changes[index:] if calendarId == kwargs['calendarId']]
+        if 'timeMin' in kwargs:
+            time_min = _parse(kwargs['timeMin'])
+            events = [event for event in events if _parse(event['end']['dateTime']) > time_min]
+        if 'timeMax' in kwargs:
+            time_max = _parse(kwargs['timeMax'])
+            events = [event for event in events if _parse(event['start']['dateTime']) < time_max]
+        if kwargs.get('q'):
+            query = kwargs['q'].lower()
+            events = [event for event in events if query in event['summary'].lower() or query in event.get('description', '').lower()]
+
+        offset = int(kwargs.get('pageToken', 0))
+        page_size = kwargs.get('maxResults', 250)
+        result = {'items': events[offset:offset + page_size]}
+        if offset + page_size < len(events):
+            result['nextPageToken'] = str(offset + page_size)
+        elif 'orderBy' not in kwargs:
+            result['nextSyncToken'] = sync_token
+        return result
+
+def _parse(time: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(time.replace('Z', '+00:00'))
+
+def make_event(event_id: str, summary: str, start: datetime.datetime, end: datetime.datetime, description: str = '') -> dict:
+    """
+        Makes an event in the same format as the API
+
+        Args:
+            event_id: the ID of the event
+            summary: the title of the event
+            start: the (aware) start of the event
+            end: the (aware) end of the event
+            description: the description of the event
+
+        Returns:
+            The event
+    """
+    return {
+        'id': event_id,
+        'status': 'confirmed',
+        'summary': summary,
+        'description': description,
+        'start': {'dateTime': start.isoformat(), 'timeZone': 'UTC'},
+        'end': {'dateTime': end.isoformat(), 'timeZone': 'UTC'},
+    }
@@ -0,0 +1,150 @@
+import argparse
+import contextlib
+import datetime
+import math
+import os
+import sys
+import tempfile
+import time
+from tabulate import tabulate
+from utils.clock import VirtualClock, set_clock
+from utils.config import CONFIG
+from utils.metrics import METRICS
+from benchmark.__main__ import peak_rss, percentile, run
+from benchmark.attendance_page import HAPPENED_30_MIN_AGO, HAPPENING_NOW, AttendancePage, Lecture
+from benchmark.fake_calendar import FakeCalendarService, make_event
+
+"""
+    Replays a timetable of many days through the real producer, consumer, scheduler and http engine in
+    accelerated time, using a virtual clock, then reports how late the scheduler ran sign-ins and how
+    many lectures were handled per (real) second.
+
+    Usage: python -m benchmark.simulate [--days N] [--calendars N] [--lectures N] [--speed N] ...
+"""
+
+PASSWORD = 'password'
+DAY = 24 * 60 * 60  # seconds
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m benchmark.simulate', description='Simulates a timetable of lectures in accelerated time')
+    parser.add_argument('--days', type=int, default=7, help='the number of days in the timetable (default: 7)')
+    parser.add_argument('--calendars', type=int, default=10, help='the number of calendars (each with its own account) to watch (default: 10)')
+    parser.add_argument('--lectures', type=int, default=4, help='the number of lectures a day in each calendar (default: 4)')
+    parser.add_argument('--length', type=int, default=3600, help='the seconds each lecture lasts (default: 3600)')
+    parser.add_argument('--gap', type=int, default=900, help='the seconds between lectures (default: 900)')
+    parser.add_argument('--lead', type=int, default=600, help='the seconds before the first lecture starts (default: 600)')
+    parser.add_argument('--stagger', type=int, default=60, help='the seconds between the lectures of each calendar starting (default: 60)')
+    parser.add_argument('--speed', type=float, default=10000, help='how many times faster than real time the simulation runs (default: 10000)')
+    parser.add_argument('--api-latency', type=float, default=0, help='the real seconds each calendar API request takes (default: 0)')
+    parser.add_argument('--push', action='store_true', help='watch the calendars for changes with a local webhook receiver')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the bot')
+    return parser.parse_args(argv)
+
+def make_timetable(args: argparse.Namespace, t0: float) -> tuple:
+    """
+        Makes the lectures of every calendar, the same lectures are held every day
+
+        Args:
+            args: the simulation's arguments
+            t0: the (epoch) time the simulation starts at, in whole seconds like the API's times
+
+        Returns:
+            The calendars (for FakeCalendarService), the calendar infos and the lectures
+    """
+    calendars = {}
+    info = []
+    lectures = []
+    for c in range(args.calendars):
+        calendarId = f'calendar{c}@simulation'
+        username = f'student{c}@simulation'
+        events = []
+        for day in range(args.days):
+            for i in range(args.lectures):
+                start = t0 + args.lead + day * DAY + c * args.stagger + i * (args.length + args.gap)
+                title = f'SIM{c}{day * args.lectures + i:04d} Lecture'
+                lectures.append(Lecture(username, title, start, start + args.length, HAPPENING_NOW if i % 2 == 0 else HAPPENED_30_MIN_AGO, bool(i // 2 % 2)))
+                events.append(make_event(f'{c}-{day}-{i}', title, datetime.datetime.fromtimestamp(start, datetime.timezone.utc), datetime.datetime.fromtimestamp(start + args.length, datetime.timezone.utc)))
+        calendars[calendarId] = (f'Simulation {c}', events)
+        info.append({'calendarSummary': f'Simulation {c}', 'calendarId': calendarId, 'search_params': ['sim'], 'username': username, 'password': PASSWORD})
+    return calendars, info, lectures
+
+def configure(page: AttendancePage, cache_path: str):
+    """
+        Points the http engine at the mock attendance page, the rest of the config (such as when sign-ins are
+        scheduled) is left alone so that the simulation schedules sign-ins like the bot does
+
+        Args:
+            page: the mock attendance page
+            cache_path: the directory used as the cache so that the real cache is left alone
+    """
+    CONFIG.REGISTER_ATTENDANCE_URL = page.url
+    CONFIG.HTTP_STATE_URL = 'api/state'
+    CONFIG.HTTP_REGISTER_URL = 'api/register'
+    CONFIG.SIGN_IN_ENGINE = 'http'
+    CONFIG.CACHE_PATH = cache_path
+
+def report(args: argparse.Namespace, service: FakeCalendarService, lectures: list, wall: float, cpu: float):
+    """Prints the results of the simulation"""
+    signed_in = [lecture for lecture in lectures if lecture.registered is not None]
+    into = [(lecture.registered - lecture.start) / (lecture.end - lecture.start) * 100 for lecture in signed_in]
+    # Every timer is summed over its labels (such as the calendar)
+    timers = {}
+    for name, _, count, total, longest in METRICS.timers():
+        previous = timers.get(name, (0, 0.0, 0.0))
+        timers[name] = (previous[0] + count, previous[1] + total, max(previous[2], longest))
+    late_count, late_total, late_max = timers.get('sign_in_lateness_seconds', (0, 0.0, 0.0))
+    attempts = timers.get('sign_in_attempt_seconds', (0, 0.0, 0.0))[0]
+    self_rss, _ = peak_rss()
+
+    rows = [
+        ('Simulated days', args.days),
+        ('Speed (x real time)', f'{args.speed:g}'),
+        ('Lectures', len(lectures)),
+        ('Signed in', f'{len(signed_in)} ({len(lectures) - len(signed_in)} missed)'),
+    ]
+    if len(into):
+        rows += [(f'Signed in % through lecture p{p}', f'{percentile(into, p):.1f}') for p in (50, 90, 99)]
+    if late_count:
+        # Lateness is measured on the virtual clock, so it is scaled back to real time to get the scheduler's overhead
+        rows += [
+            ('Scheduler lateness mean (real ms)', f'{late_total / late_count / args.speed * 1000:.2f}'),
+            ('Scheduler lateness max (real ms)', f'{late_max / args.speed * 1000:.2f}'),
+        ]
+    rows += [
+        ('Sign-in attempts per lecture', f'{attempts / len(lectures):.2f}'),
+        ('Calendar API calls per lecture', f'{service.total_calls / len(lectures):.2f}'),
+        ('Wall time (s)', f'{wall:.1f}'),
+        ('CPU time (s)', f'{cpu:.2f}'),
+        ('Lectures per second', f'{len(lectures) / wall:.1f}'),
+        ('Peak RSS (MiB)', 'n/a' if self_rss is None else f'{self_rss:.1f}'),
+    ]
+    print(tabulate(rows, headers=['Metric', 'Value']))
+
+def main(argv: list = None):
+    args = parse_args(argv)
+    t0 = math.ceil(time.time())
+    # Has to be set before the bot's schedulers and pipelines are made, as they keep the clock they were made with
+    set_clock(VirtualClock(t0, args.speed))
+    calendars, info, lectures = make_timetable(args, t0)
+    service = FakeCalendarService(calendars, args.api_latency)
+    page = AttendancePage({calendar['username']: PASSWORD for calendar in info}, lectures)
+    page.start()
+
+    end = max(lecture.end for lecture in lectures)
+    with tempfile.TemporaryDirectory() as cache_path:
+        configure(page, cache_path)
+        print(f'Simulating {len(lectures)} lectures over {args.days} days and {len(info)} calendars, this will take about {math.ceil((end - t0) / args.speed)} seconds...')
+        start = time.monotonic()
+        cpu = time.process_time()
+        output = sys.stdout if args.verbose else open(os.devnull, 'w')
+        try:
+            with contextlib.redirect_stdout(output):
+                run(args, page, service, info, end + 1)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+            page.close()
+        report(args, service, lectures, time.monotonic() - start, time.process_time() - cpu)
+
+if __name__ == '__main__':
+    main()
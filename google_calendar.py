@@ -1,15 +1,50 @@
 from __future__ import print_function
 import datetime
 import json
+import logging
 from os import sep
 import os.path
-from googleapiclient.discovery import build
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
+import re
+import threading
+import time
+import uuid
+from typing import Callable, Union
 
 from tabulate import tabulate
 from utils import input_utils
+from utils.clock import get_clock
+from utils.config import CONFIG
+from utils.event import Event
+from utils.event_store import EventStore
+from utils.file import get_cache_path
+from utils.metrics import METRICS
+from utils.time_utils import fromiso_aware
+
+FETCH_WINDOW_DAYS = CONFIG.FETCH_WINDOW_DAYS  # days
+FETCH_WINDOW_TTL = CONFIG.FETCH_WINDOW_TTL  # mins
+INCREMENTAL_SYNC = CONFIG.INCREMENTAL_SYNC
+SERVER_SIDE_SEARCH = CONFIG.SERVER_SIDE_SEARCH
+STARTUP_CACHE = CONFIG.STARTUP_CACHE
+EVENT_STORE_FILE = 'events.sqlite3'
+DISCOVERY_FILE = 'calendar-v3-discovery.json'
+CALENDARS_FILE = 'calendars.json'
+# How old (in seconds) the cached discovery document can be before it is downloaded again
+DISCOVERY_TTL = 7 * 24 * 60 * 60
+# How far back the first full sync of a calendar goes, events that have ended are pruned from the store
+SYNC_HISTORY = datetime.timedelta(days=1)
+# How many more FETCH_WINDOW_DAYS after a lookup are searched (in one request) when its window has too few matching events
+MAX_WINDOW_EXTENSIONS = 8
+# The maximum page size allowed for events().list is 2500 but 250 keeps each response small
+PAGE_SIZE = 250
+# The maximum number of requests Google recommends putting in one batch request
+BATCH_SIZE = 50
+# How long (in seconds) watch channels are asked to last for, and how long before they expire they are renewed
+WATCH_TTL = 7 * 24 * 60 * 60
+WATCH_RENEW_MARGIN = 60 * 60
+# How long (in seconds) to wait before trying to renew a channel again if renewing it failed
+WATCH_RETRY = 5 * 60
+
+logger = logging.getLogger(__name__)
 
 class NoCalendarsChosen(RuntimeError):
     """Raised when no calendars are chosen"""
@@ -19,17 +54,212 @@ class CalendarNotChosen(RuntimeError):
     """Raised when a calendar that is not chosen is queried"""
     pass
 
+def compile_search_params(search_params: list) -> Callable[[dict], bool]:
+    """
+        Compiles a list of search params into a single (case insensitive) regex that matches an event if
+        any of the params are within its summary or description
+
+        Args:
+            search_params: the list of search params, an empty list matches every event
+
+        Returns:
+            A function which takes an event and returns whether or not it matches
+    """
+    pattern = re.compile('|'.join(re.escape(param) for param in search_params), re.IGNORECASE)
+    return lambda event: pattern.search(event.get('summary', '')) is not None or pattern.search(event.get('description', '')) is not None
+
+class EventWindow:
+    """
+        A cached, time ordered range of events fetched from a single calendar
+
+        Attributes:
+            start: the (aware) datetime the window was fetched from
+            end: the (aware) datetime the window was fetched up to
+            events: a list of (end datetime, event) tuples ordered by event start time
+            fetched: the monotonic time that the window was first fetched at
+            query: the free text search (q) that the API filtered the events with, if any
+    """
+
+    def __init__(self, start: datetime.datetime, end: datetime.datetime, events: list, query: str = None):
+        self.start = start
+        self.end = end
+        self.query = query
+        self.events = []
+        self.fetched = get_clock().monotonic()
+        self.extend(end, events)
+
+    def extend(self, end: datetime.datetime, events: list):
+        """
+            Appends events fetched from the end of the window onwards
+
+            Args:
+                end: the new end of the window
+                events: the events fetched between the old and new end, ordered by start time
+        """
+        seen = {event['id'] for _, event in self.events}
+        for event in events:
+            if event['id'] not in seen:
+                self.events.append((fromiso_aware(event['end'].get('dateTime', event['end'].get('date'))), event))
+        self.end = end
+
+    def covers(self, after: datetime.datetime) -> bool:
+        """
+            Checks whether lookups for events after the given time can be served from this window
+
+            Args:
+                after: the time after which events are being looked up
+
+            Returns:
+                True if the time is within the window and the window is not stale, otherwise False
+        """
+        return self.start <= after < self.end and get_clock().monotonic() - self.fetched < FETCH_WINDOW_TTL * 60
+
+    def after(self, after: datetime.datetime) -> list:
+        """
+            Gets the events in the window which end after the given time (same semantics as timeMin)
+
+            Args:
+                after: the time after which events should end
+
+            Returns:
+                The list of events ordered by start time
+        """
+        return [event for end, event in self.events if end > after]
+
 # If modifying these scopes, delete the file token.pickle.
 class CalendarAPI:
     SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 
-    def __init__(self):
+    def __init__(self, service=None):
         """
             Basic implementation of the Google Calendar API as well as some helpful abstractions.
 
-            Will cache all found calendars into an attribute
+            Will cache all found calendars into an attribute. With STARTUP_CACHE the calendars saved by the
+            last run are used straight away, and are revalidated (along with logging in and building the
+            service) in the background
+
+            Args:
+                service: the calendar API service to use instead of logging in and building one (such as the benchmark's fake service)
         """
         
+        self._service = service
+        self._service_lock = threading.Lock()
+        # The credentials the service was built with, and each thread's HTTP object (see _http)
+        self._credentials = None
+        self._local = threading.local()
+        self._revalidation = None
+
+        cached = self._load_cached_calendars() if STARTUP_CACHE and service is None and os.path.exists('token.json') else None
+        if cached is not None:
+            self._set_calendars(cached)
+            self._revalidation = threading.Thread(target=self._revalidate_calendars, daemon=True)
+            self._revalidation.start()
+        else:
+            self.refresh_calendars()
+        # Windows of events that have been fetched for each calendar, so that lookups don't each need a request
+        self.windows = {}
+        # Compiled search params, see get_matcher
+        self.matchers = {}
+        # The local store of events that is kept up to date with sync tokens, as well as when each calendar was last synced
+        self.event_store = EventStore(get_cache_path(EVENT_STORE_FILE)) if INCREMENTAL_SYNC else None
+        self.last_synced = {}
+        # The watch channel of each calendar that push notifications are received for, and when (epoch) each needs renewing
+        self.channels = {}
+        self._renew_at = {}
+    
+    @property
+    def service(self):
+        """The calendar API service, which is built the first time that it is needed"""
+        with self._service_lock:
+            if self._service is None:
+                self._service = self._build_service()
+            return self._service
+
+    def refresh_calendars(self):
+        """Gets the user's calendars from the API, saving them for the next run if STARTUP_CACHE is on"""
+        calendars = self.service.calendarList().list().execute(http=self._http()).get('items', [])
+        self._set_calendars(calendars)
+        if STARTUP_CACHE:
+            with open(get_cache_path(CALENDARS_FILE), 'w') as calendars_file:
+                json.dump(calendars, calendars_file)
+
+    def _revalidate_calendars(self):
+        """Refreshes the calendars that were loaded from the cache, keeping the cached ones if that fails"""
+        try:
+            self.refresh_calendars()
+        except Exception as e:
+            logger.warning(f'Could not refresh the list of calendars, using the saved list ({e})')
+
+    def _set_calendars(self, calendars: list):
+        self.calendars = calendars
+        self.calendars_short = [(i+1, calendar['summary'], calendar['id']) for i, calendar in enumerate(calendars)]
+
+    @staticmethod
+    def _load_cached_calendars() -> Union[list, None]:
+        """
+            Loads the calendars saved by the last run
+
+            Returns:
+                The calendars, or None if there aren't any saved
+        """
+        path = get_cache_path(CALENDARS_FILE)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path) as calendars_file:
+                return json.load(calendars_file)
+        except ValueError:
+            return None
+
+    def find_calendar(self, calendarId: str) -> Union[tuple, None]:
+        """
+            Finds a calendar within the user's calendars. If the calendars were loaded from the cache and
+            it isn't there then the calendars are revalidated first, in case it has only just been added
+
+            Args:
+                calendarId: the ID of the calendar
+
+            Returns:
+                The calendar's (number, summary, ID), or None if the user doesn't have the calendar
+        """
+        calendar = next((calendar for calendar in self.calendars_short if calendar[2] == calendarId), None)
+        if calendar is None and self._revalidation is not None:
+            self._revalidation.join()
+            calendar = next((calendar for calendar in self.calendars_short if calendar[2] == calendarId), None)
+        return calendar
+
+    def get_timezone(self, calendarId: str) -> str:
+        """
+            Gets the timezone of a calendar from the calendar list, so that no events have to be fetched
+
+            Args:
+                calendarId: the ID of the calendar
+
+            Returns:
+                The name of the calendar's timezone, such as Europe/London
+        """
+        timezone = next((calendar.get('timeZone') for calendar in self.calendars if calendar['id'] == calendarId), None)
+        if timezone is None:
+            # Fall back to the timezone of one of its events
+            timezone = self.get_next_n(calendarId)[0].timezone.zone
+        return timezone
+
+    def _build_service(self):
+        """
+            Logs into google (using the saved token if there is one) and builds the calendar API service.
+
+            The discovery document that describes the API is saved (and reused for DISCOVERY_TTL) so that
+            it doesn't need to be downloaded every time
+
+            Returns:
+                The calendar API service
+        """
+        # Imported here as they are slow to import and aren't needed when starting from the cache
+        from googleapiclient.discovery import build, build_from_document
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
         creds = None
         # The file token.json stores the user's access and refresh tokens, and is
         # created automatically when the authorization flow completes for the first
@@ -47,11 +277,41 @@ class CalendarAPI:
             with open('token.json', 'w') as token:
                 token.write(creds.to_json())
 
-        self.service = build('calendar', 'v3', credentials=creds)
+        self._credentials = creds
+        discovery_path = get_cache_path(DISCOVERY_FILE)
+        if STARTUP_CACHE and os.path.isfile(discovery_path) and time.time() - os.path.getmtime(discovery_path) < DISCOVERY_TTL:
+            with open(discovery_path) as discovery_file:
+                try:
+                    return build_from_document(discovery_file.read(), credentials=creds)
+                except ValueError:
+                    # Corrupted, so download it again
+                    pass
+
+        service = build('calendar', 'v3', credentials=creds, cache_discovery=False)
+        if STARTUP_CACHE:
+            with open(discovery_path, 'w') as discovery_file:
+                json.dump(service._rootDesc, discovery_file)
+        return service
+
+    def _http(self):
+        """
+            Gets the calling thread's authorized HTTP object, which requests are executed with so that each
+            thread keeps its own connections to Google alive between requests. The service's own HTTP object
+            is shared between threads, which httplib2 isn't safe for
+
+            Returns:
+                The thread's HTTP object, or None to use the service's own (such as before the service is built, or with the benchmark's fake service)
+        """
+        if self._credentials is None:
+            return None
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            # Imported here as they are slow to import, like in _build_service
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            http = self._local.http = AuthorizedHttp(self._credentials, http=httplib2.Http())
+        return http
 
-        self.calendars = self.service.calendarList().list().execute().get('items', [])
-        self.calendars_short = [(i+1, calendar['summary'], calendar['id']) for i, calendar in enumerate(self.calendars)]
-    
     def choose_calendars(self):
         """
             Interactive prompt which lets the user choose which calendars to keep track of
@@ -80,32 +340,315 @@ class CalendarAPI:
             Returns:
                 True if the calendar exists, otherwise false
         """
-        return any([check[2] == calendarId for check in self.calendars_short])
+        return self.find_calendar(calendarId) is not None
     
     def get_next_n(self, calendarId: str, n: int = 1, after: str = None, search_params: list = None, cutoff: int = 30) -> list:
         """
             Get the next 'n' number of events in calendarId, after the time given
 
+            If FETCH_WINDOW_DAYS is set then the events are served from a cached window of events which
+            is only refetched when the lookup falls outside of it or it becomes stale
+
             Args:
                 calendarId: the ID of the calendar to query
                 n: the max number of events to return (default = 1)
                 after: the time after which to query (if None then NOW), UTC + ISO format
                 search_params: the list of search params to check the events against (None matches every event)
-                cutoff: the number of total events to fetch from API. This is to stop infinte loops with the search params
+                cutoff: the number of total events to fetch from API when not windowed. This is to stop infinte loops with the search params
 
             Raises:
                 CalendarNotChosen: when the given calendarId is not present in the chosen calendars
             
             Returns:
-                A list of the upcoming events conforming to the search params
+                A list of the upcoming events conforming to the search params, only these are built into Events
         """
 
         # Check if the calendarId is valid
         if not self.check_calendar_chosen(calendarId):
             raise CalendarNotChosen(f'Calendar {calendarId} was not chosen and therefore cannot be queried')
 
-        # Format the datetime to UTC
-        raw = datetime.datetime.now().isoformat() if after is None else after
+        now = self._format_time(get_clock().now().isoformat() if after is None else after)
+
+        if FETCH_WINDOW_DAYS:
+            return [Event.from_api(event) for event in self._get_next_n_windowed(calendarId, n, now, search_params)]
+
+        request_args = dict(calendarId=calendarId, timeMin=now, maxResults=cutoff, singleEvents=True, orderBy='startTime')
+        query = self._server_query(search_params)
+        if query is not None:
+            request_args['q'] = query
+        METRICS.inc('calendar_api_requests_total', method='events.list')
+        events_result = self.service.events().list(**request_args).execute(http=self._http())
+        return [Event.from_api(event) for event in self._preen(events_result.get('items', []), n, search_params)]
+
+    def _get_next_n_windowed(self, calendarId: str, n: int, after: str, search_params: list) -> list:
+        """
+            Serves get_next_n from the calendar's cached window, fetching or extending the window when needed
+
+            Args:
+                calendarId: the ID of the calendar to query
+                n: the max number of events to return
+                after: the time after which to query, UTC + ISO format
+                search_params: the list of search params to check the events against (None matches every event)
+
+            Returns:
+                A list of the upcoming events conforming to the search params
+        """
+        after_dt = fromiso_aware(after)
+        query = self._server_query(search_params)
+        window = self.windows.get(calendarId)
+        if window is None or not window.covers(after_dt) or window.query != query:
+            window_end = after_dt + datetime.timedelta(days=FETCH_WINDOW_DAYS)
+            window = EventWindow(after_dt, window_end, self._list_events(calendarId, after_dt, window_end, query), query)
+            self.windows[calendarId] = window
+
+        preened = self._preen(window.after(after_dt), n, search_params)
+        # Not enough matches left in the window (holidays, reading weeks...) so look further ahead, up to a fixed horizon
+        # from the lookup. The window then remembers that the range has been searched, so lookups of a calendar without
+        # matches don't fetch again (or any further ahead) until the window is stale
+        horizon = after_dt + datetime.timedelta(days=FETCH_WINDOW_DAYS * (MAX_WINDOW_EXTENSIONS + 1))
+        if len(preened) < n and window.end < horizon:
+            window.extend(horizon, self._list_events(calendarId, window.end, horizon, query))
+            preened = self._preen(window.after(after_dt), n, search_params)
+        return preened
+
+    def _list_events(self, calendarId: str, time_min: datetime.datetime, time_max: datetime.datetime, query: str = None) -> list:
+        """
+            Fetches every event in the given time range, following pageTokens
+
+            Args:
+                calendarId: the ID of the calendar to query
+                time_min: the time after which events should end
+                time_max: the time before which events should start
+                query: free text search that the API filters events with (ignored by the event store as it can't be synced)
+
+            Returns:
+                All the events in the range ordered by start time
+        """
+        if self.event_store is not None:
+            if get_clock().monotonic() - self.last_synced.get(calendarId, float('-inf')) >= FETCH_WINDOW_TTL * 60:
+                self.sync(calendarId)
+            return self.event_store.between(calendarId, time_min.timestamp(), time_max.timestamp())
+
+        events = []
+        request_args = self._list_args(calendarId, time_min, time_max, query)
+        while True:
+            METRICS.inc('calendar_api_requests_total', method='events.list')
+            events_result = self.service.events().list(**request_args).execute(http=self._http())
+            events.extend(events_result.get('items', []))
+            if 'nextPageToken' not in events_result:
+                return events
+            request_args['pageToken'] = events_result['nextPageToken']
+
+    def sync(self, calendarId: str):
+        """
+            Brings the local event store up to date with the given calendar.
+
+            Uses the sync token from the last sync so that only the events that changed since then are
+            fetched. If there is no token (or Google has expired it) then a full sync is done instead
+
+            Args:
+                calendarId: the ID of the calendar to sync
+        """
+        from googleapiclient.errors import HttpError
+
+        sync_token = self.event_store.get_sync_token(calendarId)
+        request_args = self._sync_args(calendarId, sync_token)
+
+        events = []
+        try:
+            while True:
+                METRICS.inc('calendar_api_requests_total', method='events.list')
+                events_result = self.service.events().list(**request_args).execute(http=self._http())
+                events.extend(events_result.get('items', []))
+                if 'nextPageToken' not in events_result:
+                    break
+                request_args['pageToken'] = events_result['nextPageToken']
+        except HttpError as e:
+            # 410 GONE means the sync token is no longer valid and the calendar needs to be fully synced again
+            if sync_token is not None and e.resp.status == 410:
+                self.event_store.clear(calendarId)
+                return self.sync(calendarId)
+            raise
+
+        self._apply_sync(calendarId, events, events_result.get('nextSyncToken'), full=sync_token is None)
+
+    def prefetch(self, lookups: list):
+        """
+            Fetches what get_next_n will need for several calendars at once using batch requests, so that
+            refilling many calendars takes one round trip rather than one per calendar.
+
+            Calendars that get_next_n can already serve without a request are skipped. Anything that can't
+            be finished within the batch (a response with more pages or an error) is left for get_next_n to
+            fetch as normal. Only used when FETCH_WINDOW_DAYS is set
+
+            Args:
+                lookups: a list of (calendarId, after, search_params) tuples, as they would be given to get_next_n
+        """
+        if not FETCH_WINDOW_DAYS:
+            return
+
+        requests = {}
+        for calendarId, after, search_params in lookups:
+            if calendarId in requests or not self.check_calendar_chosen(calendarId):
+                continue
+            after_dt = fromiso_aware(self._format_time(get_clock().now().isoformat() if after is None else after))
+            query = self._server_query(search_params)
+            window = self.windows.get(calendarId)
+            if window is not None and window.covers(after_dt) and window.query == query:
+                continue
+
+            if self.event_store is not None:
+                if get_clock().monotonic() - self.last_synced.get(calendarId, float('-inf')) < FETCH_WINDOW_TTL * 60:
+                    continue
+                sync_token = self.event_store.get_sync_token(calendarId)
+                requests[calendarId] = (self._sync_args(calendarId, sync_token), self._sync_callback(sync_token))
+            else:
+                window_end = after_dt + datetime.timedelta(days=FETCH_WINDOW_DAYS)
+                requests[calendarId] = (self._list_args(calendarId, after_dt, window_end, query), self._window_callback(after_dt, window_end, query))
+
+        # A single calendar is fetched by get_next_n as normal
+        if len(requests) < 2:
+            return
+        items = list(requests.items())
+        for i in range(0, len(items), BATCH_SIZE):
+            batch = self.service.new_batch_http_request()
+            for calendarId, (request_args, callback) in items[i:i + BATCH_SIZE]:
+                batch.add(self.service.events().list(**request_args), callback=callback, request_id=calendarId)
+            METRICS.inc('calendar_api_requests_total', method='batch')
+            batch.execute(http=self._http())
+
+    def _window_callback(self, time_min: datetime.datetime, time_max: datetime.datetime, query: str = None) -> Callable:
+        """Makes the batch callback which turns a complete response of _list_args into the calendar's window, see prefetch"""
+        def callback(calendarId: str, response: dict, exception: Exception):
+            if exception is None and 'nextPageToken' not in response:
+                self.windows[calendarId] = EventWindow(time_min, time_max, response.get('items', []), query)
+        return callback
+
+    def _sync_callback(self, sync_token: str = None) -> Callable:
+        """Makes the batch callback which applies a complete response of _sync_args to the event store, see prefetch"""
+        def callback(calendarId: str, response: dict, exception: Exception):
+            if exception is None and 'nextPageToken' not in response:
+                self._apply_sync(calendarId, response.get('items', []), response.get('nextSyncToken'), full=sync_token is None)
+        return callback
+
+    @staticmethod
+    def _list_args(calendarId: str, time_min: datetime.datetime, time_max: datetime.datetime, query: str = None) -> dict:
+        """Gets the arguments of events().list for the first page of events in a time range, see _list_events"""
+        request_args = dict(calendarId=calendarId, timeMin=time_min.isoformat(), timeMax=time_max.isoformat(),
+                            maxResults=PAGE_SIZE, singleEvents=True, orderBy='startTime')
+        if query is not None:
+            request_args['q'] = query
+        return request_args
+
+    @staticmethod
+    def _sync_args(calendarId: str, sync_token: str = None) -> dict:
+        """Gets the arguments of events().list for the first page of a sync, a full sync if there isn't a sync token"""
+        request_args = dict(calendarId=calendarId, maxResults=PAGE_SIZE, singleEvents=True)
+        if sync_token is not None:
+            request_args['syncToken'] = sync_token
+        else:
+            request_args['timeMin'] = (get_clock().now(datetime.timezone.utc) - SYNC_HISTORY).isoformat()
+        return request_args
+
+    def _apply_sync(self, calendarId: str, events: list, sync_token: str, full: bool):
+        """Applies the events fetched by a sync to the event store, see sync"""
+        self.event_store.apply(calendarId, events, sync_token, full=full)
+        self.event_store.prune((get_clock().now(datetime.timezone.utc) - SYNC_HISTORY).timestamp())
+        self.last_synced[calendarId] = get_clock().monotonic()
+
+    def invalidate(self, calendarId: str):
+        """
+            Forgets the fetched events of a calendar, so that the next lookup fetches what has changed (only
+            the changes are fetched when there is an event store)
+
+            Args:
+                calendarId: the ID of the calendar
+        """
+        self.windows.pop(calendarId, None)
+        self.last_synced.pop(calendarId, None)
+
+    def watch(self, calendarId: str, address: str, token: str):
+        """
+            Opens a watch channel so that Google sends a push notification to the address whenever the events of
+            the calendar change. Any channel the calendar already had is stopped once the new one is open
+
+            Args:
+                calendarId: the ID of the calendar to watch
+                address: the HTTPS address that notifications are sent to
+                token: a secret sent with every notification, so that they can be told apart from forged ones
+        """
+        body = {'id': uuid.uuid4().hex, 'type': 'web_hook', 'address': address, 'token': token, 'params': {'ttl': str(WATCH_TTL)}}
+        METRICS.inc('calendar_api_requests_total', method='events.watch')
+        channel = self.service.events().watch(calendarId=calendarId, body=body).execute(http=self._http())
+        previous, self.channels[calendarId] = self.channels.get(calendarId), channel
+        expiration = int(channel['expiration']) / 1000 if 'expiration' in channel else get_clock().time() + WATCH_TTL
+        self._renew_at[calendarId] = expiration - WATCH_RENEW_MARGIN
+        if previous is not None:
+            self.stop_watching(previous)
+
+    def stop_watching(self, channel: dict = None):
+        """
+            Stops a watch channel, a channel which can't be stopped is left to expire
+
+            Args:
+                channel: the channel to stop. If None then the channel of every calendar is stopped
+        """
+        if channel is None:
+            channels, self.channels, self._renew_at = list(self.channels.values()), {}, {}
+            for channel in channels:
+                self.stop_watching(channel)
+            return
+        try:
+            METRICS.inc('calendar_api_requests_total', method='channels.stop')
+            self.service.channels().stop(body={'id': channel['id'], 'resourceId': channel['resourceId']}).execute(http=self._http())
+        except Exception as e:
+            logger.warning(f'Could not stop watching for changes, the watch will expire by itself ({e})')
+
+    def watched_calendar(self, channel_id: str) -> Union[str, None]:
+        """
+            Gets the calendar of a watch channel
+
+            Args:
+                channel_id: the ID of the channel
+
+            Returns:
+                The calendarId of the channel, or None if it isn't the calendar's current channel
+        """
+        return next((calendarId for calendarId, channel in self.channels.items() if channel['id'] == channel_id), None)
+
+    def renew_channels(self, address: str, token: str) -> Union[float, None]:
+        """
+            Reopens the watch channels which expire within WATCH_RENEW_MARGIN
+
+            Args:
+                address: the HTTPS address that notifications are sent to
+                token: the secret sent with every notification
+
+            Returns:
+                The seconds until the next channel needs renewing, or None if there are no channels
+        """
+        now = get_clock().time()
+        for calendarId, renew_at in list(self._renew_at.items()):
+            if renew_at <= now:
+                try:
+                    self.watch(calendarId, address, token)
+                except Exception as e:
+                    # Polling finds any changes in the meantime
+                    self._renew_at[calendarId] = now + WATCH_RETRY
+                    logger.warning(f'Could not renew the watch of {calendarId}, trying again in {WATCH_RETRY} seconds ({e})', extra={'calendar': calendarId})
+        return max(min(self._renew_at.values()) - now, 0) if len(self._renew_at) else None
+
+    @staticmethod
+    def _format_time(raw: str) -> str:
+        """
+            Formats an ISO datetime so that it can be given to the API as timeMin
+
+            Args:
+                raw: the datetime in ISO format
+
+            Returns:
+                The datetime cut to millisecond precision with a UTC offset
+        """
         now = raw
         if raw.find('.') > -1:
             now = raw[:raw.find('.') + 4]
@@ -113,21 +656,61 @@ class CalendarAPI:
                 now += raw[raw.find('+'):]
             else:
                 now += 'Z'
+        return now
 
-        events_result = self.service.events().list(calendarId=calendarId, timeMin=now,
-                                    maxResults=cutoff, singleEvents=True,
-                                    orderBy='startTime').execute()
-        events = events_result.get('items', [])
+    def _server_query(self, search_params: list = None) -> Union[str, None]:
+        """
+            Gets the free text search (q) that the API can narrow events down with before sending them.
+
+            Only possible with SERVER_SIDE_SEARCH and a single search param, as the API matches every word
+            within q rather than any of them. The event store syncs every event so it can't use q either
+
+            Args:
+                search_params: the list of search params the events will be checked against
+
+            Returns:
+                The value of q, or None if q can't be used
+        """
+        if SERVER_SIDE_SEARCH and self.event_store is None and search_params is not None and len(search_params) == 1 and search_params[0]:
+            return search_params[0]
+        return None
+
+    def get_matcher(self, search_params: list) -> Callable[[dict], bool]:
+        """
+            Gets the compiled matcher of the given search params, compiling it the first time they are seen
+
+            Args:
+                search_params: the list of search params
 
+            Returns:
+                A function which takes an event and returns whether or not it matches
+        """
+        key = tuple(search_params)
+        matcher = self.matchers.get(key)
+        if matcher is None:
+            matcher = self.matchers[key] = compile_search_params(search_params)
+        return matcher
+
+    def _preen(self, events: list, n: int, search_params: list = None) -> list:
+        """
+            Gets the first n events that conform to the search params
+
+            Args:
+                events: the events to check, in order
+                n: the max number of events to return
+                search_params: the list of search params to check the events against (None matches every event)
+
+            Returns:
+                A list of at most n events
+        """
         preened = []
 
         if search_params is not None:
+            matches = self.get_matcher(search_params)
             for event in events:
                 if len(preened) < n:
-                    for param in search_params:
-                        if param in event['summary'].lower() or param in event['description'].lower():
-                            preened.append(event)
-                            break
+                    if matches(event):
+                        preened.append(event)
                 else:
                     break
         else:
@@ -135,7 +718,6 @@ class CalendarAPI:
 
         return preened
 
-
 if __name__ == '__main__':
     api = CalendarAPI()
     print(api.calendars_short)
@@ -0,0 +1,248 @@
+import logging
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+from utils.config import CONFIG
+from utils.file import load_session, save_session
+from utils.log import setup_logging
+from utils.metrics import METRICS
+from registration import STAGE_TIMER, CannotLoginException, course_matches
+
+REGISTER_ATTENDANCE_URL = CONFIG.REGISTER_ATTENDANCE_URL
+HTTP_STATE_URL = CONFIG.HTTP_STATE_URL
+HTTP_REGISTER_URL = CONFIG.HTTP_REGISTER_URL
+HTTP_TIMEOUT = CONFIG.HTTP_TIMEOUT  # seconds
+SESSION_CACHE = CONFIG.SESSION_CACHE
+# The number of accounts whose sessions are kept open, so that memory and connections grow with the number of concurrent
+# sign-ins rather than the number of accounts (in daemon mode). A dropped session is restored from its saved cookies
+MAX_SESSIONS = max(CONFIG.MAX_CONCURRENT_SIGN_INS * 2, 4)
+# The number of auto-submitting forms (SAML responses etc.) that will be followed after logging in
+MAX_FORM_HOPS = 5
+
+logger = logging.getLogger(__name__)
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:105.0) Gecko/20100101 Firefox/105.0',
+    'Accept-Language': 'en-GB,en;q=0.5',
+}
+
+class HttpEngineUnavailable(Exception):
+    """Raised when the attendance page can't be used over HTTP, so selenium should be used instead"""
+    pass
+
+class FormParser(HTMLParser):
+    """
+        Collects the forms on a HTML page along with their inputs
+
+        Attributes:
+            forms: a list of dicts containing the id, action, method and inputs (name: value) of each form
+    """
+
+    def __init__(self):
+        super(FormParser, self).__init__()
+        self.forms = []
+        self._form = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form':
+            self._form = {'id': attrs.get('id'), 'action': attrs.get('action', ''), 'method': attrs.get('method', 'GET').upper(), 'inputs': {}}
+            self.forms.append(self._form)
+        elif tag == 'input' and self._form is not None and attrs.get('name'):
+            self._form['inputs'][attrs['name']] = attrs.get('value') or ''
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self._form = None
+
+def parse_forms(html: str) -> list:
+    """
+        Parses the forms on a HTML page
+
+        Args:
+            html: the page
+
+        Returns:
+            The forms found, see FormParser
+    """
+    parser = FormParser()
+    parser.feed(html)
+    return parser.forms
+
+# Sessions are kept (most recently used last) one per account, so that connections and cookies are reused
+_sessions = OrderedDict()
+_sessions_lock = threading.Lock()
+
+def get_session(email: str, password: str) -> requests.Session:
+    """
+        Gets the HTTP session of an account, creating one (and restoring its saved cookies) if needed. Only
+        the MAX_SESSIONS most recently used sessions are kept
+
+        Args:
+            email: the email of the account
+            password: the password of the account, which the saved session is encrypted with
+
+        Returns:
+            The account's session
+    """
+    with _sessions_lock:
+        session = _sessions.get(email)
+        if session is None:
+            session = requests.Session()
+            session.headers.update(HEADERS)
+            # Keep-alive connections to the attendance and login hosts are reused between attempts
+            session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=2))
+            session.mount('http://', HTTPAdapter(pool_connections=2, pool_maxsize=2))
+            for cookie in (load_session(email, password) or []) if SESSION_CACHE else []:
+                session.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain', ''), path=cookie.get('path', '/'))
+            _sessions[email] = session
+            if len(_sessions) > MAX_SESSIONS:
+                # The session isn't closed as it might still be in use, its connections are closed once it is unused
+                _sessions.popitem(last=False)
+        else:
+            _sessions.move_to_end(email)
+    return session
+
+def save_cookies(email: str, password: str, session: requests.Session):
+    """
+        Saves the cookies of a session, in the same format as selenium's cookies so either engine can restore them
+
+        Args:
+            email: the email of the account
+            password: the password of the account
+            session: the logged in session
+    """
+    save_session(email, password, [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path, 'secure': cookie.secure}
+                                   for cookie in session.cookies])
+
+def follow_hidden_forms(session: requests.Session, response: requests.Response, verbose: bool = False) -> requests.Response:
+    """
+        Submits the forms which a browser would submit automatically using javascript, such as the SAML
+        response after logging in
+
+        Args:
+            session: the session of the account
+            response: the response which might contain a hidden form
+            verbose: whether or not to display info
+
+        Returns:
+            The response of the first page without a hidden form
+    """
+    for _ in range(MAX_FORM_HOPS):
+        hidden_form = next((form for form in parse_forms(response.text) if form['method'] == 'POST' and 'SAMLResponse' in form['inputs']), None)
+        if hidden_form is None:
+            break
+        if verbose:
+            logger.info(f'Following automatically submitted form: {hidden_form["action"]}')
+        response = session.post(urljoin(response.url, hidden_form['action']), data=hidden_form['inputs'], timeout=HTTP_TIMEOUT)
+    return response
+
+def login(session: requests.Session, email: str, password: str, verbose: bool = False) -> requests.Response:
+    """
+        Logs into campus connect by submitting the login form, and following the forms which are
+        automatically submitted by the page afterwards. If the session is still logged in then the
+        login form is skipped
+
+        Args:
+            session: the session of the account
+            email: the email to login to campus connect with
+            password: the password to login to campus connect with
+            verbose: whether or not to display info
+
+        Raises:
+            CannotLoginException: if the login form was shown again, so the campus connect login was incorrect
+            HttpEngineUnavailable: if campus connect couldn't be reached, which doesn't mean that the login is incorrect
+
+        Returns:
+            The response of the attendance page
+    """
+    try:
+        response = session.get(REGISTER_ATTENDANCE_URL, timeout=HTTP_TIMEOUT)
+        login_form = next((form for form in parse_forms(response.text) if 'UserName' in form['inputs'] or form['id'] == 'loginForm'), None)
+        if login_form is None:
+            if verbose:
+                logger.info('Still logged in, skipping login form...')
+            return follow_hidden_forms(session, response, verbose)
+
+        if verbose:
+            logger.info(f'Found login form: {login_form["action"]}')
+        data = dict(login_form['inputs'], UserName=email, Password=password)
+        data.setdefault('AuthMethod', 'FormsAuthentication')
+        response = follow_hidden_forms(session, session.post(urljoin(response.url, login_form['action']), data=data, timeout=HTTP_TIMEOUT), verbose)
+    except requests.RequestException as e:
+        # Only a login form that is shown again means the login is incorrect (which stops the calendar being watched)
+        raise HttpEngineUnavailable(f'Could not reach Campus Connect to login ({e})')
+
+    if any('UserName' in form['inputs'] for form in parse_forms(response.text)):
+        raise CannotLoginException('Cannot login to Campus Connect. The login form was shown again so the login is likely incorrect')
+    if SESSION_CACHE:
+        save_cookies(email, password, session)
+    return response
+
+def click_button(email: str, password: str, verbose: bool = False, course_id: str = None, search_params: list = None) -> bool:
+    """
+        Logs into the attendance page and registers attendance using its XHR endpoints, without a browser.
+
+        HTTP_STATE_URL should respond with a JSON list of the records shown on the attendance page, each
+        with a "title" (the course title). The matching record is POSTed back to HTTP_REGISTER_URL to
+        register attendance, which should respond with a JSON object whose "registered" is true if attendance
+        was registered. Both URLs are relative to the attendance page. This format is assumed (only the
+        benchmark's mock attendance page is known to use it), anything else falls back to selenium
+
+        Args:
+            email: the email to login to campus connect with
+            password: the password to login to campus connect with
+            verbose: whether or not to display info
+            course_id: the course ID to check sign in for. If None will match all course titles
+            search_params: the search params of the calendar the event is from
+
+        Raises:
+            CannotLoginException: if the campus connect login was incorrect or could not be found
+            HttpEngineUnavailable: if the endpoints are not configured or did not respond as expected
+
+        Returns:
+            True if attendance was registered otherwise False
+    """
+    if not HTTP_STATE_URL or not HTTP_REGISTER_URL:
+        raise HttpEngineUnavailable('HTTP_STATE_URL and HTTP_REGISTER_URL need to be configured to use the HTTP engine')
+
+    session = get_session(email, password)
+    with METRICS.timer(STAGE_TIMER, stage='http_login'):
+        page = login(session, email, password, verbose)
+    xhr_headers = {'Accept': 'application/json', 'X-Requested-With': 'XMLHttpRequest', 'Referer': page.url}
+
+    try:
+        with METRICS.timer(STAGE_TIMER, stage='http_state'):
+            response = session.get(urljoin(page.url, HTTP_STATE_URL), headers=xhr_headers, timeout=HTTP_TIMEOUT)
+            response.raise_for_status()
+            records = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise HttpEngineUnavailable(f'Could not get the state of the attendance page ({e})')
+    if not isinstance(records, list) or not all(isinstance(record, dict) and 'title' in record for record in records):
+        raise HttpEngineUnavailable('The state of the attendance page was not a list of records with titles')
+
+    record = next((record for record in records if course_matches(record['title'].split(' ')[0], course_id, search_params)), None)
+    if record is None:
+        if verbose:
+            logger.info('Button not found' if not len(records) else 'Found records but of the wrong course ID')
+        return False
+
+    if verbose:
+        logger.info(f'Registering attendance for: {record["title"]}')
+    try:
+        with METRICS.timer(STAGE_TIMER, stage='http_register'):
+            response = session.post(urljoin(page.url, HTTP_REGISTER_URL), json=record, headers=xhr_headers, timeout=HTTP_TIMEOUT)
+        result = response.json()
+    except (requests.RequestException, ValueError) as e:
+        raise HttpEngineUnavailable(f'Could not register attendance ({e})')
+    # A successful response alone doesn't mean attendance was registered, the page has to say that it was
+    if not isinstance(result, dict) or 'registered' not in result:
+        raise HttpEngineUnavailable('The response to registering attendance did not say whether it was registered')
+    return response.ok and result['registered'] is True
+
+if __name__ == '__main__':
+    listener = setup_logging()
+    print('Pressed button' if click_button(input('Enter email: '), input('Enter password: '), verbose=True) else 'Button not pressed')
+    listener.stop()
@@ -1,13 +1,18 @@
-import json
+import operator
 import threading
 from time import sleep
 
-from googleapiclient.errors import HttpError
-from utils.file import IncorrectPassword, calendars_exists, load_latest_calendar, save_encrypted
+from utils.file import IncorrectPassword, calendars_exists, load_latest_calendar, load_tenants, save_encrypted
 from workers import button_consumer, calendar_event_producer
 from utils.pipeline import Pipeline
+from utils.scheduler import Scheduler
 from google_calendar import CalendarAPI
+from registration import BrowserPool
 from utils import input_utils
+from utils.config import CONFIG
+from utils.log import setup_logging
+from utils.metrics import METRICS
+from utils.webhook import WebhookReceiver
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
@@ -15,32 +20,64 @@ import traceback
 
 info = []
 
+# What the worker threads log is written by a background thread, so that they never wait on the output
+log_listener = setup_logging()
 try:
-    # Initialise CalendarAPI, this will open browser and ask user to login into google account
-    print('Browser might open asking to choose Google account to use with app. This is so that your uni calendar can be used to check when your timetabled lectures are.')
-    time.sleep(2)
-    calendar_api = CalendarAPI()
-
     simple_input_mode = False
+    daemon_mode = False
     if len(sys.argv) - 1:
         # If the simple command line option is given then assume that most recent calendar info 
         # file should be used and use a normal input for password entry
         if len(sys.argv) == 2 and sys.argv[1] == '--simple':
             print('~ Continuing using simple input mode ~')
             simple_input_mode = True
+        # The daemon watches the calendars of many tenants, whose calendar info files (and their passwords) are given on
+        # stdin one per line as: path password
+        elif len(sys.argv) == 2 and sys.argv[1] == '--daemon':
+            print('~ Continuing in daemon mode ~')
+            simple_input_mode = daemon_mode = True
         else:
             print('Unrecognized command line arguments')
 
+    # Initialise CalendarAPI, this will open browser and ask user to login into google account
+    print('Browser might open asking to choose Google account to use with app. This is so that your uni calendar can be used to check when your timetabled lectures are.')
+    if not simple_input_mode:
+        # Pauses are only for reading the messages, so they are skipped in simple input mode (servers)
+        time.sleep(2)
+    calendar_api = CalendarAPI()
+
     auto = False
+    if daemon_mode:
+        try:
+            info = load_tenants(sys.stdin)
+        except (OSError, ValueError) as e:
+            raise RuntimeError(str(e))
+
+        # Tenants can watch the same calendar, which is then only fetched once
+        chosen = {}
+        watched = []
+        for calendar in info:
+            found = calendar_api.find_calendar(calendar['calendarId'])
+            if found is None:
+                print(f'Tenant {calendar["tenant"]}: Calendar "{calendar["calendarSummary"]}" is not shared with this Google account, so it is not watched')
+                continue
+            chosen[calendar['calendarId']] = (found[0], calendar['calendarSummary'], calendar['calendarId'])
+            watched.append(calendar)
+        if not len(watched):
+            raise RuntimeError('None of the tenants\' calendars can be watched')
+        info = watched
+        calendar_api.chosen_calendars = list(chosen.values())
+        print(f'Loaded {len(info)} calendars of {len({calendar["tenant"] for calendar in info})} tenants')
+        auto = True
     # If there exists a recent calendar info file then ask user if they want to decrypt and use it
-    if calendars_exists():
+    elif calendars_exists():
         if simple_input_mode or input_utils.ask_for('Do you want to use the most recently saved calendar info file (requires password for decryption)?', input_utils.Y_OR_N):
             while True:
                 try:
                     info = load_latest_calendar(simple=simple_input_mode)
                     auto = True
                     # Assign the chosen calendars in the api instance
-                    calendar_api.chosen_calendars = [(next(filter(lambda c: c[2] == calendar['calendarId'], calendar_api.calendars_short))[0], calendar['calendarSummary'], calendar['calendarId']) for calendar in info]
+                    calendar_api.chosen_calendars = [(calendar_api.find_calendar(calendar['calendarId'])[0], calendar['calendarSummary'], calendar['calendarId']) for calendar in info]
                     break
                 except IncorrectPassword as e:
                     if not simple_input_mode:
@@ -75,34 +112,56 @@ try:
         if input_utils.ask_for('Do you want to save this info to an encrypted file so that the bot can be started quicker next time?', input_utils.Y_OR_N):
             save_encrypted(info)
 
-    # Then create the pipeline
-    pipeline = Pipeline(info)
+    # Then create the pipeline and the scheduler which will run the sign-ins of every calendar
+    pipeline = Pipeline(info, priority_key=operator.attrgetter('start') if CONFIG.PRIORITY_PIPELINE else None)
+    # Sign-ins run on their own executor so that accounts with lectures at the same time are signed in concurrently
+    sign_in_executor = ThreadPoolExecutor(max_workers=CONFIG.MAX_CONCURRENT_SIGN_INS)
+    scheduler = Scheduler(sign_in_executor)
+    pool = BrowserPool(headless=CONFIG.HEADLESS)
+
+    if CONFIG.METRICS_PORT:
+        METRICS.serve(CONFIG.METRICS_PORT)
+        print(f'Serving metrics at http://127.0.0.1:{CONFIG.METRICS_PORT}/metrics')
+    if CONFIG.METRICS_FILE:
+        METRICS.log_to(CONFIG.METRICS_FILE)
+    receiver = None
+    if CONFIG.WEBHOOK_ADDRESS:
+        receiver = WebhookReceiver(CONFIG.WEBHOOK_ADDRESS)
+        receiver.serve(CONFIG.WEBHOOK_PORT)
+        print(f'Receiving calendar changes on port {CONFIG.WEBHOOK_PORT} (from {CONFIG.WEBHOOK_ADDRESS})')
 
     event = threading.Event()
-    selenium_lock = threading.Lock()
-    print(f'\nStarting the {len(info)} worker bees to watch calendars (To quit: keyboard interrupt, e.g. CTRL+C. Quitting might take a while so be patient)\n')
-    sleep(3)
+    print(f'\nStarting the worker bees to watch {len(info)} calendars (To quit: keyboard interrupt, e.g. CTRL+C. Quitting might take a while so be patient)\n')
+    if not simple_input_mode:
+        sleep(3)
 
     # Start threads
     futures = []
-    with ThreadPoolExecutor(max_workers=len(info) + 1) as executor:
-        futures.append(executor.submit(calendar_event_producer, info, calendar_api, pipeline, event))
-        for calendar in info:
-            futures.append(executor.submit(button_consumer, calendar, pipeline, event, selenium_lock))
-
-        for future in as_completed(futures):
-            try:
-                future.result()
-            except Exception as exc:
-                print(exc)
-                traceback.print_tb(exc.__traceback__)
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures.append(executor.submit(calendar_event_producer, info, calendar_api, pipeline, event, receiver))
+        futures.append(executor.submit(button_consumer, info, pipeline, scheduler, event, pool))
+        futures.append(executor.submit(scheduler.run, event))
 
-        # Check for keyboard interrupts so that threads can exit safely
-        while True:
-            try:
-                sleep(2)
-            except KeyboardInterrupt:
-                event.set()
-            break
+        try:
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as exc:
+                    print(exc)
+                    traceback.print_tb(exc.__traceback__)
+        except KeyboardInterrupt:
+            # Let the threads exit safely
+            event.set()
+            pipeline.close()
+            scheduler.stop()
+        finally:
+            sign_in_executor.shutdown()
+            pool.close()
+            METRICS.close()
+            if receiver is not None:
+                receiver.close()
 except RuntimeError as e:
     print(f'\n\nError: {e.args[0]}')
+finally:
+    # Only once the threads have exited (or didn't start), so that everything they logged is written
+    log_listener.stop()
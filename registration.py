@@ -1,65 +1,567 @@
+import base64
+import json
+import logging
 import sys
+import threading
 import time
-from typing import Iterable
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterable, Union
+from urllib.parse import urljoin, urlparse
 from utils.config import CONFIG
-from selenium.common.exceptions import ElementClickInterceptedException, NoSuchElementException, TimeoutException
-from selenium.webdriver import Firefox
-from selenium.webdriver.firefox.options import Options
-from selenium.webdriver.remote.webelement import WebElement
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+from utils.file import clear_session, load_session, save_session
+from utils.log import setup_logging
+from utils.metrics import METRICS
+from selenium.common.exceptions import JavascriptException, NoSuchElementException, TimeoutException, WebDriverException
 
 REGISTER_ATTENDANCE_URL = CONFIG.REGISTER_ATTENDANCE_URL
 GET_ATTR_SCRIPT = 'var items = {}; for (index = 0; index < arguments[0].attributes.length; ++index) { items[arguments[0].attributes[index].name] = arguments[0].attributes[index].value }; return items;'
-GET_TEXT_SCRIPT = """
-var parent = arguments[0];
-var child = parent.firstChild;
-var ret = "";
-while(child) {
+# Gets everything _click_button needs to decide which button to click in a single round trip to the driver.
+# Each element is null if it doesn't exist, otherwise whether it is hidden and its attributes (for verbose output)
+SNAPSHOT_SCRIPT = """
+var hiddenClass = arguments[0];
+function snapshot(id) {
+    var element = document.getElementById(id);
+    if (element === null)
+        return null;
+    var attributes = {};
+    for (var index = 0; index < element.attributes.length; ++index)
+        attributes[element.attributes[index].name] = element.attributes[index].value;
+    return {hidden: (element.getAttribute('class') || '').indexOf(hiddenClass) > -1, attributes: attributes};
+}
+var title = document.getElementById('pbid-literalHappeningNowTitle');
+var text = '';
+for (var child = title === null ? null : title.firstChild; child; child = child.nextSibling) {
     if (child.nodeType === Node.TEXT_NODE)
-        ret += child.textContent;
-    child = child.nextSibling;
+        text += child.textContent;
 }
-return ret;
+return {
+    happeningNow: snapshot('pbid-blockFoundHappeningNow'),
+    happeningNowOne: snapshot('pbid-blockFoundHappeningNowButtonsOne'),
+    happeningNowTwo: snapshot('pbid-blockFoundHappeningNowButtonsTwo'),
+    happened30: snapshot('pbid-blockHappened30MinAgo'),
+    happened30One: snapshot('pbid-blockHappened30MinAgoButtonsOne'),
+    happened30Two: snapshot('pbid-blockHappened30MinAgoButtonsTwo'),
+    nothingNow: snapshot('pbid-blockNothingHappeningNow'),
+    title: text
+};
 """
 HIDDEN_CLASS = 'ng-hide'
+# Matches the main block whether or not it is still hidden
+MAIN_BLOCK_XPATH = "//div[contains(@class, 'mainBlock')]"
 TIMEOUT = 10
+PAGE_READY_TIMEOUT = CONFIG.PAGE_READY_TIMEOUT  # seconds
+# Resolves (with true) as soon as a mainBlock without the hidden class is on the page, which is when the attendance page
+# has finished loading its state. A MutationObserver is used so that the class changing is noticed straight away rather
+# than polled for. Resolves with false once the timeout has passed
+PAGE_READY_SCRIPT = """
+var hiddenClass = arguments[0];
+var timeout = arguments[1] * 1000;
+var callback = arguments[arguments.length - 1];
+function ready() {
+    var blocks = document.getElementsByClassName('mainBlock');
+    for (var index = 0; index < blocks.length; ++index) {
+        if (!blocks[index].classList.contains(hiddenClass))
+            return true;
+    }
+    return false;
+}
+if (ready()) {
+    callback(true);
+    return;
+}
+var observer = new MutationObserver(function () {
+    if (ready())
+        finish(true);
+});
+var timer = setTimeout(function () { finish(false); }, timeout);
+var finished = false;
+function finish(result) {
+    if (finished)
+        return;
+    finished = true;
+    observer.disconnect();
+    clearTimeout(timer);
+    callback(result);
+}
+observer.observe(document.documentElement, {attributes: true, attributeFilter: ['class'], childList: true, subtree: true});
+"""
+
+BROWSER_POOL_SIZE = CONFIG.BROWSER_POOL_SIZE
+BROWSER_MAX_USES = CONFIG.BROWSER_MAX_USES
+BROWSER_IDLE_TIMEOUT = CONFIG.BROWSER_IDLE_TIMEOUT  # mins
+SESSION_CACHE = CONFIG.SESSION_CACHE
+SIGN_IN_ENGINE = CONFIG.SIGN_IN_ENGINE
+BROWSER = CONFIG.BROWSER
+BROWSER_PROFILE = CONFIG.BROWSER_PROFILE
+BROWSER_ALLOWED_DOMAINS = CONFIG.BROWSER_ALLOWED_DOMAINS
+# A page on the attendance page's domain which doesn't redirect to the login form
+SESSION_RESTORE_URL = urljoin(REGISTER_ATTENDANCE_URL, '/favicon.ico')
+# The timer of every stage of a sign-in, labelled with the stage
+STAGE_TIMER = 'sign_in_stage_seconds'
+# How long (in seconds) the pool remembers that an account was turned away, see BrowserPool.wanted
+WANTED_TTL = 60
+
+logger = logging.getLogger(__name__)
 
 class CannotLoginException(Exception):
     pass
 
-def start_selenium(headless: bool):
+class NoBrowserAvailable(Exception):
+    """Raised when a browser is needed without waiting for one, but every browser in the pool is in use"""
+    pass
+
+def site_domain(url: str) -> str:
+    """
+        Gets the domain of the site that a URL belongs to, such as royalholloway.ac.uk for any of its subdomains
+
+        Args:
+            url: the URL
+
+        Returns:
+            The domain, or the host itself if it is an IP address or has no subdomains
+    """
+    host = urlparse(url).hostname or ''
+    labels = host.split('.')
+    if host.replace('.', '').isdigit() or len(labels) <= 2:
+        return host
+    # Second level domains such as ac.uk and co.uk are part of the site's domain
+    keep = 3 if len(labels[-1]) == 2 and len(labels[-2]) <= 3 else 2
+    return '.'.join(labels[-keep:])
+
+def blocking_pac_url(allowed_domains: Iterable[str]) -> str:
+    """
+        Makes a proxy auto-config script which lets requests to the allowed domains (and their subdomains)
+        through and sends every other request to a closed local port, so that they fail straight away
+
+        Args:
+            allowed_domains: the domains that can be requested
+
+        Returns:
+            The script as a data URL, which both Firefox and Chromium can be given as their PAC URL
+    """
+    script = f"""function FindProxyForURL(url, host) {{
+    var allowed = {json.dumps(sorted(set(allowed_domains)))};
+    for (var index = 0; index < allowed.length; ++index) {{
+        if (host === allowed[index] || dnsDomainIs(host, '.' + allowed[index]))
+            return 'DIRECT';
+    }}
+    return 'PROXY 127.0.0.1:9';
+}}"""
+    return 'data:application/x-ns-proxy-autoconfig;base64,' + base64.b64encode(script.encode('utf-8')).decode('ascii')
+
+class BrowserBackend(ABC):
+    """
+        A browser that selenium can drive, started with one of the PROFILES:
+        - default: the browser's own settings
+        - lean: uses as little memory as possible by not loading images, fonts, media or anything from
+          other sites (apart from BROWSER_ALLOWED_DOMAINS), not caching and limiting the browser to a
+          single content process
+    """
+
+    PROFILES = ('default', 'lean')
+
+    @abstractmethod
+    def options(self, headless: bool, profile: str):
+        """
+            Makes the options that the browser is started with
+
+            Args:
+                headless: whether or not to run it in headless
+                profile: one of PROFILES
+
+            Returns:
+                The selenium options of the browser
+        """
+
+    @abstractmethod
+    def start(self, options):
+        """
+            Starts the browser
+
+            Args:
+                options: the options made by options
+
+            Returns:
+                The selenium browser driver
+        """
+
+class FirefoxBackend(BrowserBackend):
+    """Firefox, driven using geckodriver"""
+
+    # The preferences of the lean profile
+    LEAN_PREFERENCES = {
+        # Images, fonts and media
+        'permissions.default.image': 2,
+        'gfx.downloadable_fonts.enabled': False,
+        'media.autoplay.default': 5,
+        'media.preload.default': 0,
+        'media.preload.auto': 0,
+        'media.peerconnection.enabled': False,
+        # Caches
+        'browser.cache.disk.enable': False,
+        'browser.cache.memory.enable': False,
+        'browser.cache.offline.enable': False,
+        'browser.sessionhistory.max_entries': 2,
+        'browser.sessionstore.resume_from_crash': False,
+        # Extensions and background downloads
+        'xpinstall.enabled': False,
+        'extensions.update.enabled': False,
+        'extensions.pocket.enabled': False,
+        'extensions.screenshots.disabled': True,
+        'browser.safebrowsing.malware.enabled': False,
+        'browser.safebrowsing.phishing.enabled': False,
+        'app.update.enabled': False,
+        'datareporting.policy.dataSubmissionEnabled': False,
+        'toolkit.telemetry.enabled': False,
+        # Prefetching
+        'network.prefetch-next': False,
+        'network.dns.disablePrefetch': True,
+        'network.predictor.enabled': False,
+        'network.http.speculative-parallel-limit': 0,
+        # Content processes
+        'fission.autostart': False,
+        'dom.ipc.processCount': 1,
+        'dom.ipc.processCount.webIsolated': 1,
+    }
+
+    def options(self, headless: bool, profile: str):
+        from selenium.webdriver.firefox.options import Options
+
+        opts = Options()
+        opts.headless = headless
+        if profile == 'lean':
+            for preference, value in self.LEAN_PREFERENCES.items():
+                opts.set_preference(preference, value)
+            opts.set_preference('network.proxy.type', 2)
+            opts.set_preference('network.proxy.autoconfig_url', blocking_pac_url([site_domain(REGISTER_ATTENDANCE_URL), *BROWSER_ALLOWED_DOMAINS]))
+        return opts
+
+    def start(self, options):
+        from selenium.webdriver import Firefox
+
+        return Firefox(options=options)
+
+class ChromiumBackend(BrowserBackend):
+    """Chromium (or Chrome), driven using chromedriver"""
+
+    # The command line switches of the lean profile
+    LEAN_ARGUMENTS = (
+        # Images, fonts and media
+        '--blink-settings=imagesEnabled=false',
+        '--disable-remote-fonts',
+        '--autoplay-policy=user-gesture-required',
+        '--mute-audio',
+        # Caches
+        '--disk-cache-size=1',
+        '--media-cache-size=1',
+        # Extensions and background downloads
+        '--disable-extensions',
+        '--disable-component-extensions-with-background-pages',
+        '--disable-background-networking',
+        '--disable-default-apps',
+        '--disable-sync',
+        '--no-first-run',
+        # Prefetching
+        '--dns-prefetch-disable',
+        # Content processes
+        '--renderer-process-limit=1',
+        '--disable-site-isolation-trials',
+        '--disable-gpu',
+        '--disable-dev-shm-usage',
+    )
+
+    def options(self, headless: bool, profile: str):
+        from selenium.webdriver.chrome.options import Options
+
+        opts = Options()
+        opts.headless = headless
+        if profile == 'lean':
+            for argument in self.LEAN_ARGUMENTS:
+                opts.add_argument(argument)
+            opts.add_argument(f'--proxy-pac-url={blocking_pac_url([site_domain(REGISTER_ATTENDANCE_URL), *BROWSER_ALLOWED_DOMAINS])}')
+            opts.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2, 'net.network_prediction_options': 2})
+        return opts
+
+    def start(self, options):
+        from selenium.webdriver import Chrome
+
+        return Chrome(options=options)
+
+# The browsers that can be chosen with BROWSER
+BROWSER_BACKENDS = {
+    'firefox': FirefoxBackend(),
+    'chromium': ChromiumBackend(),
+}
+
+def start_selenium(headless: bool, browser: str = BROWSER, profile: str = BROWSER_PROFILE):
     """
         Starts an instance of selenium
 
         Args:
             headless: whether or not to run it in headless
+            browser: the browser to start, one of BROWSER_BACKENDS
+            profile: the profile to start the browser with, one of BrowserBackend.PROFILES
+
+        Raises:
+            ValueError: if the browser or profile is unknown
         
         Returns:
             The selenium browser driver
     """
-    opts = Options()
-    opts.headless = headless
+    if browser not in BROWSER_BACKENDS:
+        raise ValueError(f'Unknown browser: {browser}, expected one of {", ".join(BROWSER_BACKENDS)}')
+    if profile not in BrowserBackend.PROFILES:
+        raise ValueError(f'Unknown browser profile: {profile}, expected one of {", ".join(BrowserBackend.PROFILES)}')
+
+    # Selenium's webdriver is imported (by the backend) when it is first needed, as it is slow to import and isn't needed by the http engine
+    backend = BROWSER_BACKENDS[browser]
+    driver = backend.start(backend.options(headless, profile))
+    driver.get(REGISTER_ATTENDANCE_URL)
+    return driver
+
+class PooledBrowser:
+    """
+        A browser kept alive by a BrowserPool
 
-    browser = Firefox(options=opts)
-    browser.get(REGISTER_ATTENDANCE_URL)
-    return browser
+        Attributes:
+            browser: the selenium browser driver
+            key: the account that the browser is logged in as, browsers are never shared between accounts
+            uses: the number of times the browser has been handed out
+            last_used: the monotonic time the browser was last given back to the pool
+    """
+
+    def __init__(self, browser, key: str):
+        self.browser = browser
+        self.key = key
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+class BrowserPool:
+    """
+        A bounded pool of long lived selenium browsers which are handed out to click_button so that a
+        cold browser doesn't have to be started for every sign-in attempt.
+
+        Every browser is started with its own temporary profile and is only ever reused by the account
+        that it was first handed out to, so accounts never share cookies or sessions. A browser is
+        quit once it fails a health check, has been used max_uses times, or has been idle for longer
+        than idle_timeout
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, headless: bool = True, max_uses: int = BROWSER_MAX_USES, idle_timeout: float = BROWSER_IDLE_TIMEOUT):
+        """
+            Constructs a new (empty) pool, browsers are started as they are needed
+
+            Args:
+                size: the maximum number of browsers alive at once
+                headless: whether or not to run the browsers in headless mode
+                max_uses: the number of times a browser is handed out before it is recycled
+                idle_timeout: the minutes a browser can be idle for before it is quit
+        """
+        self.size = size
+        self.headless = headless
+        self.max_uses = max_uses
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        # The number of browsers that are alive (or being started) whether idle or in use
+        self._alive = 0
+        # The (monotonic) time each account was last turned away by acquire, until it gets a browser
+        self._wanted = {}
+        self._condition = threading.Condition()
+
+    def acquire(self, key: str, block: bool = True) -> Union[PooledBrowser, None]:
+        """
+            Hands out a browser that has browsed to the attendance page. Blocks whilst the pool is full
+            and every browser is in use, unless block is False
+
+            Args:
+                key: the account that the browser will be used by
+                block: whether or not to wait for a browser when the pool is full and every browser is in use
+
+            Returns:
+                The pooled browser, which must be given back using release. None if block is False and there wasn't a browser free
+        """
+        evicted = []
+        turned_away = False
+        with self._condition, METRICS.timer(STAGE_TIMER, stage='browser_pool_wait'):
+            evicted += self._reap()
+            while True:
+                pooled = next((idle for idle in self._idle if idle.key == key), None)
+                if pooled is not None:
+                    self._idle.remove(pooled)
+                    break
+                if self._alive < self.size:
+                    self._alive += 1
+                    break
+                if len(self._idle):
+                    # Make room by quitting the least recently used browser of another account
+                    evicted.append(min(self._idle, key=lambda idle: idle.last_used))
+                    self._idle.remove(evicted[-1])
+                    self._alive -= 1
+                    continue
+                if not block:
+                    self._wanted[key] = time.monotonic()
+                    turned_away = True
+                    break
+                self._condition.wait()
+            if not turned_away:
+                self._wanted.pop(key, None)
+        # Quitting can be slow, so it is done without holding up the other threads using the pool
+        self._quit(evicted)
+        if turned_away:
+            return None
+
+        if pooled is not None:
+            try:
+                # Browsing back to the attendance page doubles as a health check
+                with METRICS.timer(STAGE_TIMER, stage='browser_health_check'):
+                    pooled.browser.get(REGISTER_ATTENDANCE_URL)
+                return pooled
+            except WebDriverException:
+                self._quit([pooled])
 
-def print_attr_elements(browser, elements: Iterable[WebElement]):
+        try:
+            with METRICS.timer(STAGE_TIMER, stage='browser_launch'):
+                return PooledBrowser(start_selenium(self.headless), key)
+        except Exception:
+            with self._condition:
+                self._alive -= 1
+                self._condition.notify()
+            raise
+
+    def release(self, pooled: PooledBrowser, healthy: bool = True):
+        """
+            Gives a browser back to the pool
+
+            Args:
+                pooled: the browser handed out by acquire
+                healthy: whether or not the browser can be reused
+        """
+        pooled.uses += 1
+        pooled.last_used = time.monotonic()
+        retire = not healthy or pooled.uses >= self.max_uses
+        with self._condition:
+            if retire:
+                self._alive -= 1
+            else:
+                self._idle.append(pooled)
+            self._condition.notify()
+        if retire:
+            self._quit([pooled])
+
+    def wanted(self, key: str) -> bool:
+        """
+            Checks whether another account was turned away (by a non-blocking acquire) within the last WANTED_TTL
+            seconds and hasn't had a browser since, in which case browsers being held between uses should be given back
+
+            Args:
+                key: the account asking, which doesn't count itself
+
+            Returns:
+                True if another account is waiting for a browser, otherwise False
+        """
+        now = time.monotonic()
+        with self._condition:
+            return any(other != key and now - turned_away < WANTED_TTL for other, turned_away in self._wanted.items())
+
+    @contextmanager
+    def browser(self, key: str, block: bool = True):
+        """
+            Borrows a browser for the duration of a with block. The browser is retired if the block raises
+
+            Args:
+                key: the account that the browser will be used by
+                block: whether or not to wait for a browser when every browser is in use
+
+            Raises:
+                NoBrowserAvailable: if block is False and every browser is in use
+        """
+        pooled = self.acquire(key, block)
+        if pooled is None:
+            raise NoBrowserAvailable('Every browser in the pool is in use')
+        healthy = False
+        try:
+            yield pooled.browser
+            healthy = True
+        finally:
+            self.release(pooled, healthy)
+
+    def reap(self):
+        """Quits every browser that has been idle for longer than the idle timeout"""
+        with self._condition:
+            reaped = self._reap()
+        self._quit(reaped)
+
+    def close(self):
+        """Quits every idle browser"""
+        with self._condition:
+            idle = self._idle
+            self._idle = []
+            self._alive -= len(idle)
+            self._condition.notify_all()
+        self._quit(idle)
+
+    def _reap(self) -> list:
+        """
+            Removes the browsers that have been idle for too long from the pool, the lock must be held
+
+            Returns:
+                The removed browsers, which need to be quit
+        """
+        now = time.monotonic()
+        reaped = [idle for idle in self._idle if now - idle.last_used >= self.idle_timeout * 60]
+        for idle in reaped:
+            self._idle.remove(idle)
+        self._alive -= len(reaped)
+        if len(reaped):
+            self._condition.notify_all()
+        return reaped
+
+    @staticmethod
+    def _quit(pooled_browsers: list):
+        """
+            Quits the given browsers, ignoring ones that have already died
+
+            Args:
+                pooled_browsers: the browsers to quit
+        """
+        for pooled in pooled_browsers:
+            try:
+                pooled.browser.quit()
+            except WebDriverException:
+                pass
+
+def course_matches(course_name: str, course_id: str = None, search_params: list = None) -> bool:
     """
-        Prints all the html attributes in a given list of WebElement
+        Checks whether the course shown on the attendance page is the one that should be signed into
+
+        Args:
+            course_name: the first word of the course title on the attendance page
+            course_id: the course ID to check sign in for. If None will match all course titles
+            search_params: the search params of the calendar the event is from
+
+        Returns:
+            True if the course should be signed into, otherwise False
+    """
+    return course_id is None or course_id.lower() in course_name.lower() or \
+        (search_params is not None and any([param.lower() in course_id for param in search_params]))
+
+def print_attr_elements(browser, elements: Iterable['WebElement']):
+    """
+        Logs all the html attributes in a given list of WebElement
 
         Args:
             browser: the selenium browser driver
             elements: the elements to print the attributes of
     """
     for element in elements:
-        print(f'{element.tag_name}: {browser.execute_script(GET_ATTR_SCRIPT, element)}')
+        logger.info(f'{element.tag_name}: {browser.execute_script(GET_ATTR_SCRIPT, element)}')
 
-def click_button(email: str, password: str, headless: bool = True, verbose: bool = False, course_id: str = None, search_params: list = None) -> bool:
+def click_button(email: str, password: str, headless: bool = True, verbose: bool = False, course_id: str = None, search_params: list = None, pool: 'BrowserPool' = None, block: bool = True) -> bool:
     """
-        Uses selenium to browse to attendance page and check whether there are any attendance buttons to click
+        Uses selenium to browse to attendance page and check whether there are any attendance buttons to click.
+
+        If SIGN_IN_ENGINE is "http" then the HTTP engine is tried first, with selenium as the fallback
 
         Args:
             email: the email to login to campus connect with
@@ -67,133 +569,410 @@ def click_button(email: str, password: str, headless: bool = True, verbose: bool
             headless: whether or not to run selenium in headless mode
             verbose: whether or not to display info (usually regarding scraped elements)
             course_id: the course ID to check sign in for. If None will match all course titles
+            pool: the pool to borrow a browser from. If None a browser is started just for this attempt
+            block: whether or not to wait for a browser from the pool when every browser is in use
 
         Raises:
             CannotLoginException: if the campus connect login was incorrect or could not be found
+            NoBrowserAvailable: if block is False and every browser in the pool is in use
         
         Returns:
             True if the button was clicked otherwise False (button could not be clicked, no buttons were found, etc...)
     """
 
-    browser = start_selenium(headless)
-
+    if SIGN_IN_ENGINE == 'http':
+        # Imported here as the HTTP engine uses parts of this module
+        from http_registration import HttpEngineUnavailable, click_button as http_click_button
+        try:
+            with METRICS.timer(STAGE_TIMER, stage='http_sign_in'):
+                return http_click_button(email, password, verbose=verbose, course_id=course_id, search_params=search_params)
+        except HttpEngineUnavailable as e:
+            METRICS.inc('http_fallbacks_total')
+            logger.warning(f'{e}, falling back to selenium...')
+
+    if pool is not None:
+        with pool.browser(email, block) as browser:
+            return _click_button(browser, email, password, verbose, course_id, search_params)
+
+    with METRICS.timer(STAGE_TIMER, stage='browser_launch'):
+        browser = start_selenium(headless)
     try:
-        email_form = WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'userNameInput')))
-        password_form = WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'passwordInput')))
-        submit_button = WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'submitButton')))
+        return _click_button(browser, email, password, verbose, course_id, search_params)
+    finally:
+        browser.close()
 
-        if verbose:
-            print('Found login form:')
-            print_attr_elements(browser, [email_form, password_form, submit_button])
+class SignInSession:
+    """
+        Logs into the attendance page ahead of a sign-in, so that when the sign-in is due only a refresh of
+        the page and a click are needed rather than starting a browser and logging in. A session can be
+        clicked with any number of times, so retries don't have to log in again either.
 
-        email_form.send_keys(email)
-        password_form.send_keys(password)
-        submit_button.click()
+        With the selenium engine a browser is borrowed from the pool, logged in and then left on the
+        attendance page between clicks (until the session is closed). With the http engine the account's
+        HTTP session is logged in. A session that couldn't be opened falls back to click_button
 
-        # A new cookies button was added on 28/02/2022
-        try:
-            no_button = WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'noThanksBtn')))
-            if verbose:
-                print('Found cookies prompt. Clicking no...')
-            no_button.click()
-        except TimeoutException:
-            if verbose:
-                print('Assuming there is no cookies prompt...')
+        Attributes:
+            email: the email to login to campus connect with
+            password: the password to login to campus connect with
+            headless: whether or not to run selenium in headless mode
+            verbose: whether or not to display info
+            pool: the pool to borrow a browser from. If None a browser is started just for this session
+            browser: the logged in selenium browser driver, None if there isn't one
+    """
 
-        # Wait until an element with the classes pb-block and mainBlock is found (this is because when the page is loaded both divs have classes 'pb-block ng-hide mainBlock')
-        # Recently the sign-in page has been very slow so we'll wait for a bit
-        tries = 7
-        while True:
-            tries -= 1
+    def __init__(self, email: str, password: str, headless: bool = True, verbose: bool = False, pool: BrowserPool = None):
+        self.email = email
+        self.password = password
+        self.headless = headless
+        self.verbose = verbose
+        self.pool = pool
+        self.browser = None
+        self._pooled = None
+
+    def open(self) -> bool:
+        """
+            Logs in, an account's sign-ins must not run whilst its session is being opened. With the http engine
+            a browser is logged in instead if the HTTP login can't be used, like click_button
+
+            Raises:
+                CannotLoginException: if the campus connect login was incorrect or could not be found
+
+            Returns:
+                True if the session was logged in, False if there wasn't a free browser to log in with
+        """
+        if SIGN_IN_ENGINE == 'http':
+            from http_registration import HttpEngineUnavailable, get_session, login as http_login
             try:
-                if verbose:
-                    print(f'Trying to find mainBlock again. Tries: {tries}')
-                WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.XPATH, "//div[@class='pb-block mainBlock']")))
-            except TimeoutException:
-                if verbose:
-                    print(f'Could not find main block {"trying again" if tries else "no tries left"}')
-                if not tries:
-                    raise TimeoutException
-                continue
+                with METRICS.timer(STAGE_TIMER, stage='session_open'):
+                    http_login(get_session(self.email, self.password), self.email, self.password, self.verbose)
+                return True
+            except HttpEngineUnavailable as e:
+                METRICS.inc('http_fallbacks_total')
+                logger.warning(f'{e}, falling back to selenium...')
+
+        with METRICS.timer(STAGE_TIMER, stage='session_open'):
+            if self.pool is not None:
+                # Waiting for a browser would hold up the sign-ins of the accounts that have them
+                self._pooled = self.pool.acquire(self.email, block=False)
+                if self._pooled is None:
+                    return False
+                self.browser = self._pooled.browser
             else:
-                break
+                with METRICS.timer(STAGE_TIMER, stage='browser_launch'):
+                    self.browser = start_selenium(self.headless)
+            try:
+                login(self.browser, self.email, self.password, self.verbose)
+            except Exception:
+                self.close(healthy=False)
+                raise
+        return True
+
+    def click(self, course_id: str = None, search_params: list = None) -> bool:
+        """
+            Refreshes the attendance page and clicks the attendance button, see click_button. The login form
+            is only used again if the session has expired
+
+            Args:
+                course_id: the course ID to check sign in for. If None will match all course titles
+                search_params: the search params of the calendar the event is from
+
+            Raises:
+                CannotLoginException: if the campus connect login was incorrect or could not be found
+                NoBrowserAvailable: if the session doesn't have a browser (such as with the http engine falling back
+                    to selenium) and every browser in the pool is in use. Like open, a session never waits for a browser
+
+            Returns:
+                True if the button was clicked otherwise False
+        """
+        if self.browser is None:
+            return click_button(self.email, self.password, self.headless, self.verbose, course_id, search_params, self.pool, block=False)
+
+        try:
+            with METRICS.timer(STAGE_TIMER, stage='refresh'):
+                self.browser.get(REGISTER_ATTENDANCE_URL)
+            return _click_button(self.browser, self.email, self.password, self.verbose, course_id, search_params)
+        except Exception:
+            self.close(healthy=False)
+            raise
+
+    def close(self, healthy: bool = True):
+        """
+            Gives the browser back to the pool (or quits it), the session can still be clicked with afterwards
+            but falls back to click_button
+
+            Args:
+                healthy: whether or not the browser can be reused
+        """
+        browser, pooled = self.browser, self._pooled
+        self.browser = self._pooled = None
+        if pooled is not None:
+            self.pool.release(pooled, healthy)
+        elif browser is not None:
+            try:
+                browser.quit()
+            except WebDriverException:
+                pass
+
+def login(browser, email: str, password: str, verbose: bool = False):
+    """
+        Logs into campus connect and waits for the attendance page to load. If the browser is still
+        logged in from a previous attempt, or the account's saved session hasn't expired, then the
+        login form is skipped
+
+        Args:
+            browser: the selenium browser driver, which has browsed to the attendance page
+            email: the email to login to campus connect with
+            password: the password to login to campus connect with
+            verbose: whether or not to display info (usually regarding scraped elements)
+
+        Raises:
+            CannotLoginException: if the campus connect login was incorrect or could not be found
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    used_form = False
+    try:
+        with METRICS.timer(STAGE_TIMER, stage='page_load'):
+            on_login_form = _wait_for_login_form(browser)
+        if on_login_form and SESSION_CACHE:
+            with METRICS.timer(STAGE_TIMER, stage='session_restore'):
+                if restore_session(browser, email, password, verbose):
+                    on_login_form = _wait_for_login_form(browser)
+                    if on_login_form:
+                        # The saved session has expired, so it isn't restored again before the next login saves a new one
+                        clear_session(email)
+                    if verbose:
+                        logger.info('Saved session has expired...' if on_login_form else 'Logged in using saved session, skipping login form...')
+
+        if on_login_form:
+            used_form = True
+            with METRICS.timer(STAGE_TIMER, stage='login_form'):
+                email_form = WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'userNameInput')))
+                password_form = WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'passwordInput')))
+                submit_button = WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'submitButton')))
+
+                if verbose:
+                    logger.info('Found login form:')
+                    print_attr_elements(browser, [email_form, password_form, submit_button])
+
+                email_form.send_keys(email)
+                password_form.send_keys(password)
+                submit_button.click()
+
+                # A new cookies button was added on 28/02/2022
+                try:
+                    no_button = WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'noThanksBtn')))
+                    if verbose:
+                        logger.info('Found cookies prompt. Clicking no...')
+                    no_button.click()
+                except TimeoutException:
+                    if verbose:
+                        logger.info('Assuming there is no cookies prompt...')
+        elif verbose:
+            logger.info('Still logged in, skipping login form...')
+
+        # When the page is loaded the main block has the classes 'pb-block ng-hide mainBlock', ng-hide is removed once it is ready
+        with METRICS.timer(STAGE_TIMER, stage='main_block_wait'):
+            wait_until_ready(browser, PAGE_READY_TIMEOUT, verbose)
     except (NoSuchElementException, TimeoutException):
-        browser.close()
         raise CannotLoginException('Cannot login to Campus Connect. This could be due to factors other than an incorrect login')
 
+    if SESSION_CACHE and used_form:
+        save_session(email, password, browser.get_cookies())
 
-    happening_now_div = browser.find_element(By.ID, 'pbid-blockFoundHappeningNow')
-    happened_before_div = browser.find_element(By.ID, 'pbid-blockHappened30MinAgo')
-    nothing_now_div = browser.find_element(By.ID, 'pbid-blockNothingHappeningNow')
+def wait_until_ready(browser, timeout: float = PAGE_READY_TIMEOUT, verbose: bool = False):
+    """
+        Waits until the attendance page has loaded its state, which is when the main block is no longer hidden
 
+        Args:
+            browser: the selenium browser driver
+            timeout: the maximum seconds to wait
+            verbose: whether or not to display info
+
+        Raises:
+            TimeoutException: if the page was not ready in time
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # The script resolves itself at the deadline, the driver's timeout is only a backstop
+        browser.set_script_timeout(remaining + TIMEOUT)
+        try:
+            if browser.execute_async_script(PAGE_READY_SCRIPT, HIDDEN_CLASS, remaining):
+                return
+            break
+        except JavascriptException:
+            # The page navigated (such as a redirect after logging in) whilst waiting, so wait on the new page
+            if verbose:
+                logger.info('Page changed whilst waiting for mainBlock, waiting again...')
+            # Give the new page a moment to start loading, so that a page which keeps erroring isn't hammered
+            time.sleep(min(0.1, max(deadline - time.monotonic(), 0)))
     if verbose:
-        print('\nFound sign-in blocks:')
-        print_attr_elements(browser, [happening_now_div, happened_before_div, nothing_now_div])
+        logger.info(f'Could not find main block within {timeout} seconds')
+    raise TimeoutException(f'The attendance page was not ready within {timeout} seconds')
 
+def _wait_for_login_form(browser) -> bool:
+    """
+        Waits for either the login form or the attendance page (when the browser is already logged in) to load
 
-    button_id = None
-    one_button = None
-    two_buttons = None
+        Args:
+            browser: the selenium browser driver
 
-    try:
-        # Check if happening now div is hidden
-        if HIDDEN_CLASS not in happening_now_div.get_attribute('class'):
-            # Find the buttons (can either be one or two)
-            one_button = happening_now_div.find_element(By.ID, 'pbid-blockFoundHappeningNowButtonsOne')
-            two_buttons = happening_now_div.find_element(By.ID, 'pbid-blockFoundHappeningNowButtonsTwo')
-
-            # Get the course ID
-            course_name = happening_now_div.find_element(By.ID, 'pbid-literalHappeningNowTitle')
-            course_name = browser.execute_script(GET_TEXT_SCRIPT, course_name).split(' ')[0]
-
-            if course_id is None or course_id.lower() in course_name.lower() or \
-               (search_params is not None and any([param.lower() in course_id for param in search_params])):
-                if verbose:
-                    print('\nHappening now is not hidden:')
-                    print_attr_elements(browser, [one_button, two_buttons])
-
-                # Assign button id to the button nested inside the non-hidden element
-                button_id = CONFIG.BUTTON_ONE_ID if HIDDEN_CLASS not in one_button.get_attribute('class') else CONFIG.BUTTON_TWO_ID
-            elif verbose:
-                print('Found block but of the wrong course ID')
-        else:
-            # Try the Forgetting Something section
-            if verbose: print('\nHappening now is hidden, checking happened 30 min ago...')
-            raise ElementClickInterceptedException()
-    except ElementClickInterceptedException:
-        # The button may have been moved to the 'Forgetting Something' section
-        if HIDDEN_CLASS not in happened_before_div.get_attribute('class'):
-            WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, "pbid-blockHappened30MinAgoButtonsOne")))
-
-            one_button = happened_before_div.find_element(By.ID, 'pbid-blockHappened30MinAgoButtonsOne')
-            two_buttons = happened_before_div.find_element(By.ID, 'pbid-blockHappened30MinAgoButtonsTwo')
+        Raises:
+            TimeoutException: if neither loaded
+
+        Returns:
+            True if the login form loaded, otherwise False
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    WebDriverWait(browser, TIMEOUT).until(EC.any_of(EC.presence_of_element_located((By.ID, 'userNameInput')),
+                                                    EC.presence_of_element_located((By.XPATH, MAIN_BLOCK_XPATH))))
+    return bool(len(browser.find_elements(By.ID, 'userNameInput')))
+
+def restore_session(browser, email: str, password: str, verbose: bool = False) -> bool:
+    """
+        Adds the cookies of the account's saved session to the browser and browses back to the attendance page
+
+        Args:
+            browser: the selenium browser driver
+            email: the email of the account
+            password: the password of the account, which the saved session is encrypted with
+            verbose: whether or not to display info
+
+        Returns:
+            True if there was a saved session to restore, otherwise False
+    """
+    cookies = load_session(email, password)
+    if cookies is None:
+        return False
 
+    if verbose:
+        logger.info(f'Restoring saved session ({len(cookies)} cookies)...')
+    # Cookies can only be added to the domain that the browser is on, and most pages on it redirect to the login form
+    browser.get(SESSION_RESTORE_URL)
+    for cookie in cookies:
+        try:
+            browser.add_cookie(cookie)
+        except WebDriverException:
+            pass
+    browser.get(REGISTER_ATTENDANCE_URL)
+    return True
+
+def choose_button(snapshot: dict, course_id: str = None, search_params: list = None, verbose: bool = False) -> Union[str, None]:
+    """
+        Decides which button should be clicked from a snapshot of the attendance page
+
+        Args:
+            snapshot: the snapshot of the page taken by SNAPSHOT_SCRIPT
+            course_id: the course ID to check sign in for. If None will match all course titles
+            search_params: the search params of the calendar the event is from
+            verbose: whether or not to display info (usually regarding scraped elements)
+
+        Raises:
+            NoSuchElementException: if the sign-in blocks are not on the page
+
+        Returns:
+            The ID of the button to click, or None if there isn't one
+    """
+    blocks = ('happeningNow', 'happened30', 'nothingNow')
+    if any(snapshot[block] is None for block in blocks):
+        raise NoSuchElementException(f'Could not find the sign-in blocks: {", ".join(block for block in blocks if snapshot[block] is None)}')
+
+    if verbose:
+        logger.info('Found sign-in blocks:')
+        print_attr_snapshots(snapshot, blocks)
+
+    # Check if happening now div is hidden
+    if not snapshot['happeningNow']['hidden']:
+        # Find the buttons (can either be one or two)
+        if snapshot['happeningNowOne'] is None or snapshot['happeningNowTwo'] is None:
+            if verbose:
+                logger.info('Found block but not its buttons')
+            return None
+
+        # Get the course ID
+        if not course_matches(snapshot['title'].split(' ')[0], course_id, search_params):
             if verbose:
-                print('\nHappened 30 min ago is not hidden:')
-                print_attr_elements(browser, [one_button, two_buttons])
+                logger.info('Found block but of the wrong course ID')
+            return None
+
+        if verbose:
+            logger.info('Happening now is not hidden:')
+            print_attr_snapshots(snapshot, ('happeningNowOne', 'happeningNowTwo'))
+        # Assign button id to the button nested inside the non-hidden element
+        return CONFIG.BUTTON_ONE_ID if not snapshot['happeningNowOne']['hidden'] else CONFIG.BUTTON_TWO_ID
+
+    # The button may have been moved to the 'Forgetting Something' section
+    if verbose:
+        logger.info('Happening now is hidden, checking happened 30 min ago...')
+    if snapshot['happened30']['hidden'] or snapshot['happened30One'] is None or snapshot['happened30Two'] is None:
+        return None
 
-            button_id = CONFIG.BUTTON_30_ONE_ID if HIDDEN_CLASS not in one_button.get_attribute('class') else CONFIG.BUTTON_30_TWO_ID
-    except TimeoutException:
-        # One of the elements could not be found so continue and return False
-        pass
+    if verbose:
+        logger.info('Happened 30 min ago is not hidden:')
+        print_attr_snapshots(snapshot, ('happened30One', 'happened30Two'))
+    return CONFIG.BUTTON_30_ONE_ID if not snapshot['happened30One']['hidden'] else CONFIG.BUTTON_30_TWO_ID
+
+def print_attr_snapshots(snapshot: dict, names: Iterable[str]):
+    """
+        Logs the html attributes of elements within a snapshot of the page
 
+        Args:
+            snapshot: the snapshot of the page taken by SNAPSHOT_SCRIPT
+            names: the names of the elements within the snapshot to print
+    """
+    for name in names:
+        logger.info(f'{name}: {snapshot[name]["attributes"] if snapshot[name] is not None else None}')
+
+def _click_button(browser, email: str, password: str, verbose: bool, course_id: str, search_params: list) -> bool:
+    """
+        Logs in and clicks the attendance button using the given browser, see click_button
+
+        Returns:
+            True if the button was clicked otherwise False
+    """
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+
+    login(browser, email, password, verbose)
+
+    with METRICS.timer(STAGE_TIMER, stage='find_button'):
+        snapshot = browser.execute_script(SNAPSHOT_SCRIPT, HIDDEN_CLASS)
+        happening_now, happened_30 = snapshot['happeningNow'], snapshot['happened30']
+        if happening_now is not None and happening_now['hidden'] and happened_30 is not None and not happened_30['hidden'] and snapshot['happened30One'] is None:
+            # The buttons of the 'Forgetting Something' section can load after the section itself
+            try:
+                WebDriverWait(browser, TIMEOUT).until(EC.presence_of_element_located((By.ID, 'pbid-blockHappened30MinAgoButtonsOne')))
+                snapshot = browser.execute_script(SNAPSHOT_SCRIPT, HIDDEN_CLASS)
+            except TimeoutException:
+                pass
+        button_id = choose_button(snapshot, course_id, search_params, verbose)
 
     button = None
     if button_id is not None:
         try:
-            button = WebDriverWait(browser, TIMEOUT).until(EC.element_to_be_clickable((By.ID, button_id)))
-            # Finally click the button if found
-            button.click()
+            with METRICS.timer(STAGE_TIMER, stage='click'):
+                button = WebDriverWait(browser, TIMEOUT).until(EC.element_to_be_clickable((By.ID, button_id)))
+                # Finally click the button if found
+                button.click()
         except TimeoutException:
             # One of the elements could not be found so continue and return False
             pass
     elif verbose:
-        print('Button not found')
+        logger.info('Button not found')
 
-    browser.close()
-    
     return button is not None
 
 if __name__ == '__main__':
     headless = '--headless' in sys.argv
+    listener = setup_logging()
     print('Pressed button' if click_button(input('Enter email: '), input('Enter password: '), verbose=True, headless=headless) else 'Button not pressed')
+    listener.stop()
@@ -0,0 +1,44 @@
+import datetime
+import os
+import sys
+import pytest
+
+# The tests import the bot's modules from the program directory, like the benchmark does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from benchmark.fake_calendar import FakeCalendarService, make_event
+from utils.clock import get_clock, set_clock
+
+CALENDAR_ID = 'calendar@example.com'
+
+@pytest.fixture
+def now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+
+@pytest.fixture
+def service(now: datetime.datetime) -> FakeCalendarService:
+    """A fake calendar with a lecture today and one tomorrow"""
+    hour = datetime.timedelta(hours=1)
+    return FakeCalendarService({CALENDAR_ID: ('Timetable', [
+        make_event('today', 'CS1840 Lecture', now + hour, now + 2 * hour),
+        make_event('tomorrow', 'CS1860 Lecture', now + 25 * hour, now + 26 * hour),
+    ])})
+
+@pytest.fixture
+def cache_path(tmp_path, monkeypatch) -> str:
+    """Points the cache at a temporary directory so that the real cache is left alone"""
+    import google_calendar
+    monkeypatch.setattr(google_calendar, 'get_cache_path', lambda filename: str(tmp_path / filename))
+    return str(tmp_path)
+
+@pytest.fixture
+def restore_clock():
+    """Puts the clock back after a test that sets its own"""
+    clock = get_clock()
+    yield
+    set_clock(clock)
+
+@pytest.fixture
+def info() -> dict:
+    """The info of a calendar, as it is saved by the bot"""
+    return {'calendarSummary': 'Timetable', 'calendarId': CALENDAR_ID, 'search_params': ['cs'], 'username': 'student@example.com', 'password': 'password'}
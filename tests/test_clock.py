@@ -0,0 +1,47 @@
+import datetime
+import threading
+import time
+import pytest
+from utils.clock import Clock, VirtualClock
+
+def test_clock_is_abstract():
+    with pytest.raises(TypeError):
+        Clock()
+
+def test_virtual_clock_runs_faster_than_real_time():
+    start = datetime.datetime(2022, 10, 3, 9, tzinfo=datetime.timezone.utc).timestamp()
+    clock = VirtualClock(start, 1000)
+    assert start <= clock.time() < start + 60
+    time.sleep(0.05)
+    # 0.05 real seconds is 50 virtual seconds
+    assert 50 <= clock.monotonic() < 1000
+    assert clock.now(datetime.timezone.utc) >= datetime.datetime(2022, 10, 3, 9, 0, 50, tzinfo=datetime.timezone.utc)
+
+def test_virtual_clock_sleep():
+    clock = VirtualClock(time.time(), 1000)
+    before, real_before = clock.monotonic(), time.monotonic()
+    clock.sleep(100)
+    assert clock.monotonic() - before >= 100
+    assert time.monotonic() - real_before < 1
+
+def test_virtual_clock_wait_times_out():
+    clock = VirtualClock(time.time(), 1000)
+    condition = threading.Condition()
+    before = clock.monotonic()
+    with condition:
+        assert clock.wait(condition, 100) is False
+    assert clock.monotonic() - before >= 100
+
+def test_virtual_clock_wait_wakes_when_notified():
+    clock = VirtualClock(time.time(), 1)
+    condition = threading.Condition()
+    def notify():
+        time.sleep(0.05)
+        with condition:
+            condition.notify_all()
+    threading.Thread(target=notify, daemon=True).start()
+    real_before = time.monotonic()
+    with condition:
+        # Woken well before the (virtual and real) minute is up
+        assert clock.wait(condition, 60) is True
+    assert time.monotonic() - real_before < 5
@@ -0,0 +1,11 @@
+import datetime
+from utils.event import Event, get_timezone
+
+def test_events_are_equal_and_hash_alike_when_unchanged(now):
+    event = Event('lecture', 'CS1840 Lecture', now, now + datetime.timedelta(hours=1))
+    # The same times in another timezone are the same times
+    same = Event('lecture', 'CS1840 Lecture', now, now + datetime.timedelta(hours=1), get_timezone('Europe/London'))
+    moved = Event('lecture', 'CS1840 Lecture', now + datetime.timedelta(hours=1), now + datetime.timedelta(hours=2))
+    assert event == same and hash(event) == hash(same)
+    assert event != moved
+    assert len({event, same, moved}) == 2
@@ -0,0 +1,80 @@
+import datetime
+import pytest
+from conftest import CALENDAR_ID
+from benchmark.fake_calendar import make_event
+from google_calendar import CalendarAPI
+from utils.clock import VirtualClock, set_clock
+from utils.event_store import EventStore
+
+@pytest.fixture
+def calendar_api(service, cache_path):
+    calendar_api = CalendarAPI(service)
+    yield calendar_api
+    calendar_api.event_store.close()
+
+def stored_ids(calendar_api: CalendarAPI) -> list:
+    return [event['id'] for event in calendar_api.event_store.between(CALENDAR_ID, float('-inf'), float('inf'))]
+
+def test_full_sync_stores_events_and_sync_token(calendar_api, service):
+    calendar_api.sync(CALENDAR_ID)
+    assert stored_ids(calendar_api) == ['today', 'tomorrow']
+    assert calendar_api.event_store.get_sync_token(CALENDAR_ID) is not None
+    assert service.calls['events.list'] == 1
+
+def test_incremental_sync_only_fetches_changes(calendar_api, service, now):
+    calendar_api.sync(CALENDAR_ID)
+    service.change_event(CALENDAR_ID, make_event('later', 'CS1870 Lecture', now + datetime.timedelta(hours=3), now + datetime.timedelta(hours=4)))
+    calendar_api.sync(CALENDAR_ID)
+    assert stored_ids(calendar_api) == ['today', 'later', 'tomorrow']
+    assert service.calls['events.list'] == 2
+
+def test_cancelled_events_are_removed(calendar_api, service):
+    calendar_api.sync(CALENDAR_ID)
+    cancelled = dict(service.calendars[CALENDAR_ID][1][0], status='cancelled')
+    service.change_event(CALENDAR_ID, cancelled)
+    calendar_api.sync(CALENDAR_ID)
+    assert stored_ids(calendar_api) == ['tomorrow']
+
+def test_expired_sync_token_does_full_sync(calendar_api, service, now):
+    calendar_api.sync(CALENDAR_ID)
+    expired_token = calendar_api.event_store.get_sync_token(CALENDAR_ID)
+    service.expire_sync_tokens()
+    # Changed whilst the token was expired, so only a full sync finds it
+    service.change_event(CALENDAR_ID, make_event('later', 'CS1870 Lecture', now + datetime.timedelta(hours=3), now + datetime.timedelta(hours=4)))
+    calendar_api.sync(CALENDAR_ID)
+    assert stored_ids(calendar_api) == ['today', 'later', 'tomorrow']
+    assert calendar_api.event_store.get_sync_token(CALENDAR_ID) != expired_token
+    # The failed incremental sync and the full sync
+    assert service.calls['events.list'] == 3
+
+def test_sync_prunes_ended_events(calendar_api, service, now, restore_clock):
+    calendar_api.sync(CALENDAR_ID)
+    # Once today's lecture ended over SYNC_HISTORY ago it is pruned, even though it didn't change
+    set_clock(VirtualClock((now + datetime.timedelta(hours=26)).timestamp(), 1))
+    calendar_api.sync(CALENDAR_ID)
+    assert stored_ids(calendar_api) == ['tomorrow']
+
+def test_prune(tmp_path, now):
+    event_store = EventStore(str(tmp_path / 'events.sqlite3'))
+    hour = datetime.timedelta(hours=1)
+    event_store.apply(CALENDAR_ID, [make_event('ended', 'CS1840 Lecture', now - 2 * hour, now - hour),
+                                    make_event('ending', 'CS1860 Lecture', now - hour, now + hour)], 'token', full=True)
+    event_store.prune(now.timestamp())
+    assert [event['id'] for event in event_store.between(CALENDAR_ID, float('-inf'), float('inf'))] == ['ending']
+    event_store.close()
+
+def test_sync_token_is_reused_after_restart(service, cache_path, now):
+    calendar_api = CalendarAPI(service)
+    calendar_api.sync(CALENDAR_ID)
+    sync_token = calendar_api.event_store.get_sync_token(CALENDAR_ID)
+    calendar_api.event_store.close()
+    service.change_event(CALENDAR_ID, make_event('later', 'CS1870 Lecture', now + datetime.timedelta(hours=3), now + datetime.timedelta(hours=4)))
+
+    requests = []
+    list_events = service._list_events
+    service._list_events = lambda kwargs: requests.append(kwargs) or list_events(kwargs)
+    calendar_api = CalendarAPI(service)
+    calendar_api.sync(CALENDAR_ID)
+    assert requests[0].get('syncToken') == sync_token
+    assert stored_ids(calendar_api) == ['today', 'later', 'tomorrow']
+    calendar_api.event_store.close()
@@ -0,0 +1,19 @@
+from google_calendar import compile_search_params
+
+def test_empty_search_params_match_everything():
+    matches = compile_search_params([])
+    assert matches({'summary': 'CS1840 Lecture'})
+    assert matches({})
+
+def test_search_params_match_summary_or_description():
+    matches = compile_search_params(['cs1840', 'lab'])
+    assert matches({'summary': 'CS1840 Lecture'})
+    assert matches({'summary': 'Practical', 'description': 'In the LAB'})
+    assert not matches({'summary': 'CS1860 Lecture', 'description': 'Bedford Square'})
+
+def test_search_params_are_not_regexes():
+    matches = compile_search_params(['c++', '(room 1.01)'])
+    assert matches({'summary': 'Intro to C++'})
+    assert matches({'summary': 'Seminar', 'description': 'Tutorial (Room 1.01)'})
+    # Unescaped, . and + would match these
+    assert not matches({'summary': 'cc Lecture', 'description': 'room 1x01'})
@@ -0,0 +1,50 @@
+import time
+import pytest
+import http_registration
+from benchmark.attendance_page import AttendancePage, Lecture
+from http_registration import HttpEngineUnavailable, click_button
+from registration import CannotLoginException
+
+EMAIL = 'student@example.com'
+PASSWORD = 'password'
+
+@pytest.fixture
+def lecture() -> Lecture:
+    return Lecture(EMAIL, 'CS1840 Lecture', time.time() - 60, time.time() + 3600)
+
+@pytest.fixture
+def page(lecture, monkeypatch):
+    """The mock attendance page, with the http engine pointed at it"""
+    page = AttendancePage({EMAIL: PASSWORD}, [lecture])
+    page.start()
+    monkeypatch.setattr(http_registration, 'REGISTER_ATTENDANCE_URL', page.url)
+    monkeypatch.setattr(http_registration, 'HTTP_STATE_URL', 'api/state')
+    monkeypatch.setattr(http_registration, 'HTTP_REGISTER_URL', 'api/register')
+    monkeypatch.setattr(http_registration, 'SESSION_CACHE', False)
+    # Every test logs in with a new session
+    monkeypatch.setattr(http_registration, '_sessions', type(http_registration._sessions)())
+    yield page
+    page.close()
+
+def test_click_button_registers_attendance(page, lecture):
+    assert click_button(EMAIL, PASSWORD, course_id='cs1840')
+    assert lecture.engine == 'http'
+
+def test_click_button_without_a_matching_record(page, lecture):
+    assert not click_button(EMAIL, PASSWORD, course_id='cs1860')
+    assert lecture.registered is None
+
+def test_register_response_has_to_say_it_registered(page, lecture, monkeypatch):
+    # The button's form redirects back to the attendance page, which is a successful response that isn't JSON
+    monkeypatch.setattr(http_registration, 'HTTP_REGISTER_URL', 'register')
+    with pytest.raises(HttpEngineUnavailable):
+        click_button(EMAIL, PASSWORD, course_id='cs1840')
+
+def test_incorrect_login(page):
+    with pytest.raises(CannotLoginException):
+        click_button(EMAIL, 'wrong password', course_id='cs1840')
+
+def test_unreachable_login_is_not_an_incorrect_login(page):
+    page.close()
+    with pytest.raises(HttpEngineUnavailable):
+        click_button(EMAIL, PASSWORD, course_id='cs1840')
@@ -0,0 +1,118 @@
+import threading
+import time
+import pytest
+from utils.pipeline import Pipeline
+
+CALENDARS = [{'calendarId': 'first@example.com'}, {'calendarId': 'second@example.com'}]
+
+class Waiter(threading.Thread):
+    """Calls a function on another thread, keeping what it returned"""
+
+    def __init__(self, func, *args, **kwargs):
+        super().__init__(daemon=True)
+        self.func, self.args, self.kwargs = func, args, kwargs
+        self.result = None
+
+    def run(self):
+        self.result = self.func(*self.args, **self.kwargs)
+
+    def started(self) -> 'Waiter':
+        self.start()
+        # Gives the waiter time to block
+        time.sleep(0.05)
+        return self
+
+def test_wait_for_events_wakes_on_put():
+    pipeline = Pipeline(CALENDARS)
+    waiter = Waiter(pipeline.wait_for_events).started()
+    assert waiter.is_alive()
+    pipeline.put_event('second@example.com', 'event')
+    waiter.join(1)
+    assert not waiter.is_alive()
+    assert waiter.result == 'second@example.com'
+
+def test_wait_for_space_wakes_on_get():
+    pipeline = Pipeline(CALENDARS[:1], max_stored=1)
+    pipeline.put_event('first@example.com', 'event')
+    waiter = Waiter(pipeline.wait_for_space).started()
+    assert waiter.is_alive()
+    assert pipeline.get_event('first@example.com') == 'event'
+    waiter.join(1)
+    assert waiter.result == 'first@example.com'
+
+def test_put_event_waits_for_space():
+    pipeline = Pipeline(CALENDARS[:1], max_stored=1)
+    pipeline.put_event('first@example.com', 'first')
+    waiter = Waiter(pipeline.put_event, 'first@example.com', 'second', timeout=None).started()
+    assert waiter.is_alive()
+    pipeline.get_event('first@example.com')
+    waiter.join(1)
+    assert waiter.result is True
+    assert pipeline.events('first@example.com') == ['second']
+
+@pytest.mark.parametrize('wait', ['wait_for_events', 'get_event'])
+def test_close_wakes_waiters(wait):
+    pipeline = Pipeline(CALENDARS)
+    args = ('first@example.com',) if wait == 'get_event' else ()
+    waiter = Waiter(getattr(pipeline, wait), *args, timeout=None).started()
+    assert waiter.is_alive()
+    pipeline.close()
+    waiter.join(1)
+    assert not waiter.is_alive()
+    assert waiter.result is None
+
+def test_wait_times_out():
+    pipeline = Pipeline(CALENDARS)
+    start = time.monotonic()
+    assert pipeline.wait_for_events(timeout=0.1) is None
+    assert pipeline.get_event('first@example.com', timeout=0.1) is None
+    assert time.monotonic() - start >= 0.2
+    # Nothing waits once the pipes are full
+    for _ in range(3):
+        pipeline.put_event('first@example.com', 'event')
+    assert pipeline.put_event('first@example.com', 'event') is False
+    assert pipeline.wait_for_space(['first@example.com'], timeout=0) is None
+
+def test_notify_wakes_interrupted_waiter():
+    pipeline = Pipeline(CALENDARS[:1], max_stored=1)
+    pipeline.put_event('first@example.com', 'event')
+    changed = threading.Event()
+    waiter = Waiter(pipeline.wait_for_space, interrupted=changed.is_set).started()
+    assert waiter.is_alive()
+    changed.set()
+    pipeline.notify()
+    waiter.join(1)
+    assert not waiter.is_alive()
+    assert waiter.result is None
+
+def start(event: tuple) -> int:
+    return event[0]
+
+def test_priority_pipeline_orders_by_start():
+    pipeline = Pipeline(CALENDARS, priority_key=start)
+    pipeline.put_event('first@example.com', (30, 'first later'))
+    pipeline.put_event('second@example.com', (10, 'second soonest'))
+    pipeline.put_event('first@example.com', (20, 'first sooner'))
+    pipeline.put_event('second@example.com', (40, 'second latest'))
+
+    taken = []
+    while (calendarId := pipeline.get_first_non_empty()) is not None:
+        taken.append(pipeline.get_event(calendarId)[1])
+    assert taken == ['second soonest', 'first sooner', 'first later', 'second latest']
+
+def test_priority_pipeline_keeps_each_calendars_capacity():
+    pipeline = Pipeline(CALENDARS, max_stored=2, priority_key=start)
+    assert pipeline.put_event('first@example.com', (10, 'first'))
+    assert pipeline.put_event('first@example.com', (20, 'first'))
+    # The shared queue has room, but the calendar doesn't
+    assert not pipeline.put_event('first@example.com', (30, 'first'))
+    assert pipeline.full('first@example.com')
+    assert pipeline.get_first_non_full() == 'second@example.com'
+    assert pipeline.put_event('second@example.com', (5, 'second'))
+    assert pipeline.events('first@example.com') == [(10, 'first'), (20, 'first')]
+
+    # The calendar that is furthest behind (whose last event is soonest) is filled first
+    assert pipeline.get_first_non_full() == 'second@example.com'
+    pipeline.get_event('first@example.com')
+    pipeline.put_event('second@example.com', (50, 'second'))
+    assert pipeline.get_first_non_full() == 'first@example.com'
@@ -0,0 +1,81 @@
+import datetime
+import threading
+import time
+from utils.clock import VirtualClock
+from utils.scheduler import Scheduler
+
+def make_scheduler() -> Scheduler:
+    # A virtual second is a millisecond of real time
+    return Scheduler(clock=VirtualClock(time.time(), 1000))
+
+def run(scheduler: Scheduler) -> threading.Thread:
+    thread = threading.Thread(target=scheduler.run, args=(threading.Event(),), daemon=True)
+    thread.start()
+    return thread
+
+def test_jobs_run_in_deadline_order_not_before_their_deadlines():
+    scheduler = make_scheduler()
+    ran = []
+    def job(name: str, deadline: float):
+        ran.append((name, scheduler.clock.monotonic() >= deadline))
+        if len(ran) == 3:
+            scheduler.stop()
+    now = scheduler.clock.monotonic()
+    for name, delay in (('third', 300), ('first', 100), ('second', 200)):
+        scheduler.schedule_in(delay, job, name, now + delay)
+    thread = run(scheduler)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert ran == [('first', True), ('second', True), ('third', True)]
+
+def test_schedule_at():
+    scheduler = make_scheduler()
+    ran = threading.Event()
+    when = scheduler.clock.now(datetime.timezone.utc) + datetime.timedelta(minutes=2)
+    job = scheduler.schedule_at(when, ran.set)
+    # The deadline is kept on the scheduler's monotonic clock
+    assert abs(job.deadline - scheduler.clock.monotonic() - 120) < 1
+    thread = run(scheduler)
+    assert ran.wait(5)
+    assert scheduler.clock.now(datetime.timezone.utc) >= when
+    scheduler.stop()
+    thread.join(5)
+
+def test_cancelled_jobs_do_not_run():
+    scheduler = make_scheduler()
+    ran = []
+    cancelled = scheduler.schedule_in(10, ran.append, 'cancelled')
+    scheduler.schedule_in(20, ran.append, 'kept')
+    scheduler.cancel(cancelled)
+    assert len(scheduler) == 1
+    thread = run(scheduler)
+    for _ in range(100):
+        if ran:
+            break
+        time.sleep(0.01)
+    scheduler.stop()
+    thread.join(5)
+    assert ran == ['kept']
+
+def test_sooner_job_wakes_the_scheduler():
+    scheduler = make_scheduler()
+    ran = threading.Event()
+    # The scheduler waits for this one (over a real hour away) until a sooner one is scheduled
+    scheduler.schedule_in(4000 * 1000, lambda: None)
+    thread = run(scheduler)
+    time.sleep(0.05)
+    scheduler.schedule_in(1, ran.set)
+    assert ran.wait(5)
+    scheduler.stop()
+    thread.join(5)
+    assert not thread.is_alive()
+
+def test_stop_wakes_the_scheduler():
+    scheduler = make_scheduler()
+    # Without any jobs the scheduler waits until it is notified
+    thread = run(scheduler)
+    time.sleep(0.05)
+    assert thread.is_alive()
+    scheduler.stop()
+    thread.join(1)
+    assert not thread.is_alive()
@@ -0,0 +1,81 @@
+import threading
+import time
+import pytest
+import workers
+from google_calendar import CalendarAPI
+from utils.pipeline import Pipeline
+from utils.webhook import WebhookReceiver
+
+def test_notifications_need_our_token_and_a_channel():
+    changes = []
+    receiver = WebhookReceiver(on_change=lambda: changes.append(True))
+    assert not receiver.receive('channel', 'forged', 'exists')
+    assert not receiver.receive('channel', None, 'exists')
+    assert not receiver.receive(None, receiver.token, 'exists')
+    assert not receiver.has_changed()
+    assert changes == []
+
+def test_sync_notifications_are_not_changes():
+    receiver = WebhookReceiver()
+    # Sent when a channel is opened
+    assert receiver.receive('channel', receiver.token, 'sync')
+    assert not receiver.has_changed()
+
+def test_changed_channels_are_popped():
+    changes = []
+    receiver = WebhookReceiver(on_change=lambda: changes.append(True))
+    assert receiver.receive('first', receiver.token, 'exists')
+    assert receiver.receive('second', receiver.token, 'exists')
+    assert receiver.has_changed()
+    assert changes == [True, True]
+    assert receiver.pop_changed() == {'first', 'second'}
+    assert not receiver.has_changed()
+    assert receiver.pop_changed() == set()
+
+@pytest.fixture
+def receiver():
+    receiver = WebhookReceiver()
+    receiver.serve(0)
+    yield receiver
+    receiver.close()
+
+def wait_until(predicate, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def test_fake_calendar_notifies_the_receiver(receiver, service, cache_path):
+    calendar_api = CalendarAPI(service)
+    calendarId = next(iter(service.calendars))
+    calendar_api.watch(calendarId, receiver.address, receiver.token)
+    assert not receiver.has_changed()
+
+    event = dict(service.calendars[calendarId][1][0], summary='CS1840 Lecture (moved)')
+    service.change_event(calendarId, event)
+    assert receiver.has_changed()
+    assert [calendar_api.watched_calendar(channel) for channel in receiver.pop_changed()] == [calendarId]
+    calendar_api.stop_watching()
+    calendar_api.event_store.close()
+
+def test_changed_event_is_queued_again(receiver, service, cache_path, info):
+    calendar_api = CalendarAPI(service)
+    pipeline = Pipeline([info])
+    event = threading.Event()
+    producer = threading.Thread(target=workers.calendar_event_producer, args=([info], calendar_api, pipeline, event, receiver), daemon=True)
+    producer.start()
+    try:
+        assert wait_until(lambda: [queued.id for queued in pipeline.events(info['calendarId'])] == ['today', 'tomorrow'])
+
+        moved = dict(service.calendars[info['calendarId']][1][0], summary='CS1840 Lecture (moved)')
+        service.change_event(info['calendarId'], moved)
+        # Without waiting for FETCH_WINDOW_TTL, the queued events are replaced by the changed ones
+        assert wait_until(lambda: [queued.summary for queued in pipeline.events(info['calendarId'])] == ['CS1840 Lecture (moved)', 'CS1860 Lecture'])
+    finally:
+        event.set()
+        pipeline.close()
+        producer.join(5)
+        calendar_api.event_store.close()
+    assert not producer.is_alive()
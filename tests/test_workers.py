@@ -0,0 +1,189 @@
+import datetime
+import threading
+import time
+import pytest
+import http_registration
+import registration
+import workers
+from registration import BrowserPool
+from utils.event import Event
+from utils.scheduler import Scheduler
+from workers import SignInJob
+
+@pytest.fixture
+def lecture(now) -> Event:
+    return Event('lecture', 'CS1840 Lecture', now - datetime.timedelta(minutes=10), now + datetime.timedelta(minutes=50))
+
+class FakeBrowser:
+    """Stands in for a selenium browser driver, the attendance button is never found with it"""
+
+    def get(self, url: str):
+        pass
+
+    def quit(self):
+        pass
+
+@pytest.fixture
+def fake_browsers(monkeypatch):
+    """Makes the browser pool hand out fake browsers, which log in straight away but never find a button"""
+    monkeypatch.setattr(registration, 'SIGN_IN_ENGINE', 'selenium')
+    monkeypatch.setattr(registration, 'start_selenium', lambda headless: FakeBrowser())
+    monkeypatch.setattr(registration, 'login', lambda browser, email, password, verbose=False: None)
+    monkeypatch.setattr(registration, '_click_button', lambda browser, email, password, verbose, course_id, search_params: False)
+    monkeypatch.setattr(workers, 'SESSION_RETRIES', True)
+
+@pytest.fixture
+def http_unavailable(monkeypatch, fake_browsers):
+    """Uses the http engine, which can't reach Campus Connect so has to fall back to the fake browsers"""
+    def login(session, email, password, verbose=False):
+        raise http_registration.HttpEngineUnavailable('Could not reach Campus Connect to login')
+    monkeypatch.setattr(registration, 'SIGN_IN_ENGINE', 'http')
+    monkeypatch.setattr(http_registration, 'login', login)
+
+def make_job(info: dict, lecture: Event, scheduler: Scheduler, done: list, pool: BrowserPool = None, account_lock: threading.Lock = None) -> SignInJob:
+    return SignInJob(info, lecture, scheduler, threading.Event(), account_lock or threading.Lock(), pool or BrowserPool(), lambda job, stop: done.append(stop))
+
+def run_without_waiting(func):
+    """Runs a function on another thread, failing if it doesn't return promptly (such as by waiting on a lock or the pool)"""
+    thread = threading.Thread(target=func, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+
+def test_attempt_error_is_retried(info, lecture, monkeypatch):
+    def click_button(*args, **kwargs):
+        raise RuntimeError('page did not load')
+    monkeypatch.setattr(workers, 'SESSION_RETRIES', False)
+    monkeypatch.setattr(workers, 'click_button', click_button)
+    scheduler, done = Scheduler(), []
+    job = make_job(info, lecture, scheduler, done)
+
+    job.attempt()
+    # The calendar isn't left waiting on a sign-in that will never finish
+    assert len(scheduler) == 1
+    assert done == []
+    assert job.timeout > workers.MIN_CLICK_TIMEOUT
+
+def test_attempt_after_the_event_ends(info, lecture, monkeypatch):
+    monkeypatch.setattr(workers, 'SESSION_RETRIES', False)
+    monkeypatch.setattr(workers, 'click_button', lambda *args, **kwargs: False)
+    scheduler, done = Scheduler(), []
+    job = make_job(info, lecture, scheduler, done)
+    job.end = lecture.start
+
+    job.attempt()
+    assert done == [False]
+    assert len(scheduler) == 0
+
+def test_attempts_never_wait_for_a_browser(info, lecture, fake_browsers):
+    pool = BrowserPool(size=1)
+    holding = make_job(info, lecture, Scheduler(), [], pool)
+    other_info = dict(info, calendarId='other@example.com', username='other@example.com')
+    waiting_scheduler = Scheduler()
+    waiting = make_job(other_info, lecture, waiting_scheduler, [], pool)
+
+    # Keeps the only browser logged in between its attempts
+    holding.attempt()
+    assert holding.session is not None and holding.session.browser is not None
+    # With every browser in use the other account tries again later rather than tying up a thread
+    run_without_waiting(waiting.attempt)
+    assert len(waiting_scheduler) == 1
+    assert waiting.session is None
+
+    # Once another account is waiting the browser is given back, so that it gets a turn
+    holding.attempt()
+    assert holding.session is None
+    run_without_waiting(waiting.attempt)
+    assert waiting.session is not None and waiting.session.browser is not None
+    waiting.close()
+    pool.close()
+
+def test_busy_account_is_not_waited_for(info, lecture, fake_browsers):
+    account_lock, scheduler = threading.Lock(), Scheduler()
+    job = make_job(info, lecture, scheduler, [], account_lock=account_lock)
+    # Such as whilst another sign-in of the account is logging in
+    with account_lock:
+        run_without_waiting(job.prepare)
+        run_without_waiting(job.attempt)
+    assert job.session is None
+    assert job.attempts == 0
+    assert len(scheduler) == 1
+
+def test_attempt_falls_back_to_selenium_without_http(info, lecture, http_unavailable):
+    scheduler, done = Scheduler(), []
+    pool = BrowserPool(size=1)
+    job = make_job(info, lecture, scheduler, done, pool)
+    job.attempt()
+    # The session is logged in with a browser instead, rather than the attempt failing until the lecture ends
+    assert job.session is not None and job.session.browser is not None
+    job.close()
+    pool.close()
+
+def test_prepare_falls_back_to_selenium_without_http(info, lecture, http_unavailable):
+    pool = BrowserPool(size=1)
+    job = make_job(info, lecture, Scheduler(), [], pool)
+    job.prepare()
+    assert job.session is not None and job.session.browser is not None
+    job.close()
+    pool.close()
+
+def test_producer_survives_api_errors(info, service, cache_path, monkeypatch):
+    from google_calendar import CalendarAPI
+    from utils.pipeline import Pipeline
+    failures = []
+    list_events = service._list_events
+    def flaky_list_events(kwargs):
+        # Google (or the connection to it) fails the first requests, whilst starting up and in the loop
+        if len(failures) < 2:
+            failures.append(kwargs)
+            raise OSError('Connection reset by peer')
+        return list_events(kwargs)
+    service._list_events = flaky_list_events
+    monkeypatch.setattr(workers, 'LOOP_TIMEOUT', 0.05)
+    calendar_api = CalendarAPI(service)
+    pipeline = Pipeline([info], priority_key=None)
+    event = threading.Event()
+    producer = threading.Thread(target=workers.calendar_event_producer, args=([info], calendar_api, pipeline, event), daemon=True)
+    producer.start()
+
+    # The calendar is fetched again after LOOP_TIMEOUT, rather than the producer stopping for good
+    for _ in range(100):
+        if len(pipeline.events(info['calendarId'])):
+            break
+        time.sleep(0.05)
+    event.set()
+    pipeline.close()
+    producer.join(5)
+    calendar_api.event_store.close()
+    assert len(failures) == 2
+    assert len(pipeline.events(info['calendarId'])) > 0
+    assert not producer.is_alive()
+
+def test_sign_in_messages_are_single_lines(info, lecture, caplog, monkeypatch):
+    monkeypatch.setattr(workers, 'PRE_LOGIN_LEAD', 0)
+    job = make_job(info, lecture, Scheduler(), [])
+    with caplog.at_level('DEBUG', logger='workers'):
+        job.schedule()
+        job.still_alive()
+    assert len(caplog.records) == 2
+    for record in caplog.records:
+        assert record.getMessage() == record.getMessage().strip()
+        assert record.calendar == info['calendarId']
+
+def test_pool_is_not_locked_whilst_browsers_quit(fake_browsers):
+    quitting, finish = threading.Event(), threading.Event()
+    class SlowBrowser(FakeBrowser):
+        def quit(self):
+            quitting.set()
+            finish.wait(5)
+    pool = BrowserPool(size=1, idle_timeout=0)
+    pooled = pool.acquire('first@example.com')
+    pooled.browser = SlowBrowser()
+    pool.release(pooled)
+    # Reaps (and quits) the idle browser, which takes a while
+    acquiring = threading.Thread(target=pool.acquire, args=('second@example.com', False), daemon=True)
+    acquiring.start()
+    assert quitting.wait(5)
+    run_without_waiting(lambda: pool.wanted('first@example.com'))
+    finish.set()
+    acquiring.join(5)
@@ -0,0 +1,123 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+"""
+    The clock that the bot reads the time from and waits with. The system clock is used unless another
+    clock is set, such as a virtual clock which runs faster than real time so that a week of lectures
+    can be simulated in seconds
+"""
+
+class Clock(ABC):
+    """The time as seen by the bot"""
+
+    @abstractmethod
+    def time(self) -> float:
+        """
+            Returns:
+                The current (epoch) time in seconds
+        """
+
+    @abstractmethod
+    def monotonic(self) -> float:
+        """
+            Returns:
+                The seconds since an arbitrary point, which never goes backwards
+        """
+
+    @abstractmethod
+    def sleep(self, seconds: float):
+        """
+            Blocks for the given seconds of this clock's time
+
+            Args:
+                seconds: the seconds to sleep for
+        """
+
+    @abstractmethod
+    def wait(self, condition: threading.Condition, timeout: float = None) -> bool:
+        """
+            Waits on a condition (which must be held) for up to the given seconds of this clock's time
+
+            Args:
+                condition: the condition to wait on
+                timeout: the maximum seconds to wait, None waits until the condition is notified
+
+            Returns:
+                False if the wait timed out, otherwise True
+        """
+
+    def now(self, tz=None) -> datetime:
+        """
+            Gets the current time as a datetime, like datetime.now
+
+            Args:
+                tz: the timezone of the datetime. If None the datetime is naive and in local time
+
+            Returns:
+                The current time
+        """
+        return datetime.fromtimestamp(self.time(), tz)
+
+class SystemClock(Clock):
+    """The real time"""
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(max(seconds, 0))
+
+    def wait(self, condition: threading.Condition, timeout: float = None) -> bool:
+        return condition.wait(None if timeout is None else max(timeout, 0))
+
+class VirtualClock(Clock):
+    """
+        A clock which starts at a given time and runs a number of times faster than real time. Sleeps and
+        waits are shortened to match, so code using the clock runs as it would in real time, only faster
+
+        Attributes:
+            start: the (epoch) time the clock started at
+            speed: how many times faster than real time the clock runs
+    """
+
+    def __init__(self, start: float, speed: float):
+        self.start = start
+        self.speed = speed
+        self._real_start = time.monotonic()
+
+    def monotonic(self) -> float:
+        return (time.monotonic() - self._real_start) * self.speed
+
+    def time(self) -> float:
+        return self.start + self.monotonic()
+
+    def sleep(self, seconds: float):
+        time.sleep(max(seconds, 0) / self.speed)
+
+    def wait(self, condition: threading.Condition, timeout: float = None) -> bool:
+        return condition.wait(None if timeout is None else max(timeout, 0) / self.speed)
+
+_clock = SystemClock()
+
+def get_clock() -> Clock:
+    """
+        Returns:
+            The clock used by the bot
+    """
+    return _clock
+
+def set_clock(clock: Clock):
+    """
+        Sets the clock used by the bot. Schedulers and pipelines keep the clock that was set when they were
+        constructed, so this should be done before they are
+
+        Args:
+            clock: the clock to use
+    """
+    global _clock
+    _clock = clock
@@ -16,7 +16,37 @@ PARAMETERS = {
     'BUTTON_ONE_ID',
     'BUTTON_TWO_ID',
     'BUTTON_30_ONE_ID',
-    'BUTTON_30_TWO_ID'
+    'BUTTON_30_TWO_ID',
+    'FETCH_WINDOW_DAYS',
+    'FETCH_WINDOW_TTL',
+    'INCREMENTAL_SYNC',
+    'SERVER_SIDE_SEARCH',
+    'STARTUP_CACHE',
+    'CACHE_PATH',
+    'BROWSER',
+    'BROWSER_PROFILE',
+    'BROWSER_ALLOWED_DOMAINS',
+    'BROWSER_POOL_SIZE',
+    'BROWSER_MAX_USES',
+    'BROWSER_IDLE_TIMEOUT',
+    'SESSION_CACHE',
+    'SIGN_IN_ENGINE',
+    'HTTP_STATE_URL',
+    'HTTP_REGISTER_URL',
+    'HTTP_TIMEOUT',
+    'PRE_LOGIN_LEAD',
+    'SESSION_RETRIES',
+    'MAX_SESSION_CLICK_TIMEOUT',
+    'MAX_CONCURRENT_SIGN_INS',
+    'PRIORITY_PIPELINE',
+    'PAGE_READY_TIMEOUT',
+    'METRICS_PORT',
+    'METRICS_FILE',
+    'WEBHOOK_ADDRESS',
+    'WEBHOOK_PORT',
+    'LOG_LEVEL',
+    'LOG_FORMAT',
+    'LOG_PATH'
 }
 
 class ConfigException(Exception):
@@ -77,7 +107,37 @@ DEFAULT_CONFIG = Config(
     BUTTON_ONE_ID='pbid-buttonFoundHappeningNowButtonsHere',  # The ID of the button to click if only one button is found
     BUTTON_TWO_ID='pbid-buttonFoundHappeningNowButtonsTwoInPerson',  # The ID of the button to click if two buttons are found
     BUTTON_30_ONE_ID='pbid-buttonHappened30MinAgoButtonsOneHere',  # The ID of the button to click if only one button is found in 30 mins ago section
-    BUTTON_30_TWO_ID='pbid-buttonHappened30MinAgoButtonsTwoInPerson'  # The ID of the button to click if two buttons are found in 30 mins ago section
+    BUTTON_30_TWO_ID='pbid-buttonHappened30MinAgoButtonsTwoInPerson',  # The ID of the button to click if two buttons are found in 30 mins ago section
+    FETCH_WINDOW_DAYS=7,  # days of events fetched from the calendar API in one go (0 fetches per lookup)
+    FETCH_WINDOW_TTL=30,  # mins before a fetched window of events is considered stale
+    INCREMENTAL_SYNC=True,  # Whether or not to keep a local store of events that is kept up to date using sync tokens
+    SERVER_SIDE_SEARCH=False,  # Whether or not single search params are sent to the calendar API so only matching events are fetched
+    STARTUP_CACHE=True,  # Whether or not the calendar list and the API's discovery document are saved so that the next start is quicker
+    CACHE_PATH='',  # Where cached data (such as the event store) goes ('' is the cache directory in the program directory)
+    BROWSER='firefox',  # The browser selenium drives, either firefox or chromium
+    BROWSER_PROFILE='default',  # Either default or lean (blocks images, fonts, media, other sites and caching to use less memory)
+    BROWSER_ALLOWED_DOMAINS=[],  # Other sites (such as the login page's) that the lean profile can load from, the attendance page's site is always allowed
+    BROWSER_POOL_SIZE=2,  # The maximum number of selenium browsers kept alive at once
+    BROWSER_MAX_USES=20,  # The number of sign-in attempts a browser is used for before it is restarted
+    BROWSER_IDLE_TIMEOUT=30,  # mins a browser can be unused for before it is quit
+    SESSION_CACHE=True,  # Whether or not to save (encrypted) logged in sessions so that the login form can be skipped
+    SIGN_IN_ENGINE='selenium',  # Either selenium or http (which falls back to selenium)
+    HTTP_STATE_URL='',  # The endpoint (relative to the attendance page) which the http engine gets the attendance records from (a JSON list of records with titles)
+    HTTP_REGISTER_URL='',  # The endpoint (relative to the attendance page) which the http engine registers attendance with (responds with a JSON object with registered)
+    HTTP_TIMEOUT=10,  # seconds before a request made by the http engine times out
+    PRE_LOGIN_LEAD=120,  # seconds before a sign-in that the account is logged in, so that only a refresh and a click are left (0 doesn't log in ahead)
+    SESSION_RETRIES=True,  # Whether or not a sign-in keeps its logged in session between attempts, so that retries only refresh the page
+    MAX_SESSION_CLICK_TIMEOUT=30,  # seconds, the maximum timeout between sign in attempts that keep their session
+    MAX_CONCURRENT_SIGN_INS=2,  # The maximum number of sign-ins (of different accounts) that can run at the same time
+    PRIORITY_PIPELINE=True,  # Whether or not the events of every calendar are queued in order of their start times
+    PAGE_READY_TIMEOUT=70,  # seconds to wait for the attendance page to load its state before giving up on a sign-in attempt
+    METRICS_PORT=0,  # The local port that metrics are served on in the Prometheus text format (0 doesn't serve them)
+    METRICS_FILE='',  # The JSON-lines file that metrics are written to ('' doesn't write them)
+    WEBHOOK_ADDRESS='',  # The public HTTPS address which forwards Google Calendar's push notifications to WEBHOOK_PORT ('' polls for changes instead)
+    WEBHOOK_PORT=8765,  # The local port that push notifications are received on
+    LOG_LEVEL='INFO',  # The minimum level of the messages that are logged (DEBUG also logs the STILL_ALIVE messages)
+    LOG_FORMAT='text',  # text logs messages as they are, json logs a line of JSON (with the calendar and event) per message
+    LOG_PATH=''  # The file that messages are appended to ('' logs to stdout)
 )
 
 def read_config() -> Config:
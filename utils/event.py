@@ -0,0 +1,75 @@
+from datetime import datetime, tzinfo
+from functools import lru_cache
+import pytz
+from utils.time_utils import fromiso_aware
+
+"""
+    The compact form of the google calendar events that are queued and signed into
+"""
+
+@lru_cache(maxsize=None)
+def get_timezone(name: str) -> tzinfo:
+    """
+        Gets a timezone by its name, each timezone is only looked up once
+
+        Args:
+            name: the name of the timezone, such as Europe/London
+
+        Returns:
+            The timezone
+    """
+    return pytz.timezone(name)
+
+class Event:
+    """
+        An event holding only what is needed to sign into it, with its times parsed once when it is built
+        rather than every time they are used
+
+        Attributes:
+            id: the ID of the event
+            summary: the title of the event
+            course_id: the course ID of the event (the first word of the title, lower case)
+            timezone: the timezone of the event
+            start: the (aware) start of the event, in the event's timezone
+            end: the (aware) end of the event, in the event's timezone
+    """
+
+    __slots__ = ('id', 'summary', 'course_id', 'timezone', 'start', 'end')
+
+    def __init__(self, id: str, summary: str, start: datetime, end: datetime, timezone: tzinfo = pytz.utc):
+        self.id = id
+        self.summary = summary
+        self.course_id = summary.split(' ')[0].lower()
+        self.timezone = timezone
+        self.start = start.astimezone(timezone)
+        self.end = end.astimezone(timezone)
+
+    @classmethod
+    def from_api(cls, event: dict) -> 'Event':
+        """
+            Builds an event from an event returned by the calendar API
+
+            Args:
+                event: the google calendar event
+
+            Returns:
+                The event
+        """
+        timezone = event['start'].get('timeZone')
+        return cls(event['id'], event.get('summary', ''), fromiso_aware(event['start'].get('dateTime', event['start'].get('date'))),
+                   fromiso_aware(event['end'].get('dateTime', event['end'].get('date'))), get_timezone(timezone) if timezone else pytz.utc)
+
+    def __eq__(self, other) -> bool:
+        # Events are the same as far as signing in is concerned if their titles and times haven't changed
+        if not isinstance(other, Event):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        return hash(self._key())
+
+    def _key(self) -> tuple:
+        return (self.id, self.summary, self.start, self.end)
+
+    def __repr__(self) -> str:
+        return f'Event({self.id!r}, {self.summary!r}, {self.start.isoformat()}, {self.end.isoformat()})'
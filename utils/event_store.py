@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+from typing import Union
+from utils.time_utils import fromiso_aware
+
+"""
+    A persistent store of calendar events which is kept up to date using incremental sync
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    start REAL NOT NULL,
+    end REAL NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS events_by_end ON events (calendar_id, end);
+CREATE TABLE IF NOT EXISTS sync_tokens (
+    calendar_id TEXT PRIMARY KEY,
+    token TEXT NOT NULL
+);
+"""
+
+def event_timestamp(time: dict) -> float:
+    """
+        Gets the POSIX timestamp of the start/end of a google calendar event
+
+        Args:
+            time: the start or end dict of an event (contains either a dateTime or a date)
+
+        Returns:
+            The timestamp in seconds
+    """
+    return fromiso_aware(time.get('dateTime', time.get('date'))).timestamp()
+
+class EventStore:
+    """
+        Stores the events of every watched calendar, along with the sync token of each calendar, in a
+        SQLite database so that they survive restarts
+
+        Attributes:
+            path: the path of the SQLite database
+    """
+
+    def __init__(self, path: str):
+        """
+            Opens (and creates if needed) the event store
+
+            Args:
+                path: the path of the SQLite database
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def get_sync_token(self, calendarId: str) -> Union[str, None]:
+        """
+            Gets the sync token from the last sync of the given calendar
+
+            Args:
+                calendarId: the calendar to get the token for
+
+            Returns:
+                The sync token or None if the calendar has never been synced
+        """
+        with self._lock:
+            row = self._connection.execute('SELECT token FROM sync_tokens WHERE calendar_id = ?', (calendarId,)).fetchone()
+        return row[0] if row is not None else None
+
+    def apply(self, calendarId: str, events: list, sync_token: str, full: bool = False):
+        """
+            Applies the result of a sync to the store in one transaction
+
+            Args:
+                calendarId: the calendar that was synced
+                events: the changed events, cancelled events are removed from the store
+                sync_token: the nextSyncToken to use for the next sync
+                full: whether this was a full sync, in which case all previously stored events are dropped
+        """
+        with self._lock, self._connection:
+            if full:
+                self._connection.execute('DELETE FROM events WHERE calendar_id = ?', (calendarId,))
+            for event in events:
+                if event.get('status') == 'cancelled':
+                    self._connection.execute('DELETE FROM events WHERE calendar_id = ? AND event_id = ?', (calendarId, event['id']))
+                else:
+                    self._connection.execute('INSERT OR REPLACE INTO events VALUES (?, ?, ?, ?, ?)',
+                                             (calendarId, event['id'], event_timestamp(event['start']), event_timestamp(event['end']), json.dumps(event)))
+            if sync_token is not None:
+                self._connection.execute('INSERT OR REPLACE INTO sync_tokens VALUES (?, ?)', (calendarId, sync_token))
+
+    def between(self, calendarId: str, time_min: float, time_max: float) -> list:
+        """
+            Gets the stored events in the given time range (same semantics as timeMin and timeMax)
+
+            Args:
+                calendarId: the calendar to get events from
+                time_min: the timestamp after which events should end
+                time_max: the timestamp before which events should start
+
+            Returns:
+                The events ordered by start time
+        """
+        with self._lock:
+            rows = self._connection.execute('SELECT body FROM events WHERE calendar_id = ? AND end > ? AND start < ? ORDER BY start',
+                                            (calendarId, time_min, time_max)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def prune(self, before: float):
+        """
+            Removes all the events that ended before the given time
+
+            Args:
+                before: the timestamp before which ended events are removed
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM events WHERE end <= ?', (before,))
+
+    def clear(self, calendarId: str):
+        """
+            Removes all the events and the sync token of the given calendar, forcing a full sync next time
+
+            Args:
+                calendarId: the calendar to clear
+        """
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM events WHERE calendar_id = ?', (calendarId,))
+            self._connection.execute('DELETE FROM sync_tokens WHERE calendar_id = ?', (calendarId,))
+
+    def close(self):
+        """Closes the connection to the database"""
+        with self._lock:
+            self._connection.close()
@@ -1,16 +1,16 @@
 from utils.input_utils import password_input
 from utils.time_utils import get_utc_now
 from utils.config import CONFIG
-from os import listdir
+from os import listdir, makedirs, remove
 from os.path import basename, isfile, join, dirname, realpath, splitext
 import time
-from Crypto.Cipher import AES
-from Crypto.Hash import SHA256
-from Crypto import Random
+import hashlib
 import json
 import sys
+from typing import Iterable, Union
 
 SAVED_CALENDAR_PATH = CONFIG.SAVED_CALENDAR_PATH
+CACHE_PATH = CONFIG.CACHE_PATH
 
 class IncorrectPassword(Exception):
     def __init__(self, **kwargs):
@@ -55,27 +55,84 @@ def calendars_exists(path: str = SAVED_CALENDAR_PATH) -> bool:
     """
     return bool(len(get_calendars(path)))
 
-def save_encrypted(calendars: list):
-    """Saves a calendar info list to an encrypted file of the user's choice of password
+def get_cache_path(filename: str, path: str = CACHE_PATH) -> str:
+    """Gets the path of a file within the cache directory, creating the directory if needed
 
-    Will save the calendar info files to SAVE_CALENDAR_PATH
+    Args:
+        filename (str): The name of the cached file
+        path (str, optional): The cache directory. Defaults to CACHE_PATH.
+
+    Returns:
+        str: the path of the cached file
+    """
+    if not path:
+        path = join(dirname(dirname(realpath(__file__))), 'cache')
+    makedirs(path, exist_ok=True)
+    return join(path, filename)
+
+def encrypt_json(data, password: str) -> bytes:
+    """Encrypts a JSON serialisable object with AES, using the SHA256 hash of the password as the key
 
     Args:
-        calendars (list): the list of calendar infos to save
+        data: the object to encrypt
+        password (str): the password to encrypt with
+
+    Returns:
+        bytes: the IV followed by the ciphertext
     """
-    output_file = f'{int(time.time())}.pickle'
+    # Imported here so that starting up doesn't wait for it, unless there is something to encrypt
+    from Crypto.Cipher import AES
+    from Crypto.Hash import SHA256
+    from Crypto import Random
+
     IV = Random.new().read(16)
-    password = password_input('encryption of calendar login details')
 
     hash_pass = SHA256.new()
     hash_pass.update(bytes(password, 'utf-8'))
 
     encryptor = AES.new(hash_pass.digest(), AES.MODE_CBC, IV)
-    calendar_info = json.dumps(calendars, indent=4, sort_keys=True).encode('utf-8')
+    plaintext = json.dumps(data, indent=4, sort_keys=True).encode('utf-8')
 
     # Pad the data with the number of bytes to pad by
-    length = 16 - (len(calendar_info) % 16)
-    calendar_info += bytes([length]) * length
+    length = 16 - (len(plaintext) % 16)
+    plaintext += bytes([length]) * length
+    return IV + encryptor.encrypt(plaintext)
+
+def decrypt_json(data: bytes, password: str):
+    """Decrypts data encrypted by encrypt_json
+
+    Args:
+        data (bytes): the IV followed by the ciphertext
+        password (str): the password to decrypt with
+
+    Raises:
+        IncorrectPassword: If the decrypted data cannot be decoded to JSON, it is assumed that the password is incorrect
+
+    Returns:
+        the decrypted object
+    """
+    from Crypto.Cipher import AES
+    from Crypto.Hash import SHA256
+
+    hash_pass = SHA256.new()
+    hash_pass.update(bytes(password, 'utf-8'))
+    decryptor = AES.new(hash_pass.digest(), AES.MODE_CBC, data[:16])
+    plaintext = decryptor.decrypt(data[16:])
+    try:
+        return json.loads(plaintext[:-plaintext[-1]].decode('utf-8'))
+    except:
+        raise IncorrectPassword()
+
+def save_encrypted(calendars: list):
+    """Saves a calendar info list to an encrypted file of the user's choice of password
+
+    Will save the calendar info files to SAVE_CALENDAR_PATH
+
+    Args:
+        calendars (list): the list of calendar infos to save
+    """
+    output_file = f'{int(time.time())}.pickle'
+    password = password_input('encryption of calendar login details')
 
     if not SAVED_CALENDAR_PATH:
         save_path = join(dirname(dirname(realpath(__file__))), output_file)
@@ -83,9 +140,7 @@ def save_encrypted(calendars: list):
         save_path = join(SAVED_CALENDAR_PATH, output_file)
 
     with open(save_path, 'wb+') as out_file:
-        ciphertext = encryptor.encrypt(calendar_info)
-        out_file.write(IV)
-        out_file.write(ciphertext)
+        out_file.write(encrypt_json(calendars, password))
 
 def load_latest_calendar(path: str = SAVED_CALENDAR_PATH, simple: bool = False) -> list:
     """Loads the latest calendar info file, by asking for the decryption password
@@ -105,22 +160,104 @@ def load_latest_calendar(path: str = SAVED_CALENDAR_PATH, simple: bool = False)
 
     if recent_calendar is not None:
         with open(recent_calendar, 'rb') as in_file:
-            IV = in_file.read(16)
-            hash_pass = SHA256.new()
             if not simple:
                 password = password_input(f'decrypting previous calendar info file ({basename(recent_calendar)})', False)
             else:
                 password = sys.stdin.read()[:-1].strip()
-            hash_pass.update(bytes(password, 'utf-8'))
-            decryptor = AES.new(hash_pass.digest(), AES.MODE_CBC, IV)
-            data = decryptor.decrypt(in_file.read())
-        try:
-            data = data[:-data[-1]].decode('utf-8')
-            calendar_info = json.loads(data)
-        except:
-            raise IncorrectPassword()
+            calendar_info = decrypt_json(in_file.read(), password)
+    return calendar_info
+
+def load_tenants(lines: Iterable[str]) -> list:
+    """Loads the calendar info files of every tenant watched in daemon mode. Each tenant is given as a line
+    of the path of their calendar info file followed by a space and its decryption password. The tenant is named
+    after the file (without its extension) and is added to each of its calendar infos
+
+    Args:
+        lines (Iterable[str]): the lines giving the tenants, such as sys.stdin. Blank lines are skipped
+
+    Raises:
+        ValueError: If a line is not a path and a password, two tenants have the same name or a file cannot be decrypted with its password
+
+    Returns:
+        list: the calendar infos of every tenant
+    """
+    calendar_info = []
+    tenants = set()
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line.strip():
+            continue
+        path, _, password = line.partition(' ')
+        if not password:
+            raise ValueError(f'Expected the path of a calendar info file and its password, got: {path}')
+        tenant = splitext(basename(path))[0]
+        if tenant in tenants:
+            raise ValueError(f'More than one tenant is named {tenant}, calendar info files must have different names')
+        tenants.add(tenant)
+
+        with open(path, 'rb') as in_file:
+            try:
+                calendars = decrypt_json(in_file.read(), password)
+            except IncorrectPassword as e:
+                raise ValueError(f'Could not decrypt the calendar info file of {tenant}, the password is likely incorrect') from e
+        calendar_info += [dict(calendar, tenant=tenant) for calendar in calendars]
     return calendar_info
 
+def get_session_file(username: str) -> str:
+    """Gets the path of the cached session of the given account, the filename is a hash of the username
+
+    Args:
+        username (str): the account's username
+
+    Returns:
+        str: the path of the session file within the cache directory
+    """
+    hash_user = hashlib.sha256(bytes(username.lower(), 'utf-8'))
+    return get_cache_path(f'{hash_user.hexdigest()}.session')
+
+def save_session(username: str, password: str, cookies: list):
+    """Saves the cookies of an authenticated session, encrypted using the account's password
+
+    Args:
+        username (str): the account's username
+        password (str): the account's password
+        cookies (list): the cookies of the session
+    """
+    with open(get_session_file(username), 'wb+') as out_file:
+        out_file.write(encrypt_json(cookies, password))
+
+def load_session(username: str, password: str) -> Union[list, None]:
+    """Loads the cookies of a previously saved session
+
+    Args:
+        username (str): the account's username
+        password (str): the account's password
+
+    Returns:
+        list: the cookies of the session, or None if there is no saved session (or it cannot be decrypted)
+    """
+    session_file = get_session_file(username)
+    if not isfile(session_file):
+        return None
+    with open(session_file, 'rb') as in_file:
+        data = in_file.read()
+    try:
+        return decrypt_json(data, password)
+    except IncorrectPassword:
+        # The password has changed since the session was saved
+        remove(session_file)
+        return None
+
+def clear_session(username: str):
+    """Removes the saved session of an account, if there is one
+
+    Args:
+        username (str): the account's username
+    """
+    session_file = get_session_file(username)
+    if isfile(session_file):
+        remove(session_file)
+
 if __name__ == '__main__':
     print(get_calendars())
     print(get_latest_calendar_file())
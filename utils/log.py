@@ -0,0 +1,66 @@
+import json
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from utils.config import CONFIG
+
+"""
+    Logging for the bot's threads. Records are put onto a queue and written by a background thread, so
+    that threads (such as the ones signing in) never wait on the output
+"""
+
+LOG_LEVEL = CONFIG.LOG_LEVEL
+LOG_FORMAT = CONFIG.LOG_FORMAT
+LOG_PATH = CONFIG.LOG_PATH
+# The extra fields of a record (given with extra=) which are written with JSON records
+RECORD_FIELDS = ('calendar', 'event')
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a line of JSON, along with its calendar and event if it has them"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            # Surrounding whitespace (such as from multi-line messages) isn't needed in JSON
+            'message': record.getMessage().strip(),
+        }
+        for field in RECORD_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        return json.dumps(entry)
+
+def setup_logging(level: str = LOG_LEVEL, format: str = LOG_FORMAT, path: str = LOG_PATH) -> QueueListener:
+    """
+        Sends every record logged from now on through a queue to a background thread, which writes the
+        records at or above the level to the output
+
+        Args:
+            level: the minimum level of the records to write, such as INFO
+            format: text writes just the messages (like print), json writes a line of JSON per record
+            path: the file to append the records to, if empty they are written to stdout
+
+        Raises:
+            ValueError: if the level or format is not recognised
+
+        Returns:
+            The listener writing the records, which should be stopped on exit so that every record is written
+    """
+    if format not in ('text', 'json'):
+        raise ValueError(f'Unrecognised log format {format}, it should be text or json')
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+
+    handler = logging.FileHandler(path) if path else logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if format == 'json' else logging.Formatter('%(message)s'))
+    # Unbounded so that logging never blocks, the queue is only ever as long as the output is behind
+    records = queue.SimpleQueue()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(QueueHandler(records))
+    listener = QueueListener(records, handler)
+    listener.start()
+    return listener
@@ -0,0 +1,219 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+    Counters, gauges and timers of what the bot is doing, which can be exported in the Prometheus text
+    format (over a local HTTP endpoint) and/or written to a JSON-lines file
+"""
+
+# The upper bounds (in seconds) of the buckets that timings are counted in
+TIMER_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class Timer:
+    """
+        The timings observed for a timer (with a set of labels), kept as a histogram
+
+        Attributes:
+            count: the number of timings observed
+            sum: the sum of the timings
+            max: the longest timing
+            buckets: the number of timings within each of TIMER_BUCKETS
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(TIMER_BUCKETS)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(TIMER_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+class Metrics:
+    """
+        A thread safe collection of metrics, each identified by a name and a set of labels (such as the
+        calendar or the stage of a sign-in)
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+        self._timers = {}
+        self._lock = threading.Lock()
+        self._log = None
+        self._server = None
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+            Increases a counter
+
+            Args:
+                name: the name of the counter
+                value: the amount to increase it by
+                labels: the labels of the counter
+        """
+        key = (name, _freeze(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            self._write('counter', name, labels, self._counters[key])
+
+    def set(self, name: str, value: float, **labels):
+        """
+            Sets a gauge
+
+            Args:
+                name: the name of the gauge
+                value: the value of the gauge
+                labels: the labels of the gauge
+        """
+        key = (name, _freeze(labels))
+        with self._lock:
+            if self._gauges.get(key) == value:
+                return
+            self._gauges[key] = value
+            self._write('gauge', name, labels, value)
+
+    def observe(self, name: str, seconds: float, **labels):
+        """
+            Records a timing
+
+            Args:
+                name: the name of the timer
+                seconds: the timing
+                labels: the labels of the timer
+        """
+        key = (name, _freeze(labels))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = Timer()
+            timer.observe(seconds)
+            self._write('timer', name, labels, seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+            Times the body of a with block, the timing is recorded even if the block raises
+
+            Args:
+                name: the name of the timer
+                labels: the labels of the timer
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timers(self) -> list:
+        """
+            Gets a snapshot of every timer
+
+            Returns:
+                A list of (name, labels, count, sum, max) tuples
+        """
+        with self._lock:
+            return [(name, dict(labels), timer.count, timer.sum, timer.max) for (name, labels), timer in self._timers.items()]
+
+    def render(self) -> str:
+        """
+            Renders every metric in the Prometheus text format, timers are rendered as histograms
+
+            Returns:
+                The metrics
+        """
+        lines = []
+        with self._lock:
+            for kind, metrics in (('counter', self._counters), ('gauge', self._gauges)):
+                for name in sorted({name for name, _ in metrics}):
+                    lines.append(f'# TYPE {name} {kind}')
+                    lines += [f'{name}{_render_labels(labels)} {value}' for (other, labels), value in metrics.items() if other == name]
+
+            for name in sorted({name for name, _ in self._timers}):
+                lines.append(f'# TYPE {name} histogram')
+                for (other, labels), timer in self._timers.items():
+                    if other != name:
+                        continue
+                    for bound, count in zip(TIMER_BUCKETS, timer.buckets):
+                        lines.append(f'{name}_bucket{_render_labels(labels + (("le", str(bound)),))} {count}')
+                    lines.append(f'{name}_bucket{_render_labels(labels + (("le", "+Inf"),))} {timer.count}')
+                    lines.append(f'{name}_sum{_render_labels(labels)} {timer.sum}')
+                    lines.append(f'{name}_count{_render_labels(labels)} {timer.count}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, address: str = '127.0.0.1'):
+        """
+            Serves the metrics in the Prometheus text format at /metrics, on a background thread
+
+            Args:
+                port: the port to serve on
+                address: the address to serve on, local only by default
+        """
+        # Imported here as it is only needed when the metrics are served
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((address, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def log_to(self, path: str):
+        """
+            Appends every metric update to a JSON-lines file from now on
+
+            Args:
+                path: the path of the file
+        """
+        with self._lock:
+            self._log = open(path, 'a', buffering=1)
+
+    def close(self):
+        """Stops serving the metrics and closes the JSON-lines file"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._lock:
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+
+    def _write(self, kind: str, name: str, labels: dict, value: float):
+        """Writes an update to the JSON-lines file (if there is one), the lock must be held"""
+        if self._log is not None:
+            self._log.write(json.dumps({'time': time.time(), 'type': kind, 'name': name, 'labels': labels, 'value': value}) + '\n')
+
+def _freeze(labels: dict) -> tuple:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _render_labels(labels: tuple) -> str:
+    if not len(labels):
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+# The metrics of the whole program
+METRICS = Metrics()
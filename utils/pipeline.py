@@ -1,32 +1,130 @@
-from typing import Union
+import bisect
+import itertools
+import threading
+from typing import Callable, Union
 from queue import Empty, Queue
+from utils.clock import Clock, get_clock
+from utils.metrics import METRICS
+
+def pipe_key(calendar: dict) -> str:
+    """
+        Gets the key of a calendar's pipe. In daemon mode every calendar belongs to a tenant, and tenants can watch
+        the same calendar (with their own accounts) so their calendars are kept apart by prefixing the tenant
+
+        Args:
+            calendar: the calendar's info
+
+        Returns:
+            The key
+    """
+    return f'{calendar["tenant"]}/{calendar["calendarId"]}' if 'tenant' in calendar else calendar['calendarId']
+
+class SharedPriorityQueue():
+    """
+        A single queue holding the events of every calendar, ordered by a key (such as the event's start time)
+
+        Attributes:
+            key: gets the priority of an event, lower is sooner
+            entries: a sorted list of (key, insertion order, calendarId, event) tuples
+    """
+
+    def __init__(self, key: Callable):
+        self.key = key
+        self.entries = []
+        # Breaks ties between events with the same key so that events themselves are never compared
+        self._counter = itertools.count()
+
+    def push(self, calendarId: str, event):
+        bisect.insort(self.entries, (self.key(event), next(self._counter), calendarId, event))
+
+    def pop(self, calendarId: str):
+        index = next(i for i, entry in enumerate(self.entries) if entry[2] == calendarId)
+        return self.entries.pop(index)[3]
+
+    def events(self, calendarId: str) -> list:
+        return [entry[3] for entry in self.entries if entry[2] == calendarId]
+
+class PriorityPipe():
+    """
+        A calendar's pipe within a SharedPriorityQueue, which caps how many of the calendar's events
+        the shared queue can hold. Has the same interface as the Queue used for FIFO pipes
+
+        Attributes:
+            maxsize: the maximum number of events the calendar can have in the shared queue
+            size: the number of events the calendar has in the shared queue
+    """
+
+    def __init__(self, shared: SharedPriorityQueue, calendarId: str, maxsize: int):
+        self.maxsize = maxsize
+        self.size = 0
+        self._shared = shared
+        self._calendarId = calendarId
+
+    def full(self) -> bool:
+        return self.size >= self.maxsize
+
+    def empty(self) -> bool:
+        return not self.size
+
+    def put_nowait(self, event):
+        self._shared.push(self._calendarId, event)
+        self.size += 1
+
+    def get_nowait(self):
+        if self.empty():
+            raise Empty()
+        self.size -= 1
+        return self._shared.pop(self._calendarId)
+
+    @property
+    def queue(self) -> list:
+        return self._shared.events(self._calendarId)
 
 class Pipeline():
     """
         Manages the pipeline of google calendar events
 
+        Every change to the pipes notifies a single condition, so that the producer and consumer can
+        block until there is space or an event instead of polling.
+
+        If a priority key is given then the events of every calendar are held in one queue ordered by
+        that key (each calendar is still capped at max_stored events). The soonest event is then always
+        the one that is served first, and the calendar which is furthest behind is the one that is filled first
+
         Attributes:
             pipes: a dictionary containing the queues of calendar events for all watched calendars 
+            closed: whether or not the pipeline has been closed, after which nothing waits
     """
 
     class NonExistantCalendarPipe(KeyError):
         """Raised when a given calendar ID does not exist in the pipeline"""
         pass
 
-    def __init__(self, info: list, max_stored: int = 3):
+    def __init__(self, info: list, max_stored: int = 3, priority_key: Callable = None, clock: Clock = None):
         """
             Constructs a new pipeline
 
             Args:
                 info: the list containing the calendar info
                 max_stored: the maximum number of events that a pipe can hold
+                priority_key: gets the priority of an event (lower is sooner). If None then each calendar has its own FIFO queue
+                clock: the clock that wait timeouts are measured with. If None the bot's clock is used
             
             Returns:
                 Pipeline instance
         """
         # Stores the queue for each calendar being watched as well as the calendar
         # summaries and ID
-        self.pipes = {calendar['calendarId']: Queue(max_stored) for calendar in info}
+        if priority_key is None:
+            self._shared = None
+            self.pipes = {pipe_key(calendar): Queue(max_stored) for calendar in info}
+        else:
+            self._shared = SharedPriorityQueue(priority_key)
+            self.pipes = {pipe_key(calendar): PriorityPipe(self._shared, pipe_key(calendar), max_stored) for calendar in info}
+        self.closed = False
+        self.clock = clock if clock is not None else get_clock()
+        # Notified whenever an event is put into or taken out of a pipe
+        self._changed = threading.Condition()
     
     def _check_exists(self, calendarId: str):
         """
@@ -52,26 +150,121 @@ class Pipeline():
         if self.pipes[calendarId].empty():
             raise Empty()
     
-    def get_first_non_full(self) -> Union[str, None]:
+    def get_first_non_full(self, calendarIds: list = None) -> Union[str, None]:
         """
-            Gets the first non-full queue
+            Gets the first non-full queue. When prioritised this is the calendar whose last queued event is the soonest
+
+            Args:
+                calendarIds: the calendars to check, if None then every calendar is checked
 
             Returns:
                 A calendarId related to the first non-full queue, otherwise None
         """
 
-        for id in self.pipes.keys():
-            if not self.pipes[id].full():
+        non_full = [id for id in (self.pipes.keys() if calendarIds is None else calendarIds) if not self.pipes[id].full()]
+        if self._shared is not None and len(non_full):
+            # Empty pipes are the furthest behind of all
+            return min(non_full, key=lambda id: (1, self._shared.key(self.back(id))) if not self.pipes[id].empty() else (0,))
+        return non_full[0] if len(non_full) else None
+
+    def get_first_non_empty(self, calendarIds: list = None) -> Union[str, None]:
+        """
+            Gets the first non-empty queue. When prioritised this is the calendar with the soonest queued event
+
+            Args:
+                calendarIds: the calendars to check, if None then every calendar is checked
+
+            Returns:
+                A calendarId related to the first non-empty queue, otherwise None
+        """
+
+        if self._shared is not None:
+            calendarIds = set(self.pipes.keys() if calendarIds is None else calendarIds)
+            return next((entry[2] for entry in self._shared.entries if entry[2] in calendarIds), None)
+
+        for id in self.pipes.keys() if calendarIds is None else calendarIds:
+            if not self.pipes[id].empty():
                 return id
         return None
+
+    def _wait(self, predicate, timeout: float = None, interrupted: Callable[[], bool] = None):
+        """
+            Waits on the condition until the predicate returns something other than None. The
+            condition must be held
+
+            Args:
+                predicate: called with no arguments whenever the pipeline changes
+                timeout: the maximum seconds to wait (0 doesn't wait, None waits forever)
+                interrupted: called along with the predicate, the wait stops early if it returns True
+
+            Returns:
+                The result of the predicate, or None if the wait timed out/was interrupted/the pipeline was closed
+        """
+        deadline = None if timeout is None else self.clock.monotonic() + timeout
+        while True:
+            result = predicate()
+            if result is not None or self.closed or (interrupted is not None and interrupted()):
+                return result
+            remaining = None if deadline is None else deadline - self.clock.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            self.clock.wait(self._changed, remaining)
+
+    def wait_for_space(self, calendarIds: Union[list, Callable[[], list]] = None, timeout: float = None,
+                       interrupted: Callable[[], bool] = None) -> Union[str, None]:
+        """
+            Blocks until one of the pipes has space for another event
+
+            Args:
+                calendarIds: the calendars to wait for (or a function returning them, which is called
+                    again whenever the pipeline changes), if None then every calendar is waited for
+                timeout: the maximum seconds to wait (0 doesn't wait, None waits forever)
+                interrupted: called whenever the pipeline changes or notify is called, the wait stops
+                    early if it returns True (such as when a calendar has changed)
+
+            Returns:
+                A calendarId related to a non-full queue, otherwise None
+        """
+
+        with self._changed:
+            return self._wait(lambda: self.get_first_non_full(calendarIds() if callable(calendarIds) else calendarIds), timeout, interrupted)
+
+    def wait_for_events(self, calendarIds: Union[list, Callable[[], list]] = None, timeout: float = None) -> Union[str, None]:
+        """
+            Blocks until one of the pipes has an event
+
+            Args:
+                calendarIds: the calendars to wait for (or a function returning them, which is called
+                    again whenever the pipeline changes or notify is called), if None then every calendar
+                    is waited for
+                timeout: the maximum seconds to wait (0 doesn't wait, None waits forever)
+
+            Returns:
+                A calendarId related to a non-empty queue, otherwise None
+        """
+
+        with self._changed:
+            return self._wait(lambda: self.get_first_non_empty(calendarIds() if callable(calendarIds) else calendarIds), timeout)
+
+    def notify(self):
+        """Wakes up everything waiting on the pipeline, so that they can check what they are waiting for again"""
+        with self._changed:
+            self._changed.notify_all()
+
+    def close(self):
+        """Closes the pipeline, waking up everything waiting on it"""
+        with self._changed:
+            self.closed = True
+            self._changed.notify_all()
     
-    def put_event(self, calendarId: str, event) -> bool:
+    def put_event(self, calendarId: str, event, timeout: float = 0) -> bool:
         """
             Puts an event into the appropriate pipe queue
 
             Args:
                 calendarId: the calendar that is related to the event
                 event: the event to add
+                timeout: the maximum seconds to wait for space (0 doesn't wait, None waits forever)
             
             Raises:
                 NonExistantCalendarPipe: if the given calendarId does not have a correlated pipe
@@ -81,17 +274,21 @@ class Pipeline():
         """
 
         self._check_exists(calendarId)
-        if not self.pipes[calendarId].full():
-            self.pipes[calendarId].put(event)
+        with self._changed:
+            if self._wait(lambda: True if not self.pipes[calendarId].full() else None, timeout) is None:
+                return False
+            self.pipes[calendarId].put_nowait(event)
+            METRICS.set('pipe_depth', len(self.pipes[calendarId].queue), calendar=calendarId)
+            self._changed.notify_all()
             return True
-        return False
     
-    def get_event(self, calendarId: str):
+    def get_event(self, calendarId: str, timeout: float = 0):
         """
             Gets the next event from the appropriate pipe queue
 
             Args:
                 calendarId: the calendar that is related to the pipe to get from
+                timeout: the maximum seconds to wait for an event (0 doesn't wait, None waits forever)
             
             Raises:
                 NonExistantCalendarPipe: if the given calendarId does not have a correlated pipe
@@ -101,10 +298,55 @@ class Pipeline():
         """
 
         self._check_exists(calendarId)
-        if not self.pipes[calendarId].empty():
-            return self.pipes[calendarId].get()
-        return None
+        with self._changed:
+            if self._wait(lambda: True if not self.pipes[calendarId].empty() else None, timeout) is None:
+                return None
+            event = self.pipes[calendarId].get_nowait()
+            METRICS.set('pipe_depth', len(self.pipes[calendarId].queue), calendar=calendarId)
+            self._changed.notify_all()
+            return event
     
+    def events(self, calendarId: str) -> list:
+        """
+            Gets the events in the appropriate pipe queue without removing them
+
+            Args:
+                calendarId: the calendar that is related to the pipe to check
+
+            Raises:
+                NonExistantCalendarPipe: if the given calendarId does not have a correlated pipe
+
+            Returns:
+                The events, soonest first
+        """
+
+        self._check_exists(calendarId)
+        with self._changed:
+            return list(self.pipes[calendarId].queue)
+
+    def clear(self, calendarId: str) -> list:
+        """
+            Removes every event from the appropriate pipe queue, such as when they are out of date
+
+            Args:
+                calendarId: the calendar that is related to the pipe to clear
+
+            Raises:
+                NonExistantCalendarPipe: if the given calendarId does not have a correlated pipe
+
+            Returns:
+                The removed events, soonest first
+        """
+
+        self._check_exists(calendarId)
+        with self._changed:
+            events = []
+            while not self.pipes[calendarId].empty():
+                events.append(self.pipes[calendarId].get_nowait())
+            METRICS.set('pipe_depth', 0, calendar=calendarId)
+            self._changed.notify_all()
+            return events
+
     def empty(self, calendarId: str) -> bool:
         """
             Checks if the queue related to the given calendar ID is empty
@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import logging
+import threading
+from concurrent.futures import Executor
+from datetime import datetime
+from utils.clock import Clock, get_clock
+
+"""
+    A single threaded scheduler which runs jobs at their deadlines
+"""
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """
+        A function that has been scheduled to run
+
+        Attributes:
+            deadline: the monotonic time (of the scheduler's clock) at which the job should run
+            func: the function to run
+            args: the arguments to call the function with
+            cancelled: whether or not the job has been cancelled
+    """
+
+    def __init__(self, deadline: float, func, args: tuple):
+        self.deadline = deadline
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+class Scheduler:
+    """
+        Holds jobs in a heap ordered by their (monotonic) deadlines, and runs each one at its deadline.
+
+        The thread running the scheduler sleeps on a condition until the soonest deadline, or until a
+        sooner job is scheduled, so no time is spent polling while waiting. Jobs are run on the
+        scheduler's thread unless an executor is given, in which case they are handed to it so that
+        long jobs can run concurrently
+    """
+
+    def __init__(self, executor: Executor = None, clock: Clock = None):
+        """
+            Constructs a new scheduler
+
+            Args:
+                executor: runs the jobs once they are due. If None jobs are run on the scheduler's thread
+                clock: the clock that deadlines are kept with. If None the bot's clock is used
+        """
+        self.executor = executor
+        self.clock = clock if clock is not None else get_clock()
+        self._heap = []
+        # Breaks ties between jobs with the same deadline so that jobs themselves are never compared
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._stopped = False
+
+    def schedule_in(self, delay: float, func, *args) -> Job:
+        """
+            Schedules a function to run after the given delay
+
+            Args:
+                delay: the number of seconds to wait before running the function
+                func: the function to run
+                args: the arguments to call the function with
+
+            Returns:
+                The scheduled job, which can be cancelled
+        """
+        job = Job(self.clock.monotonic() + max(delay, 0), func, args)
+        with self._condition:
+            heapq.heappush(self._heap, (job.deadline, next(self._counter), job))
+            # Wake the scheduler as the new job might be sooner than the one it is waiting for
+            self._condition.notify()
+        return job
+
+    def schedule_at(self, when: datetime, func, *args) -> Job:
+        """
+            Schedules a function to run at the given (timezone aware) time
+
+            Args:
+                when: the time to run the function at
+                func: the function to run
+                args: the arguments to call the function with
+
+            Returns:
+                The scheduled job, which can be cancelled
+        """
+        return self.schedule_in((when - self.clock.now(when.tzinfo)).total_seconds(), func, *args)
+
+    def cancel(self, job: Job):
+        """
+            Cancels a scheduled job, the job is dropped when its deadline is reached
+
+            Args:
+                job: the job to cancel
+        """
+        job.cancelled = True
+
+    def __len__(self) -> int:
+        with self._condition:
+            return sum(not job.cancelled for _, _, job in self._heap)
+
+    def stop(self):
+        """Stops the scheduler, jobs that have not been run yet are discarded"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def run(self, event: threading.Event):
+        """
+            Runs jobs as their deadlines are reached until the scheduler is stopped
+
+            Args:
+                event: the exit event
+        """
+        while True:
+            with self._condition:
+                while not self._stopped and not event.is_set():
+                    if not len(self._heap):
+                        self._condition.wait()
+                        continue
+                    remaining = self._heap[0][0] - self.clock.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.clock.wait(self._condition, remaining)
+                if self._stopped or event.is_set():
+                    return
+                _, _, job = heapq.heappop(self._heap)
+
+            if job.cancelled:
+                continue
+            if self.executor is not None:
+                self.executor.submit(self._run_job, job)
+            else:
+                self._run_job(job)
+
+    @staticmethod
+    def _run_job(job: Job):
+        """
+            Runs a job, logging any exception it raises
+
+            Args:
+                job: the job to run
+        """
+        try:
+            job.func(*job.args)
+        except Exception as exc:
+            # A failing job shouldn't take every other scheduled job down with it
+            logger.exception(exc)
@@ -1,5 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Union
+from utils.clock import get_clock
 
 """
     A collection of time utilities
@@ -7,7 +8,7 @@ from typing import Union
 
 def get_utc_now(tz, iso: bool = False) -> Union[datetime, str]:
     """
-        Gets the UTC time with the correct timezone.
+        Gets the UTC time with the correct timezone, from the bot's clock.
 
         Args:
             tz: the timezone object
@@ -16,7 +17,7 @@ def get_utc_now(tz, iso: bool = False) -> Union[datetime, str]:
         Returns:
             Datetime now if iso is false, otherwise a string in ISO format
     """
-    now = datetime.now().astimezone(tz)
+    now = get_clock().now().astimezone(tz)
     return now if not iso else now.isoformat()
 
 def get_pretty_time(t: datetime) -> str:
@@ -65,3 +66,19 @@ def fromiso_Z(time: str) -> datetime:
             The input ISO string as a datetime object 
     """
     return datetime.fromisoformat(time.replace('Z', ''))
+
+def fromiso_aware(time: str) -> datetime:
+    """
+        Gives a timezone aware datetime when given a string in ISO format.
+
+        Unlike fromiso_Z the Z is treated as UTC, as are strings without any offset, so the returned
+        datetimes can always be compared against each other
+
+        Args:
+            time: the datetime (or date) in ISO format
+
+        Returns:
+            The input ISO string as an aware datetime object
+    """
+    parsed = datetime.fromisoformat(time.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
@@ -0,0 +1,117 @@
+import secrets
+import threading
+from typing import Callable
+from utils.metrics import METRICS
+
+"""
+    A local HTTP receiver for the push notifications that Google Calendar sends to watch channels, so that
+    calendars are only refreshed when they change rather than by polling
+"""
+
+class WebhookReceiver:
+    """
+        Receives the notifications of watch channels, remembering which channels have changed until they are popped
+
+        Attributes:
+            address: the address that notifications should be sent to (set once serving if not given)
+            token: the secret sent with the notifications of our channels, notifications without it are ignored
+            on_change: called (with no arguments) whenever a channel changes, such as to wake the producer
+    """
+
+    def __init__(self, address: str = None, on_change: Callable = None):
+        """
+            Constructs a new receiver
+
+            Args:
+                address: the (public) address that Google sends notifications to, which forwards them to the port
+                    being served. If None then the local address being served is used
+                on_change: called whenever a channel changes
+        """
+        self.address = address
+        self.token = secrets.token_urlsafe(16)
+        self.on_change = on_change
+        self._changed = set()
+        self._lock = threading.Lock()
+        self._server = None
+
+    def receive(self, channel_id: str, token: str, state: str) -> bool:
+        """
+            Handles a notification
+
+            Args:
+                channel_id: the ID of the channel the notification is for
+                token: the token the notification was sent with
+                state: the resource state of the notification, sync is sent when a channel is created
+                    and exists when something in the calendar changes
+
+            Returns:
+                False if the notification wasn't sent by one of our channels, otherwise True
+        """
+        if not channel_id or not secrets.compare_digest(token or '', self.token):
+            return False
+        METRICS.inc('webhook_notifications_total', state=state)
+        if state == 'sync':
+            return True
+        with self._lock:
+            self._changed.add(channel_id)
+        if self.on_change is not None:
+            self.on_change()
+        return True
+
+    def has_changed(self) -> bool:
+        """
+            Returns:
+                Whether or not any channels have changed since they were last popped
+        """
+        with self._lock:
+            return len(self._changed) > 0
+
+    def pop_changed(self) -> set:
+        """
+            Gets the channels which have changed since this was last called
+
+            Returns:
+                The IDs of the channels
+        """
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return changed
+
+    def serve(self, port: int, address: str = '127.0.0.1'):
+        """
+            Receives notifications (POSTed to any path) on a background thread
+
+            Args:
+                port: the port to serve on, 0 picks a free port
+                address: the address to serve on, local only by default
+        """
+        # Imported here as it is only needed when notifications are received
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                # Notifications have an empty body, everything is in the headers
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                received = receiver.receive(self.headers.get('X-Goog-Channel-ID'), self.headers.get('X-Goog-Channel-Token'),
+                                            self.headers.get('X-Goog-Resource-State'))
+                self.send_response(200 if received else 404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((address, port), Handler)
+        self._server.daemon_threads = True
+        if self.address is None:
+            self.address = f'http://{address}:{self._server.server_address[1]}/'
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        """Stops receiving notifications"""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
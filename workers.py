@@ -1,13 +1,18 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
+from utils.clock import get_clock
 from utils.config import CONFIG
-from utils.time_utils import get_pretty_range, get_pretty_time, get_utc_now, fromiso_Z
-from registration import CannotLoginException, click_button
-from time import sleep
+from utils.metrics import METRICS
+from utils.event import Event, get_timezone
+from utils.time_utils import get_pretty_range, get_pretty_time, get_utc_now
+from registration import BrowserPool, CannotLoginException, NoBrowserAvailable, SignInSession, click_button
+import logging
 import random
+from collections import defaultdict, deque
 import threading
-from utils.pipeline import Pipeline
+from utils.pipeline import Pipeline, pipe_key
+from utils.scheduler import Scheduler
+from utils.webhook import WebhookReceiver
 from google_calendar import CalendarAPI
-import pytz
 
 # Gather parameters from config
 MIN_CLICK_TIMEOUT = CONFIG.MIN_CLICK_TIMEOUT  # seconds
@@ -21,140 +26,422 @@ SCHEDULE_START_PERCENT = CONFIG.SCHEDULE_START_PERCENT
 SCHEDULE_END_PERCENT = CONFIG.SCHEDULE_END_PERCENT
 
 HEADLESS = CONFIG.HEADLESS
+PRE_LOGIN_LEAD = CONFIG.PRE_LOGIN_LEAD  # seconds
+SESSION_RETRIES = CONFIG.SESSION_RETRIES
+MAX_SESSION_CLICK_TIMEOUT = CONFIG.MAX_SESSION_CLICK_TIMEOUT  # seconds
 
+logger = logging.getLogger(__name__)
 
-def calendar_event_producer(info: list, calendar_api: CalendarAPI, pipeline: Pipeline, event: threading.Event):
+def calendar_event_producer(info: list, calendar_api: CalendarAPI, pipeline: Pipeline, event: threading.Event, receiver: WebhookReceiver = None):
     """
         Produces calendar events on the pipeline for every calendar.
 
         Flow:
-        1. Check if one of the pipes is not full
+        1. Wait until one of the pipes is not full
         2. Get the event after the last event in the non-full pipe's relevant calendar
         3. Add that event to the queue
 
+        With a webhook receiver every calendar is watched for changes. When one changes its events are
+        refetched, and if any of its queued events have been edited or removed they are queued again.
+        Polling (see FETCH_WINDOW_TTL) still finds changes to calendars that couldn't be watched
+
         Args:
             info: all chosen calendars to get events for
             calendar_api: interacts with the Google calendar API
             pipeline: pipeline to read/write to
             event: the exit event
+            receiver: receives push notifications when calendars change. If None calendars are only polled
     """
 
-    # Get an event from a calendar to access the timezone
-    timezone = pytz.timezone(calendar_api.get_next_n(info[0]['calendarId'])[0]['start']['timeZone'])
+    # The timezone of the first calendar, which comes from the (possibly cached) calendar list
+    try:
+        timezone = get_timezone(calendar_api.get_timezone(info[0]['calendarId']))
+    except Exception as e:
+        # Only used to say when now is, so any timezone will do
+        logger.warning('PRODUCER - Could not get the timezone of the calendars, using UTC (%s)', e)
+        timezone = get_timezone('UTC')
     
+    # Calendars are looked up by the keys of their pipes, as the same calendar can be watched by more than one tenant
+    calendars = {pipe_key(_info): _info for _info in info}
     # Construct a lookup table of the furthest events put into the queue, this means that the back of the 
     # queue doesn't need to be check
-    furthest = {_info['calendarId']: get_utc_now(timezone, True) for _info in info}
+    furthest = {key: get_utc_now(timezone, True) for key in calendars}
+    # Calendars without any upcoming events that match aren't checked again until the (monotonic) time stored here
+    retry_at = {}
+    # The time each of the queued events was looked up after (the end of the event before it), so they can be looked up again
+    afters = {key: deque(maxlen=pipeline.pipes[key].maxsize) for key in calendars}
+
+    # When (monotonic) the watch channels next need renewing
+    renew_at = None
+    if receiver is not None:
+        receiver.on_change = pipeline.notify
+        for calendarId in {calendar_info['calendarId'] for calendar_info in info}:
+            try:
+                calendar_api.watch(calendarId, receiver.address, receiver.token)
+            except Exception as e:
+                logger.warning('PRODUCER - Could not watch %s for changes, it will be polled instead (%s)', calendarId, e, extra={'calendar': calendarId})
+        renew_at = get_clock().monotonic()
+
+    while not event.is_set() and not pipeline.closed:
+        if receiver is not None:
+            if renew_at is not None and renew_at <= get_clock().monotonic():
+                try:
+                    renew_in = calendar_api.renew_channels(receiver.address, receiver.token)
+                except Exception as e:
+                    logger.warning('PRODUCER - Could not renew the watch channels, trying again in %s seconds (%s)', LOOP_TIMEOUT, e)
+                    renew_in = LOOP_TIMEOUT
+                renew_at = None if renew_in is None else get_clock().monotonic() + renew_in
+            for calendarId in filter(None, map(calendar_api.watched_calendar, receiver.pop_changed())):
+                calendar_api.invalidate(calendarId)
+                for key in [key for key in calendars if calendars[key]['calendarId'] == calendarId]:
+                    # Calendars without upcoming events are checked again straight away, as one might have been added
+                    retry_at.pop(key, None)
+                    queued = pipeline.events(key)
+                    if not len(queued):
+                        continue
+                    try:
+                        current = calendar_api.get_next_n(calendarId, n=len(queued), after=afters[key][-len(queued)], search_params=calendars[key]['search_params'])
+                    except Exception as e:
+                        # Its events are queued again once the calendar can be fetched, in case they did change
+                        logger.warning('PRODUCER - Could not fetch changed calendar "%s", trying again in %s seconds (%s)',
+                                       calendars[key]['calendarSummary'].upper(), LOOP_TIMEOUT, e, extra={'calendar': key})
+                        retry_at[key] = get_clock().monotonic() + LOOP_TIMEOUT
+                        current = None
+                    if current == queued:
+                        continue
+                    dropped = pipeline.clear(key)
+                    if len(dropped):
+                        logger.info('PRODUCER - Calendar: "%s" has changed, queueing its events again', calendars[key]['calendarSummary'].upper(), extra={'calendar': key})
+                        furthest[key] = afters[key][-len(dropped)]
+                        afters[key].clear()
+
+        now = get_clock().monotonic()
+        ready = [key for key in calendars if retry_at.get(key, now) <= now]
+        timeouts = [retry - now for retry in retry_at.values() if retry > now] + ([renew_at - now] if renew_at is not None else [])
+        key = pipeline.wait_for_space(ready, timeout=min(timeouts) if len(timeouts) else None,
+                                      interrupted=receiver.has_changed if receiver is not None else None)
+        if key is not None:
+            # Every calendar with space is fetched for in one batch, rather than one round trip each as they're filled
+            spaced = [other for other in ready if not pipeline.full(other)]
+            if len(spaced) > 1:
+                try:
+                    calendar_api.prefetch([(calendars[other]['calendarId'], furthest[other], calendars[other]['search_params']) for other in spaced])
+                except Exception as e:
+                    # Only an optimisation, each calendar is still fetched (and retried) on its own below
+                    logger.warning('PRODUCER - Could not prefetch %s calendars (%s)', len(spaced), e)
 
-    while not event.is_set():
-        calendar_ID = pipeline.get_first_non_full()
-        if calendar_ID is not None:
-            calendar_info = list(filter(lambda x: x['calendarId'] == calendar_ID, info))[0]
+            calendar_info = calendars[key]
             search_params = calendar_info['search_params']
-            print(f'\nPRODUCER - Calendar: \"{calendar_info["calendarSummary"].upper()}\" has a non-full pipe')
 
-            next_event = calendar_api.get_next_n(calendar_ID, after=furthest[calendar_ID], search_params=search_params)[0]
-            furthest[calendar_ID] = next_event['end'].get('dateTime', next_event['end'].get('date', get_utc_now(timezone, True)))
+            try:
+                next_events = calendar_api.get_next_n(calendar_info['calendarId'], after=furthest[key], search_params=search_params)
+            except Exception as e:
+                # An API or network error mustn't stop events being queued for good, the calendar is tried again later
+                logger.warning('PRODUCER - Could not fetch calendar "%s", trying again in %s seconds (%s)',
+                               calendar_info['calendarSummary'].upper(), LOOP_TIMEOUT, e, extra={'calendar': key})
+                retry_at[key] = get_clock().monotonic() + LOOP_TIMEOUT
+                continue
+            if not len(next_events):
+                if key not in retry_at:
+                    logger.info('PRODUCER - Calendar: "%s" has no upcoming events that match the search params, checking again every %s seconds',
+                                calendar_info['calendarSummary'].upper(), LOOP_TIMEOUT, extra={'calendar': key})
+                retry_at[key] = get_clock().monotonic() + LOOP_TIMEOUT
+                continue
+            retry_at.pop(key, None)
+            next_event = next_events[0]
+            afters[key].append(furthest[key])
+            furthest[key] = next_event.end.isoformat()
 
-            print(f'\tAdded event: \"{next_event["summary"]}\" ({get_pretty_range(next_event["start"]["dateTime"], next_event["end"]["dateTime"])})')
-            pipeline.put_event(calendar_ID, next_event)
-            if pipeline.full(calendar_ID):
-                print(f'\t~ PIPE IS FULL ~')
-        sleep(LOOP_TIMEOUT)
+            pipeline.put_event(key, next_event)
+            # One record for the whole fill, rather than a line each
+            logger.info('PRODUCER - Calendar: "%s" has a non-full pipe, added event: "%s" (%s)%s', calendar_info['calendarSummary'].upper(), next_event.summary,
+                        get_pretty_range(next_event.start, next_event.end), ' ~ PIPE IS FULL ~' if pipeline.full(key) else '',
+                        extra={'calendar': key, 'event': next_event.summary})
 
-def button_consumer(info: dict, pipeline: Pipeline, event: threading.Event, selenium_lock: threading.Lock):
+    if receiver is not None:
+        calendar_api.stop_watching()
+
+class SignInJob:
+    """
+        A scheduled sign-in for a single calendar event, which is run by the scheduler at its check time
+        and reschedules itself (backing off) until it either signs in or the event ends
+
+        Attributes:
+            info: the info of the calendar that the event is from
+            current_event: the google calendar event to sign into
+            course_id: the course ID of the event
+            timezone: the timezone of the event
+            check_time: the time the sign-in was first scheduled for
+            end: the end of the event
+            timeout: the seconds to wait before the next attempt
+            attempts: the number of sign-in attempts made so far
+            session: the logged in session which attempts refresh and click with, None if there isn't one
+            log: logs messages about the sign-in along with its calendar and event
     """
-        Consumes google calendar events and clicks the sign-in button.
 
-        Each one will be assigned to a calendar to watch
+    def __init__(self, info: dict, current_event: Event, scheduler: Scheduler, event: threading.Event, account_lock: threading.Lock, pool: BrowserPool, on_done):
+        """
+            Works out the check time of the event
+
+            Args:
+                info: the info of the calendar that the event is from
+                current_event: the google calendar event to sign into
+                scheduler: the scheduler to run the attempts on
+                event: the exit event
+                account_lock: held whilst signing into the calendar's account
+                pool: the pool of browsers to sign in with
+                on_done: called with the job, and whether or not its calendar should stop being watched, once it has finished
+        """
+        self.info = info
+        self.current_event = current_event
+        self.scheduler = scheduler
+        self.event = event
+        self.account_lock = account_lock
+        self.pool = pool
+        self.on_done = on_done
+        self.course_id = current_event.course_id
+        # Every message about the sign-in is logged with its calendar and event
+        self.log = logging.LoggerAdapter(logger, {'calendar': pipe_key(info), 'event': current_event.summary})
+        self.timezone = current_event.timezone
+        start = current_event.start
+        now = get_utc_now(self.timezone)
+
+        # If we are midway through an event then the scheduled time will be somewhere between NOW and the end of the event
+        # This shouldn't happen unless the bot is started during an event
+        if now > start:
+            start = now
+
+        self.end = current_event.end
+        range_seconds = (self.end - start).seconds
+
+        # This is the first time the register attendance page will be check, this is to stop botcheckers/checking when there isn't anything to check
+        check_time = start + timedelta(seconds=random.randint(int(range_seconds * SCHEDULE_START_PERCENT), int(range_seconds * SCHEDULE_END_PERCENT)))
+        self.check_time = check_time.replace(tzinfo=start.tzinfo)
+        self.timeout = MIN_CLICK_TIMEOUT
+        self.attempts = 0
+        self.session = None
+
+    def schedule(self):
+        """Schedules the first sign-in attempt at the check time, and logging in ahead of it"""
+        self.log.info('%s: Scheduled to sign into "%s" at %s', self.name, self.current_event.summary, get_pretty_time(self.check_time))
+        if PRE_LOGIN_LEAD > 0:
+            self.scheduler.schedule_at(self.check_time - timedelta(seconds=PRE_LOGIN_LEAD), self.prepare)
+        self.scheduler.schedule_at(self.check_time, self.attempt)
+
+    def prepare(self):
+        """
+            Logs in ahead of the check time so that the first attempt only has to refresh the attendance page
+            and click. With the http engine a browser is logged in instead if the HTTP login can't be used (see
+            SignInSession.open). If logging in fails (or the account is busy signing into another event) the first attempt
+            starts from scratch
+        """
+        # Waiting for the account would tie up one of the threads that every account signs in with
+        if not self.account_lock.acquire(blocking=False):
+            self.log.info('%s: Account is busy, logging in at %s instead', self.name, get_pretty_time(self.check_time))
+            return
+        try:
+            # The first attempt may have started already if logging in was held up
+            if self.event.is_set() or self.attempts:
+                return
+            self.log.info('%s: Logging in ahead of "%s"...', self.name, self.current_event.summary)
+            session = SignInSession(self.info['username'], self.info['password'], headless=HEADLESS, pool=self.pool)
+            try:
+                if session.open():
+                    self.session = session
+                else:
+                    self.log.warning('%s: No browser free to log in with ahead of time, logging in at %s instead', self.name, get_pretty_time(self.check_time))
+            except Exception as e:
+                self.log.warning('%s: Could not log in ahead of time (%s), trying again at %s', self.name, e, get_pretty_time(self.check_time))
+        finally:
+            self.account_lock.release()
+
+    def close(self):
+        """Closes the logged in session, if there is one"""
+        session, self.session = self.session, None
+        if session is not None:
+            session.close()
+
+    @property
+    def name(self) -> str:
+        return f'{self.info["calendarSummary"].upper()} SIGN-IN'
+
+    def still_alive(self):
+        """Logs (at the debug level) a message saying what this job is waiting for"""
+        # Logged every STILL_ALIVE minutes, so the times aren't formatted unless the message is written
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug('%s: STILL WAITING - UP NEXT: "%s" at %s - Time now: %s', self.name, self.current_event.summary,
+                           get_pretty_time(self.check_time), get_pretty_time(get_utc_now(self.timezone)))
+
+    def attempt(self):
+        """
+            Tries to sign in using the click_button function, rescheduling itself with a backed off
+            timeout if it could not.
+
+            With SESSION_RETRIES the job's session is kept logged in between attempts, so that each retry
+            only refreshes the attendance page. As retries are cheap the timeout is capped at MAX_SESSION_CLICK_TIMEOUT.
+            The session is given back once another account is waiting for a browser.
+
+            Attempts never wait for the account or for a browser, as they run on the threads that every account
+            signs in with. Instead they are tried again after MIN_CLICK_TIMEOUT (without backing off)
+        """
+        if self.event.is_set():
+            return
+
+        calendarId = pipe_key(self.info)
+        now = get_utc_now(self.timezone)
+        if now >= self.end:
+            # Current time exceeds event time slot, so we should just discard this event and move onto the next
+            self.log.warning('%s: Could not click on button within event time slot. Closing this event :(', self.name)
+            self.close()
+            METRICS.inc('sign_in_attempts_total', calendar=calendarId, outcome='expired')
+            self.on_done(self, False)
+            return
+
+        # Other accounts can sign in at the same time, but an account's own sign-ins share its browsers and session
+        if not self.account_lock.acquire(blocking=False):
+            METRICS.inc('sign_in_attempts_total', calendar=calendarId, outcome='account_busy')
+            self.scheduler.schedule_in(MIN_CLICK_TIMEOUT, self.attempt)
+            return
+
+        self.attempts += 1
+        if self.attempts == 1:
+            # How late the scheduler started the sign-in
+            METRICS.observe('sign_in_lateness_seconds', max((now - self.check_time).total_seconds(), 0), calendar=calendarId)
+
+        try:
+            self.log.info('%s: Preparing to click-in...', self.name)
+
+            try:
+                with METRICS.timer('sign_in_attempt_seconds', calendar=calendarId):
+                    if self.session is None and SESSION_RETRIES:
+                        session = SignInSession(self.info['username'], self.info['password'], headless=HEADLESS, pool=self.pool)
+                        # Without a free browser this attempt borrows one using click_button instead, and the next attempt tries again
+                        if session.open():
+                            self.session = session
+                    if self.session is not None:
+                        try:
+                            clicked = self.session.click(course_id=self.course_id, search_params=self.info['search_params'])
+                        except Exception:
+                            self.close()
+                            raise
+                        # Without SESSION_RETRIES only the first attempt uses the session logged in ahead of time
+                        if clicked or not SESSION_RETRIES:
+                            self.close()
+                    else:
+                        clicked = click_button(self.info['username'], self.info['password'], headless=HEADLESS, course_id=self.course_id,
+                                               search_params=self.info['search_params'], pool=self.pool, block=False)
+                    # Sessions hold onto their browsers between attempts, which could keep other accounts from ever signing in
+                    if not clicked and self.session is not None and self.pool.wanted(self.info['username']):
+                        self.close()
+            finally:
+                self.account_lock.release()
+        except NoBrowserAvailable:
+            self.log.info('%s: No browser free to sign in with, trying again in %s seconds', self.name, MIN_CLICK_TIMEOUT)
+            METRICS.inc('sign_in_attempts_total', calendar=calendarId, outcome='no_browser')
+            self.scheduler.schedule_in(MIN_CLICK_TIMEOUT, self.attempt)
+            return
+        except CannotLoginException:
+            self.log.error('%s FATAL ERROR: Could not access account for "%s" as login info was incorrect. Terminating consumer...', self.name, self.info['calendarSummary'])
+            METRICS.inc('sign_in_attempts_total', calendar=calendarId, outcome='login_failed')
+            self.on_done(self, True)
+            return
+        except Exception as e:
+            # Anything else (such as the page not loading) is retried like a missed click, until the event ends
+            self.log.error('%s: Error whilst signing into "%s" (%s), delaying by %s seconds', self.name, self.current_event.summary, e, self.timeout)
+            METRICS.inc('sign_in_attempts_total', calendar=calendarId, outcome='error')
+            self.close()
+            self.reschedule()
+            return
+        METRICS.inc('sign_in_attempts_total', calendar=calendarId, outcome='clicked' if clicked else 'not_clicked')
+
+        times = get_pretty_range(self.current_event.start, self.current_event.end)
+        if clicked:
+            self.log.info('%s: You have registered your attendance for "%s" at %s', self.name, self.current_event.summary, times)
+        else:
+            self.log.info('%s: Could not register attendance for "%s" at %s, delaying by %s seconds', self.name, self.current_event.summary, times, self.timeout)
+
+        if clicked:
+            self.on_done(self, False)
+            return
+
+        self.reschedule()
+
+    def reschedule(self):
+        """Schedules the next attempt after the timeout, backing off the timeout after it"""
+        # If button has not been clicked then increase timeout
+        self.timeout = int(self.timeout * BACKOFF_MULT)
+        max_timeout = MAX_SESSION_CLICK_TIMEOUT if self.session is not None else MAX_CLICK_TIMEOUT
+        if self.timeout > max_timeout:
+            self.timeout = max_timeout
+        self.scheduler.schedule_in(self.timeout, self.attempt)
+
+def button_consumer(info: list, pipeline: Pipeline, scheduler: Scheduler, event: threading.Event, pool: BrowserPool):
+    """
+        Consumes google calendar events from every calendar's pipe and schedules their sign-ins.
+
+        A calendar only has one event taken off its pipe at a time, the next is taken once the
+        current event has been signed into or has ended
 
         Flow:
-        1. Check if there are events in the corresponding pipe's queue
-        2. If so retrieve the event
-        3. Wait until the event is going to happen + random_range(start, end - threshold) (while True + sleep())
-        4. Use the click_button function to open web page and try and sign in
-            4a. If this fails then keep retrying until the end of the event/success
+        1. Wait until there are events in the pipe of a calendar without a scheduled sign-in
+        2. Retrieve the event
+        3. Schedule a sign-in at event start + random_range(start, end - threshold) on the scheduler
+        4. The scheduler uses the click_button function to open web page and try and sign in
+            4a. Sign-ins of different accounts can run at the same time (up to the scheduler's executor)
+            4b. If this fails then the attempt is rescheduled until the end of the event/success
         
         Args:
-            info: the info of the calendar that the consumed events are coming from
+            info: the info of all the calendars that the consumed events are coming from
             pipeline: pipeline object to read/write to
+            scheduler: the scheduler that runs the sign-ins
             event: the exit event
+            pool: the pool of browsers to sign in with
     """
 
-    calendarId = info['calendarId']
-    calendarSummary = info['calendarSummary']
-    username = info['username']
-    password = info['password']
-
-    print(f'\n{calendarSummary.upper()} THREAD: Spinning up...')
-    emergency_exit = False
-
-    while not event.is_set() and not emergency_exit:
-        if not pipeline.empty(calendarId):
-            current_event = pipeline.get_event(calendarId)
-            course_id = current_event['summary'].split(' ')[0].lower()
-
-            start = fromiso_Z(current_event['start']['dateTime'])
-            timezone = pytz.timezone(current_event['start']['timeZone'])
-            start = start.astimezone(timezone)
-            now = get_utc_now(timezone)
-
-            # If we are midway through an event then the scheduled time will be somewhere between NOW and the end of the event
-            # This shouldn't happen unless the bot is started during an event
-            if now > start:
-                start = now
-
-            end = fromiso_Z(current_event['end']['dateTime'])
-            end = end.astimezone(timezone)
-            range_seconds = (end - start).seconds
-
-            # This is the first time the register attendance page will be check, this is to stop botcheckers/checking when there isn't anything to check
-            check_time = start + timedelta(seconds=random.randint(int(range_seconds * SCHEDULE_START_PERCENT), int(range_seconds * SCHEDULE_END_PERCENT)))
-            check_time = check_time.replace(tzinfo=start.tzinfo)
-            
-            print(f'\n{calendarSummary.upper()} THREAD: Scheduled to sign into \"{current_event["summary"]}\" at {get_pretty_time(check_time)}')
-
-            clicked = False
-            # Keep looping until the check_time
-            timeout = MIN_CLICK_TIMEOUT
-            alive_message = True
-            while not clicked and not event.is_set():
-                now = get_utc_now(timezone)
-
-                # Print a still alive message every STILL_ALIVE mins
-                if now.minute % STILL_ALIVE == 0 and alive_message:
-                    print(f'\n{calendarSummary.upper()} THREAD: STILL WAITING - UP NEXT: \"{current_event["summary"]}\" at {get_pretty_time(check_time)} - Time now: {get_pretty_time(now)}')
-                    alive_message = False
-                elif now.minute % STILL_ALIVE != 0:
-                    alive_message = True
-
-                if now >= end:
-                    # Current time exceeds event time slot, so we should just discard this event and move onto the next
-                    print(f'\n{calendarSummary.upper()} THREAD: Could not click on button within event time slot. Closing this event :(')
-                    break
-                elif now >= check_time:
-                    try:
-                        print(f'\n{calendarSummary.upper()} THREAD: Preparing to click-in... ', end='')
-
-                        # Starting selenium so acquire lock, bad things could happen if another thread is scheduled during selenium
-                        selenium_lock.acquire(blocking=True)
-                        clicked = click_button(username, password, headless=HEADLESS, course_id=course_id, search_params=info['search_params'])
-                        selenium_lock.release()
-
-                        for_part = f'for \"{current_event["summary"]}\" at {get_pretty_range(current_event["start"]["dateTime"], current_event["end"]["dateTime"])}'
-                        print(f'You have registered your attendance {for_part}' if clicked else f'Could not register attendance {for_part}, delaying by {timeout} seconds')
-
-                        # If button has not been clicked then increase timeout
-                        if not clicked:
-                            timeout = int(timeout * BACKOFF_MULT)
-                            if timeout > MAX_CLICK_TIMEOUT:
-                                timeout = MAX_CLICK_TIMEOUT
-                        else:
-                            break
-                    except CannotLoginException:
-                        print(f'\n{calendarSummary.upper()} THREAD FATAL ERROR: Could not access account for \"{calendarSummary}\" as login info was incorrect. Terminating consumer...')
-                        timeout = MIN_CLICK_TIMEOUT
-                        emergency_exit = True
-                        break
-                sleep(timeout)
-        sleep(LOOP_TIMEOUT)
+    logger.info('CONSUMER THREAD: Spinning up for %s calendars...', len(info))
+    # The currently scheduled sign-in of each calendar, and the calendars that should no longer be watched
+    scheduled = {}
+    terminated = set()
+    lock = threading.Lock()
+    account_locks = defaultdict(threading.Lock)
+    # Calendars are looked up by the keys of their pipes, as the same calendar can be watched by more than one tenant
+    calendars = {pipe_key(calendar): calendar for calendar in info}
+
+    def on_done(job: SignInJob, terminate: bool):
+        with lock:
+            scheduled.pop(pipe_key(job.info), None)
+            if terminate:
+                terminated.add(pipe_key(job.info))
+            METRICS.set('scheduled_sign_ins', len(scheduled))
+        # The calendar can have its next event taken off its pipe
+        pipeline.notify()
+
+    def idle():
+        with lock:
+            return [key for key in calendars if key not in scheduled and key not in terminated]
+
+    def still_alive():
+        with lock:
+            jobs = list(scheduled.values())
+        for job in jobs:
+            job.still_alive()
+        # Browsers left idle since the last message can be quit to free up memory
+        pool.reap()
+        scheduler.schedule_in(STILL_ALIVE * 60, still_alive)
+
+    scheduler.schedule_in(STILL_ALIVE * 60, still_alive)
+
+    while not event.is_set() and not pipeline.closed:
+        key = pipeline.wait_for_events(idle)
+        if key is not None:
+            job = SignInJob(calendars[key], pipeline.get_event(key), scheduler, event, account_locks[calendars[key]['username']], pool, on_done)
+            with lock:
+                scheduled[key] = job
+                METRICS.set('scheduled_sign_ins', len(scheduled))
+            job.schedule()
+
+    # Give back the browsers of sessions that were logged in ahead of sign-ins which won't run now
+    with lock:
+        jobs = list(scheduled.values())
+    for job in jobs:
+        job.close()